@@ -0,0 +1,109 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+DEFAULT_ISOCHRONE = {"lon": 85.318, "lat": 27.712, "distance": 1000}
+
+
+async def _open(host, port, unix_socket):
+    if unix_socket:
+        return await asyncio.open_unix_connection(unix_socket)
+    return await asyncio.open_connection(host, port)
+
+
+async def _request(reader, writer, method, path, payload):
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(payload)}\r\n\r\n").encode('latin-1') + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(requests=200, concurrency=8, path='/isochrone', body=None, method='POST',
+                   host='127.0.0.1', port=8080, unix_socket=None):
+    """
+    Send `requests` requests over `concurrency` keep-alive connections and time each one.
+
+    Returns:
+    - dict: Request and error counts, throughput and latency percentiles in milliseconds.
+    """
+    payload = json.dumps(DEFAULT_ISOCHRONE if body is None else body).encode('utf-8') if method == 'POST' else b''
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+
+    async def connection():
+        reader, writer = await _open(host, port, unix_socket)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                status = await _request(reader, writer, method, path, payload)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    wall_seconds = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'wall_seconds': wall_seconds,
+        'requests_per_second': len(latencies) / wall_seconds,
+        'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure request latency against a running pipeline server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', help="Connect to a Unix socket instead of host:port")
+    parser.add_argument('--path', default='/isochrone', help="Route to request (default /isochrone)")
+    parser.add_argument('--method', default='POST', choices=('GET', 'POST'))
+    parser.add_argument('--body', help="JSON body, or @file to read it from (default: a 1 km isochrone in Kathmandu)")
+    parser.add_argument('--requests', type=int, default=200, help="Total requests (default 200)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Connections sending requests at the same time (default 8)")
+    parser.add_argument('--output', help="Also write the results JSON here")
+    args = parser.parse_args(argv)
+
+    body = None
+    if args.body:
+        if args.body.startswith('@'):
+            with open(args.body[1:], 'r') as f:
+                body = json.load(f)
+        else:
+            body = json.loads(args.body)
+
+    result = asyncio.run(run_load(args.requests, args.concurrency, args.path, body, args.method,
+                                  args.host, args.port, args.unix_socket))
+    print(f"{result['requests']} requests to {result['path']} over {result['concurrency']} connections "
+          f"in {result['wall_seconds']:.2f}s ({result['requests_per_second']:.1f} req/s, {result['errors']} errors)")
+    print(f"  p50 {result['p50_ms']:.2f} ms, p90 {result['p90_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import sys
+import os
+import gc
+import json
+import time
+import fnmatch
+import argparse
+import platform
+import statistics
+
+# Add the project root to PYTHONPATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import shapely
+from shapely.geometry import Point
+from geoprocessing_pipeline.synthetic import CENTRE_LON, CENTRE_LAT, grid_road_graph, point_cloud
+from geoprocessing_pipeline.road_graph import NodeIndex
+from geoprocessing_pipeline.isochrone import find_nearest_node, snap_points, generate_isochrone, generate_isochrones, network_accessibility
+from geoprocessing_pipeline.filter import (filter_points_by_complex_query, filter_points_by_expression,
+                                           filter_points_within_isochrone, build_attribute_index, spatial_join_points)
+from geoprocessing_pipeline.geometry_ops import buffer_features, clip_features
+from geoprocessing_pipeline.pipeline import compile_pipeline
+
+CONFIG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'configs'))
+
+# Shipped configurations timed end to end, with the most points each is given
+# (every point is an isochrone origin in generate_isochrones)
+CONFIGS = {
+    'pipeline_config': None,
+    'road_access': None,
+    'filter_points_expression': None,
+    'generate_isochrones': 256,
+}
+
+DEFAULT_SCALES = '1k,10k,100k'
+ISOCHRONE_DISTANCE = 2000
+ORIGIN_COUNT = 32
+
+
+def parse_scale(text):
+    """
+    Parse a scale such as '1000', '10k' or '1M'.
+    """
+    text = text.strip().lower()
+    factor = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def format_scale(n):
+    if n >= 1000000 and n % 1000000 == 0:
+        return f"{n // 1000000}M"
+    if n >= 1000 and n % 1000 == 0:
+        return f"{n // 1000}k"
+    return str(n)
+
+
+class Workload:
+    """
+    The synthetic graph and points of one scale, with derived inputs built on first use.
+    """
+
+    def __init__(self, scale, seed):
+        self.scale = scale
+        self.graph = grid_road_graph(scale, seed=seed)
+        self.points = point_cloud(scale, self.graph, seed=seed)
+        self.origin = Point(CENTRE_LON, CENTRE_LAT)
+        self._isochrone = None
+
+    @property
+    def isochrone(self):
+        if self._isochrone is None:
+            self._isochrone = generate_isochrone(self.graph, self.origin, ISOCHRONE_DISTANCE)
+        return self._isochrone
+
+
+def offline_config(config):
+    """
+    A configuration with its load steps removed; their outputs become external inputs.
+
+    Returns:
+    - tuple: (configuration, names of graph inputs, names of data inputs).
+    """
+    functions, graphs, datasets = [], [], []
+    for func in config['functions']:
+        if func['functionName'] == 'loadOsmData':
+            graphs.append(func['output'])
+        elif func['functionName'] == 'loadData':
+            datasets.append(func['output'])
+        else:
+            functions.append(func)
+    return dict(config, functions=functions), graphs, datasets
+
+
+def _config_case(name, max_points):
+    def setup(workload):
+        with open(os.path.join(CONFIG_DIR, f"{name}.json"), 'r') as f:
+            config, graphs, datasets = offline_config(json.load(f))
+        plan = compile_pipeline(config, inputs=graphs + datasets)
+        points = workload.points if max_points is None else workload.points[:max_points]
+        inputs = {**{g: workload.graph for g in graphs}, **{d: points for d in datasets}}
+        return lambda: plan.run(inputs)
+    return setup
+
+
+# Each setup function prepares its inputs outside the timed region and returns the call to time
+
+def _setup_build_node_index(w):
+    return lambda: NodeIndex(w.graph.node_ids, w.graph.x, w.graph.y)
+
+def _setup_find_nearest_node(w):
+    w.graph.node_index  # Build the lazily created index before timing
+    sample = [Point(p['coordinates']) for p in w.points[:1000]]
+    return lambda: [find_nearest_node(w.graph, point) for point in sample]
+
+def _setup_snap_points(w):
+    w.graph.node_index
+    coords = np.asarray([p['coordinates'] for p in w.points])
+    return lambda: snap_points(w.graph, coords[:, 0], coords[:, 1])
+
+def _setup_generate_isochrone(w):
+    w.graph.node_index
+    return lambda: generate_isochrone(w.graph, w.origin, ISOCHRONE_DISTANCE)
+
+def _setup_generate_isochrone_edge_buffer(w):
+    w.graph.node_index
+    return lambda: generate_isochrone(w.graph, w.origin, ISOCHRONE_DISTANCE, method='edge_buffer')
+
+def _setup_generate_isochrones(w):
+    origins = w.points[:ORIGIN_COUNT]
+    return lambda: generate_isochrones(w.graph, origins, ISOCHRONE_DISTANCE)
+
+def _setup_filter_points_by_complex_query(w):
+    return lambda: filter_points_by_complex_query(w.points, 'height', '>', 50)
+
+def _setup_filter_points_by_expression(w):
+    index = build_attribute_index(w.points)
+    expression = {'attribute': 'height', 'operator': 'between', 'value': [20, 40]}
+    return lambda: filter_points_by_expression(w.points, expression, index=index)
+
+def _setup_filter_points_within_isochrone(w):
+    polygon = w.isochrone
+    return lambda: filter_points_within_isochrone(w.points, polygon)
+
+def _setup_spatial_join_points(w):
+    polygons = generate_isochrones(w.graph, w.points[:ORIGIN_COUNT], ISOCHRONE_DISTANCE)
+    return lambda: spatial_join_points(w.points, polygons)
+
+
+def _setup_network_accessibility(w):
+    w.graph.node_index
+    facilities = w.points[:ORIGIN_COUNT]
+    return lambda: network_accessibility(w.graph, w.points, facilities)
+
+def _setup_buffer_features(w):
+    return lambda: buffer_features(w.points, 50, quad_segs=4)
+
+def _setup_clip_features(w):
+    polygon = w.isochrone
+    return lambda: clip_features(w.points, polygon)
+
+
+def _cases():
+    cases = {
+        'build_node_index': _setup_build_node_index,
+        'find_nearest_node': _setup_find_nearest_node,
+        'snap_points': _setup_snap_points,
+        'generate_isochrone': _setup_generate_isochrone,
+        'generate_isochrone_edge_buffer': _setup_generate_isochrone_edge_buffer,
+        'generate_isochrones': _setup_generate_isochrones,
+        'filter_points_by_complex_query': _setup_filter_points_by_complex_query,
+        'filter_points_by_expression': _setup_filter_points_by_expression,
+        'filter_points_within_isochrone': _setup_filter_points_within_isochrone,
+        'spatial_join_points': _setup_spatial_join_points,
+        'network_accessibility': _setup_network_accessibility,
+        'buffer_features': _setup_buffer_features,
+        'clip_features': _setup_clip_features,
+    }
+    for name, max_points in CONFIGS.items():
+        cases[f"config:{name}"] = _config_case(name, max_points)
+    return cases
+
+
+def time_case(thunk, repeat):
+    """
+    Run a prepared case `repeat` times and return the wall times in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        thunk()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(scales, repeat=3, pattern='*', seed=0, log=print):
+    """
+    Time every case matching `pattern` at every scale.
+
+    Returns:
+    - dict: {'meta': {...}, 'results': {'<case>@<scale>': {...}}}
+    """
+    cases = {name: setup for name, setup in _cases().items() if fnmatch.fnmatch(name, pattern)}
+    results = {}
+    for scale in scales:
+        log(f"Building synthetic {format_scale(scale)} graph and points...")
+        workload = Workload(scale, seed)
+        for name, setup in cases.items():
+            thunk = setup(workload)
+            timings = time_case(thunk, repeat)
+            key = f"{name}@{format_scale(scale)}"
+            results[key] = {
+                'case': name,
+                'scale': scale,
+                'repeat': repeat,
+                'min_seconds': min(timings),
+                'median_seconds': statistics.median(timings),
+            }
+            log(f"  {key}: median {results[key]['median_seconds'] * 1000:.2f} ms, min {results[key]['min_seconds'] * 1000:.2f} ms")
+    meta = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'shapely': shapely.__version__,
+        'seed': seed,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare_results(current, baseline, threshold=0.2, metric='median_seconds'):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters:
+    - current, baseline (dict): Outputs of `run_benchmarks`.
+    - threshold (float): Allowed slowdown as a fraction, e.g. 0.2 for 20% slower.
+    - metric (str): The timing compared, 'median_seconds' or 'min_seconds'.
+
+    Returns:
+    - list: (key, baseline seconds, current seconds, ratio) for every case both contain, slowest
+      ratio first, and a list of the keys that regressed past the threshold.
+    """
+    rows = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None or base[metric] <= 0:
+            continue
+        rows.append((key, base[metric], result[metric], result[metric] / base[metric]))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    regressions = [row[0] for row in rows if row[3] > 1 + threshold]
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic road grids and point clouds.")
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help=f"Comma-separated node/point counts (default {DEFAULT_SCALES}, up to 1M)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (default 3)")
+    parser.add_argument('--cases', default='*', help="Glob selecting cases, e.g. 'filter_*' or 'config:*'")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the results JSON")
+    parser.add_argument('--baseline', help="Results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown before a case counts as a regression (default 0.2)")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline path")
+    args = parser.parse_args(argv)
+
+    scales = [parse_scale(s) for s in args.scales.split(',') if s.strip()]
+    current = run_benchmarks(scales, repeat=args.repeat, pattern=args.cases, seed=args.seed)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {path}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    rows, regressions = compare_results(current, baseline, args.threshold)
+    print(f"\nCompared with {args.baseline} (threshold +{args.threshold:.0%}):")
+    for key, base, now, ratio in rows:
+        flag = "  REGRESSION" if key in regressions else ""
+        print(f"  {key}: {base * 1000:.2f} ms -> {now * 1000:.2f} ms ({ratio:.2f}x){flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
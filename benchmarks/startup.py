@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add the project root to PYTHONPATH
+sys.path.append(PROJECT_ROOT)
+
+from geoprocessing_pipeline.lazy import HEAVY_MODULES, IMPORT_BUDGET_SECONDS
+
+# A trivial attribute filter: no graph, no GeoDataFrames
+FILTER_CONFIG = {"functions": [
+    {"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"},
+    {"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+        "filterType": "byExpression", "expression": {"attribute": "height", "operator": ">", "value": 20}}},
+     "output": "tallPoints"},
+]}
+
+# Runs in a fresh interpreter; prints the timings and the heavy modules loaded as JSON
+_PROBE = """
+import sys, json, time, io, contextlib
+start = time.perf_counter()
+from geoprocessing_pipeline.pipeline import run_geoprocessing_pipeline
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    run_geoprocessing_pipeline(json.loads(sys.argv[1]))
+done = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'first_run_seconds': done - imported,
+    'heavy_modules': [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+def measure_startup(config=None):
+    """
+    Time a cold import of the pipeline and its first run of `config` in a new interpreter.
+
+    Returns:
+    - dict: 'import_seconds', 'first_run_seconds', 'total_seconds' (including interpreter
+      start-up) and the 'heavy_modules' that ended up imported.
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', _PROBE, json.dumps(config or FILTER_CONFIG), json.dumps(HEAVY_MODULES)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['total_seconds'] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import and first-step latency of the pipeline.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters to start (default 5)")
+    parser.add_argument('--config', help="Configuration to run instead of a trivial attribute filter")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    runs = [measure_startup(config) for _ in range(args.repeat)]
+    for key in ('import_seconds', 'first_run_seconds', 'total_seconds'):
+        values = [run[key] for run in runs]
+        print(f"{key[:-8]}: median {statistics.median(values) * 1000:.1f} ms, min {min(values) * 1000:.1f} ms")
+    print(f"Heavy modules imported: {', '.join(runs[-1]['heavy_modules']) or 'none'}")
+
+    import_seconds = statistics.median(run['import_seconds'] for run in runs)
+    if import_seconds > IMPORT_BUDGET_SECONDS:
+        print(f"Import time is over the {IMPORT_BUDGET_SECONDS:.1f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
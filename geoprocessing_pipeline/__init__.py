@@ -1,8 +1,15 @@
-# Importing key functions from each module and making them available at package level
-from .data_loader import load_or_download_graph, load_data_by_type
-from .isochrone import generate_isochrone
-from .filter import filter_points_by_complex_query, filter_points_within_isochrone
-from .pipeline import run_geoprocessing_pipeline
+# Key functions of each module, available at package level. The modules are imported on
+# first access (PEP 562), so `import geoprocessing_pipeline` does not pull in osmnx or geopandas.
+import importlib
+
+_EXPORTS = {
+    "load_or_download_graph": "data_loader",
+    "load_data_by_type": "data_loader",
+    "generate_isochrone": "isochrone",
+    "filter_points_by_complex_query": "filter",
+    "filter_points_within_isochrone": "filter",
+    "run_geoprocessing_pipeline": "pipeline",
+}
 
 __all__ = [
     "load_or_download_graph",
@@ -12,3 +19,15 @@ __all__ = [
     "filter_points_within_isochrone",
     "run_geoprocessing_pipeline"
 ]
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import threading
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+from geoprocessing_pipeline.road_graph import RoadGraph
+from geoprocessing_pipeline.data_loader import ChunkedData
+from geoprocessing_pipeline.lazy import is_geodataframe
+
+# Bump when keys or entry layouts change, so entries written by older versions are never read
+RESULT_CACHE_VERSION = 2
+
+# Default size cap of a result cache directory
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _canonical(value):
+    # JSON fallback for step parameters that are not plain JSON values
+    if isinstance(value, BaseGeometry):
+        return {'wkb': shapely.to_wkb(value, hex=True)}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return repr(value)
+
+
+def _source_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def step_cache_key(step, input_keys):
+    """
+    Content key of a compiled step's output.
+
+    The key hashes the step's name, its resolved parameters, the size and mtime of the files it
+    reads and the keys of its inputs, so it changes whenever anything upstream changes.
+
+    Parameters:
+    - step (CompiledStep): The compiled step.
+    - input_keys (dict): The cache keys of the step's inputs, by name.
+
+    Returns:
+    - str: A hex SHA-256 digest.
+    """
+    document = {
+        'version': RESULT_CACHE_VERSION,
+        'step': step.function_name,
+        'runner': f"{step.run.func.__module__}.{step.run.func.__qualname__}",
+        'parameters': step.run.keywords,
+        'sources': [_source_stamp(path) for path in step.sources],
+        'inputs': {name: input_keys[name] for name in step.references},
+    }
+    encoded = json.dumps(document, sort_keys=True, default=_canonical).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def source_cache_key(description, sources):
+    """
+    Content key of a value loaded from files, from how it is loaded and the size and mtime of the
+    files, so it is known without loading the value.
+
+    Parameters:
+    - description: JSON-serializable description of the load, e.g. a loadOsmData step's parameters.
+    - sources (list): The files the value is loaded from.
+    """
+    document = {'version': RESULT_CACHE_VERSION, 'load': description, 'sources': [_source_stamp(path) for path in sources]}
+    encoded = json.dumps(document, sort_keys=True, default=_canonical).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def value_cache_key(value):
+    """
+    Content key of a value supplied from outside the pipeline, hashed from its pickle.
+    """
+    return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def _directory_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# Serializers: each writes a value into an entry directory and reads it back
+
+def _write_road_graph(value, directory):
+    value.save(directory)
+
+def _read_road_graph(directory):
+    return RoadGraph.load(directory, mmap=True)
+
+
+def _write_geometry(value, directory):
+    with open(os.path.join(directory, 'geometry.wkb'), 'wb') as f:
+        f.write(shapely.to_wkb(value))
+
+def _read_geometry(directory):
+    with open(os.path.join(directory, 'geometry.wkb'), 'rb') as f:
+        return shapely.from_wkb(f.read())
+
+
+def _write_geodataframe(value, directory):
+    try:
+        value.to_parquet(os.path.join(directory, 'frame.parquet'))
+        return
+    except ImportError:
+        pass
+    # Without pyarrow: geometries as WKB next to the pickled attribute columns
+    geometry_column = value.geometry.name
+    frame = value.drop(columns=geometry_column).copy()
+    frame[geometry_column] = shapely.to_wkb(value.geometry.values)
+    with open(os.path.join(directory, 'frame.pkl'), 'wb') as f:
+        pickle.dump({
+            'frame': frame,
+            'geometry_column': geometry_column,
+            'crs': value.crs.to_wkt() if value.crs is not None else None,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read_geodataframe(directory):
+    import geopandas as gpd
+
+    parquet_path = os.path.join(directory, 'frame.parquet')
+    if os.path.exists(parquet_path):
+        return gpd.read_parquet(parquet_path)
+    with open(os.path.join(directory, 'frame.pkl'), 'rb') as f:
+        stored = pickle.load(f)
+    frame = stored['frame']
+    geometry = shapely.from_wkb(frame.pop(stored['geometry_column']).to_numpy())
+    return gpd.GeoDataFrame(frame, geometry=gpd.GeoSeries(geometry, index=frame.index, crs=stored['crs']))
+
+
+def _write_pickle(value, directory):
+    with open(os.path.join(directory, 'value.pkl'), 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read_pickle(directory):
+    with open(os.path.join(directory, 'value.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+SERIALIZERS = {
+    'road_graph': (_write_road_graph, _read_road_graph),
+    'geometry': (_write_geometry, _read_geometry),
+    'geodataframe': (_write_geodataframe, _read_geodataframe),
+    'pickle': (_write_pickle, _read_pickle),
+}
+
+
+def _value_kind(value):
+    if isinstance(value, RoadGraph):
+        return 'road_graph'
+    if isinstance(value, BaseGeometry):
+        return 'geometry'
+    if is_geodataframe(value):
+        return 'geodataframe'
+    return 'pickle'
+
+
+class ResultCache:
+    """
+    Content-addressed store of pipeline step outputs on local disk.
+
+    Each entry is a directory named by its key (see `step_cache_key`). Entries are written
+    to a temporary directory and renamed into place, so concurrent runs never read a partial
+    entry. Reading an entry refreshes its mtime; once the directory grows past `max_bytes`
+    the least recently used entries are removed.
+
+    Parameters:
+    - directory (str): Where entries are stored. Created if missing.
+    - max_bytes (int): Size cap of the directory.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Worker processes get their own lock; hit/miss counts are kept by the parent
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Read an entry.
+
+        Returns:
+        - tuple: (True, value) on a hit, (False, None) on a miss.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'entry.json'), 'r') as f:
+                meta = json.load(f)
+            value = SERIALIZERS[meta['kind']][1](entry_dir)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+            return False, None
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return True, value
+
+    def put(self, key, value, step_name=None):
+        """
+        Store a value under a key, then evict entries if the cache is over its size cap.
+
+        Lazy streams (ChunkedData) are not stored: caching them would read them in full.
+
+        Returns:
+        - bool: Whether the value was stored.
+        """
+        if isinstance(value, ChunkedData):
+            return False
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        kind = _value_kind(value)
+        try:
+            SERIALIZERS[kind][0](value, tmp_dir)
+            with open(os.path.join(tmp_dir, 'entry.json'), 'w') as f:
+                json.dump({'kind': kind, 'step': step_name, 'created': time.time()}, f)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in `max_bytes`.
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if '.tmp-' in name or not os.path.isdir(path):
+                    continue
+                try:
+                    entries.append((os.path.getmtime(path), _directory_size(path), path))
+                except OSError:
+                    continue
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def record(self, step_name, hit):
+        """
+        Count a hit or miss for a step.
+        """
+        with self._lock:
+            counts = self.stats.setdefault(step_name, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def summary(self):
+        """
+        One line per step with its hit and miss counts.
+        """
+        return "\n".join(f"{name}: {counts['hits']} hits, {counts['misses']} misses"
+                         for name, counts in self.stats.items())
+
+    def clear(self):
+        """
+        Remove every entry and reset the counts.
+        """
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory, exist_ok=True)
+            self.stats = {}
@@ -0,0 +1,92 @@
+from functools import lru_cache
+import numpy as np
+import shapely
+
+# The CRS of every input and output: longitude/latitude on WGS 84
+GEOGRAPHIC_CRS = "EPSG:4326"
+
+
+def utm_crs(lon, lat):
+    """
+    The WGS 84 UTM zone containing a coordinate, as an EPSG code (e.g. 'EPSG:32645').
+    """
+    zone = int(np.clip(np.floor((lon + 180.0) / 6.0), 0, 59)) + 1
+    return f"EPSG:{32600 + zone if lat >= 0 else 32700 + zone}"
+
+
+def local_crs(xs, ys):
+    """
+    The UTM zone at the centre of a set of lon/lat coordinates, or None when there are none.
+    """
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    if not finite.any():
+        return None
+    xs, ys = xs[finite], ys[finite]
+    return utm_crs((xs.min() + xs.max()) / 2, (ys.min() + ys.max()) / 2)
+
+
+@lru_cache(maxsize=64)
+def transformer(source, target):
+    """
+    The pyproj transformer between two CRSs (x/y in lon/lat order), created once per pair.
+    """
+    from pyproj import Transformer
+
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def project(xs, ys, crs, source=GEOGRAPHIC_CRS):
+    """
+    Transform coordinate arrays in one call.
+
+    Parameters:
+    - xs, ys (array-like): The coordinates, in `source`.
+    - crs (str): The CRS to transform to.
+    - source (str): The CRS of the coordinates, lon/lat by default.
+
+    Returns:
+    - tuple: The (xs, ys) arrays in `crs`.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if crs == source or len(xs) == 0:
+        return xs, ys
+    return transformer(source, crs).transform(xs, ys)
+
+
+def unproject(xs, ys, crs):
+    """
+    Transform coordinate arrays from `crs` back to lon/lat.
+    """
+    return project(xs, ys, GEOGRAPHIC_CRS, source=crs)
+
+
+def transform_geometry(geometry, crs, source=GEOGRAPHIC_CRS):
+    """
+    Transform a geometry (or an array of geometries), all of their coordinates in one call.
+    """
+    if crs == source:
+        return geometry
+
+    def _transform(coords):
+        return np.column_stack(project(coords[:, 0], coords[:, 1], crs, source))
+
+    return shapely.transform(geometry, _transform)
+
+
+def degree_bounds(xs, ys, radius, crs):
+    """
+    Lon/lat boxes covering `radius` metres around each coordinate, measured in a projected CRS.
+
+    Returns:
+    - tuple: (minx, miny, maxx, maxy) arrays, one entry per coordinate.
+    """
+    px, py = project(np.atleast_1d(xs), np.atleast_1d(ys), crs)
+    if len(px) == 0:
+        return px, py, px, py
+    # The square's corners and the midpoints of its sides, whose lon/lat extent covers the square
+    offsets = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)], dtype=float) * radius
+    lons, lats = unproject((px[:, None] + offsets[:, 0]).ravel(), (py[:, None] + offsets[:, 1]).ravel(), crs)
+    lons, lats = np.reshape(lons, (len(px), -1)), np.reshape(lats, (len(px), -1))
+    return lons.min(axis=1), lats.min(axis=1), lons.max(axis=1), lats.max(axis=1)
@@ -1,5 +1,18 @@
 import os
-import osmnx as ox
+import json
+import time
+import shutil
+import threading
+import hashlib
+import numpy as np
+import shapely
+from geoprocessing_pipeline.road_graph import RoadGraph, as_road_graph
+from geoprocessing_pipeline.tiles import DEFAULT_TILE_SIZE, TiledGraphStore, read_tile_index, write_tile_store
+from geoprocessing_pipeline.lazy import is_instance
+from geoprocessing_pipeline.crs import GEOGRAPHIC_CRS
+
+# Bump when the layout of the binary graph cache changes, so old caches are rebuilt
+GRAPH_CACHE_VERSION = 2
 
 def load_or_download_graph(address, filepath):
     """
@@ -12,6 +25,8 @@ def load_or_download_graph(address, filepath):
     Returns:
     - networkx.Graph: The loaded or downloaded graph.
     """
+    import osmnx as ox
+
     # Check if the file exists
     if os.path.exists(filepath):
         # If the file exists, load the graph from the file
@@ -26,7 +41,223 @@ def load_or_download_graph(address, filepath):
     
     return G
 
-# Sample data with multiple types (points, roads, buildings)
+def graph_cache_dir(filepath):
+    """
+    Path of the binary sidecar cache kept next to a GraphML file.
+    """
+    return f"{filepath}.cache"
+
+
+def _file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_cache_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(cache_dir, 'meta.json'))
+
+
+def _source_meta(filepath, sha256=None):
+    stat = os.stat(filepath)
+    return {
+        'version': GRAPH_CACHE_VERSION,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha256': sha256 or _file_sha256(filepath),
+    }
+
+
+def _graph_cache_is_valid(filepath, cache_dir):
+    """
+    Check a sidecar cache against its GraphML source.
+
+    Size and mtime are compared first. If only the mtime moved (e.g. the file was copied or
+    touched), the content hash decides, and a matching cache is re-stamped with the new mtime.
+    """
+    meta = _read_cache_meta(cache_dir)
+    if meta is None or meta.get('version') != GRAPH_CACHE_VERSION:
+        return False
+
+    stat = os.stat(filepath)
+    if meta['source_size'] != stat.st_size:
+        return False
+    if meta['source_mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if meta['source_sha256'] != _file_sha256(filepath):
+        return False
+
+    meta['source_mtime_ns'] = stat.st_mtime_ns
+    _write_cache_meta(cache_dir, meta)
+    return True
+
+
+def write_graph_cache(G, filepath):
+    """
+    Write the binary sidecar cache for a GraphML file from its loaded graph.
+
+    Parameters:
+    - G (networkx.Graph or RoadGraph): The graph loaded from `filepath`.
+    - filepath (str): The GraphML file the graph was loaded from.
+
+    Returns:
+    - RoadGraph: The array graph that was written.
+    """
+    road_graph = G if isinstance(G, RoadGraph) else RoadGraph.from_networkx(G)
+    cache_dir = graph_cache_dir(filepath)
+    tmp_dir = f"{cache_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Write into a temporary directory and swap it in, so readers never see a partial cache
+    road_graph.save(tmp_dir)
+    _write_cache_meta(tmp_dir, _source_meta(filepath))
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    return road_graph
+
+
+def load_road_graph(address, filepath, mmap=True):
+    """
+    Load the array-backed road graph for a place, using the binary sidecar cache when possible.
+
+    The first load parses the GraphML file (downloading it if needed) and writes the cache
+    next to it; later loads read the cache directly, memory-mapping the large arrays.
+
+    Parameters:
+    - address (str): The address or place name to retrieve the graph for.
+    - filepath (str): The GraphML filepath to save or load the graph from.
+    - mmap (bool): Memory-map the cached arrays instead of copying them into memory.
+
+    Returns:
+    - RoadGraph: The loaded graph.
+    """
+    cache_dir = graph_cache_dir(filepath)
+    if os.path.exists(filepath) and _graph_cache_is_valid(filepath, cache_dir):
+        road_graph = RoadGraph.load(cache_dir, mmap=mmap)
+        print(f"Graph loaded from cache: {cache_dir}")
+        return road_graph
+
+    G = load_or_download_graph(address, filepath)
+    write_graph_cache(G, filepath)
+    print(f"Graph cache written: {cache_dir}")
+    return RoadGraph.load(cache_dir, mmap=mmap)
+
+
+def tile_store_dir(filepath):
+    """
+    Path of the tiled graph store kept next to a GraphML file.
+    """
+    return f"{filepath}.tiles"
+
+
+def load_tiled_graph(address, filepath, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Open the tiled store of a place's road graph, building it on first use.
+
+    The first call loads the whole graph (through the binary cache, see `load_road_graph`) and
+    splits it into tiles next to the GraphML file. Later calls only read the tile index; tiles
+    are read when a query needs them (see `TiledGraphStore.region_graph`).
+
+    Parameters:
+    - address (str): The address or place name to retrieve the graph for.
+    - filepath (str): The GraphML filepath to save or load the graph from.
+    - tile_size (float): Tile width and height in degrees. A store with another tile size is rebuilt.
+
+    Returns:
+    - TiledGraphStore: The tile store.
+    """
+    store_dir = tile_store_dir(filepath)
+    index = read_tile_index(store_dir)
+    if os.path.exists(filepath) and index is not None and index['tile_size'] == tile_size \
+            and _graph_cache_is_valid(filepath, store_dir):
+        print(f"Tiled graph opened: {store_dir}")
+        return TiledGraphStore(store_dir)
+
+    road_graph = load_road_graph(address, filepath)
+    store = write_tile_store(road_graph, store_dir, tile_size, meta=_source_meta(filepath))
+    print(f"Tiled graph written: {store_dir} ({len(store.index['tiles'])} tiles)")
+    return store
+
+
+def graph_with_crs(graph, crs):
+    """
+    A loaded graph set to do its metric work (snapping, buffers) in a given projected CRS.
+
+    RoadGraphs and tiled stores share their arrays with the original; networkx graphs are
+    converted to a RoadGraph. With `crs` None the graph is returned as it is, using the UTM
+    zone at its centre.
+    """
+    if crs is None:
+        return graph
+    if isinstance(graph, TiledGraphStore):
+        return graph.with_crs(crs)
+    return as_road_graph(graph).with_crs(crs)
+
+
+class GraphStore:
+    """
+    Graphs loaded once per GraphML file and shared by every pipeline run that reads them.
+
+    Runs in parallel threads that ask for the same file wait for the first load instead of
+    loading it again. A failed load is remembered and not retried.
+    """
+
+    def __init__(self):
+        self.graphs = {}
+        self.errors = {}
+        self.load_seconds = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, address, filepath, binary_cache=False, tile_size=None, crs=None):
+        """
+        Return the graph for a file, loading it on first use.
+
+        Parameters:
+        - address (str): The place to download when the file does not exist yet.
+        - filepath (str): The GraphML file.
+        - binary_cache (bool): Load the array-backed RoadGraph through its binary cache
+          (see `load_road_graph`) rather than the networkx graph.
+        - tile_size (float): Open the tiled store with this tile size (see `load_tiled_graph`) instead.
+        - crs (str): The projected CRS for metric work (see `graph_with_crs`); by default the local UTM zone.
+        """
+        key = (os.path.abspath(filepath), bool(binary_cache), tile_size, crs)
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self.errors:
+                raise self.errors[key]
+            if key not in self.graphs:
+                start = time.perf_counter()
+                try:
+                    if tile_size:
+                        graph = load_tiled_graph(address, filepath, tile_size)
+                    elif binary_cache:
+                        graph = load_road_graph(address, filepath)
+                    else:
+                        graph = load_or_download_graph(address, filepath)
+                    self.graphs[key] = graph_with_crs(graph, crs)
+                except OSError as e:
+                    self.errors[key] = e
+                    raise
+                self.load_seconds[key] = time.perf_counter() - start
+            return self.graphs[key]
+
+
+# Sample data with multiple types (points, roads, buildings, facilities, a study area)
 data = {
     'points': [
         {"id": 1, "coordinates": [85.318, 27.712], "height": 15},
@@ -41,6 +272,13 @@ data = {
     'buildings': [
         {"id": 201, "coordinates": [85.318, 27.712], "floors": 10},
         {"id": 202, "coordinates": [85.325, 27.717], "floors": 5}
+    ],
+    'facilities': [
+        {"id": "health_post_1", "coordinates": [85.320, 27.709], "type": "health post"},
+        {"id": "health_post_2", "coordinates": [85.333, 27.723], "type": "health post"}
+    ],
+    'studyArea': [
+        {"id": 301, "name": "Central Kathmandu", "geometry": shapely.box(85.310, 27.705, 85.322, 27.715)}
     ]
 }
 
@@ -60,3 +298,229 @@ def load_data_by_type(data_type):
     else:
         raise ValueError(f"Unknown data type: {data_type}")
 
+
+
+# File extensions understood by load_data_from_file, mapped to their reader
+FILE_FORMATS = {
+    '.geojson': 'ogr', '.json': 'ogr', '.gpkg': 'ogr', '.fgb': 'ogr', '.shp': 'ogr',
+    '.geojsonl': 'ndjson', '.geojsons': 'ndjson', '.ndjson': 'ndjson', '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.parquet': 'parquet', '.geoparquet': 'parquet',
+}
+
+
+class ChunkedData:
+    """
+    A re-iterable stream of record batches, read lazily from a file.
+
+    Every iteration re-opens the source, so a stream can be consumed by more than one step
+    without ever being held in memory as a whole.
+
+    Parameters:
+    - batches (callable): Returns a fresh iterator of batches each time it is called.
+    """
+
+    def __init__(self, batches):
+        self._batches = batches
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def map(self, func):
+        """
+        Lazily apply a function to every batch.
+        """
+        return ChunkedData(lambda: (func(batch) for batch in self._batches()))
+
+    def collect(self):
+        """
+        Read the whole stream into one list of records (or one GeoDataFrame, for frame batches).
+        """
+        batches = list(self)
+        if batches and is_instance(batches[0], 'pandas', 'DataFrame'):
+            import pandas as pd
+            import geopandas as gpd
+            return gpd.GeoDataFrame(pd.concat(batches, ignore_index=True))
+        return [record for batch in batches for record in batch]
+
+
+def map_records(data, func):
+    """
+    Apply a function to loaded data, batch by batch (lazily) when it is a ChunkedData stream.
+    """
+    if isinstance(data, ChunkedData):
+        return data.map(func)
+    return func(data)
+
+
+def collect_records(data):
+    """
+    Return loaded data as a whole, reading a ChunkedData stream to the end if needed.
+    """
+    return data.collect() if isinstance(data, ChunkedData) else data
+
+
+def records_to_frame(records, crs=GEOGRAPHIC_CRS):
+    """
+    GeoDataFrame of point records ('coordinates') or feature records ('geometry') and their attributes.
+    """
+    import pandas as pd
+    import geopandas as gpd
+
+    geometries = np.empty(len(records), dtype=object)
+    points = [i for i, record in enumerate(records) if 'coordinates' in record]
+    if points:
+        geometries[points] = shapely.points(np.asarray([records[i]['coordinates'][:2] for i in points], dtype=float))
+    for i, record in enumerate(records):
+        if 'coordinates' not in record:
+            geometries[i] = record.get('geometry')
+    properties = pd.DataFrame([{k: v for k, v in record.items() if k not in ('coordinates', 'geometry')} for record in records])
+    return gpd.GeoDataFrame(properties, geometry=gpd.GeoSeries(geometries, crs=crs))
+
+
+def _records_from_frame(frame, geometries):
+    """
+    Convert a batch of attributes plus geometries into point-style records: points get
+    'coordinates' [x, y], other geometries are kept under 'geometry'.
+    """
+    frame = frame.astype(object).where(frame.notna(), None)
+    records = frame.to_dict('records')
+    is_point = shapely.get_type_id(geometries) == 0
+    xs, ys = shapely.get_x(geometries), shapely.get_y(geometries)
+    for i, record in enumerate(records):
+        if is_point[i]:
+            record['coordinates'] = [float(xs[i]), float(ys[i])]
+        elif geometries[i] is not None:
+            record['geometry'] = geometries[i]
+    return records
+
+
+def _in_bbox(geometries, bbox):
+    if bbox is None:
+        return np.ones(len(geometries), dtype=bool)
+    return shapely.intersects(geometries, shapely.box(*bbox))
+
+
+def _read_ogr_batches(path, chunk_size, bbox):
+    import pandas as pd
+    import pyogrio
+
+    bbox = tuple(bbox) if bbox else None
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        # GDAL's Arrow stream needs pyarrow to be read: read the file once and slice it instead
+        frame = pyogrio.read_dataframe(path, bbox=bbox)
+        geometries = frame.geometry.to_numpy()
+        frame = pd.DataFrame(frame.drop(columns=frame.geometry.name))
+        step = chunk_size or max(len(frame), 1)
+        for start in range(0, len(frame), step):
+            yield _records_from_frame(frame.iloc[start:start + step].reset_index(drop=True), geometries[start:start + step])
+        return
+
+    # One reader over the file, so each batch continues where the last one stopped
+    with pyogrio.open_arrow(path, bbox=bbox, batch_size=chunk_size or 65536, use_pyarrow=True) as (meta, reader):
+        geometry_column = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            if batch.num_rows == 0:
+                continue
+            frame = batch.to_pandas()
+            geometries = shapely.from_wkb(frame.pop(geometry_column).to_numpy())
+            yield _records_from_frame(frame, geometries)
+
+
+def _read_ndjson_batches(path, chunk_size, bbox):
+    import pandas as pd
+
+    def flush(features):
+        properties = pd.DataFrame([f.get('properties') or {} for f in features])
+        geometries = shapely.from_geojson([json.dumps(f['geometry']) if f.get('geometry') else None for f in features])
+        keep = _in_bbox(geometries, bbox)
+        return _records_from_frame(properties[keep].reset_index(drop=True), geometries[keep])
+
+    features = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip().lstrip('\x1e')  # Also accept RFC 8142 GeoJSON text sequences
+            if not line:
+                continue
+            features.append(json.loads(line))
+            if chunk_size is not None and len(features) >= chunk_size:
+                batch = flush(features)
+                features = []
+                if batch:
+                    yield batch
+    if features:
+        batch = flush(features)
+        if batch:
+            yield batch
+
+
+def _read_csv_batches(path, chunk_size, bbox, lon_column, lat_column):
+    import pandas as pd
+
+    frames = pd.read_csv(path, chunksize=chunk_size) if chunk_size else [pd.read_csv(path)]
+    for frame in frames:
+        xs, ys = frame[lon_column].to_numpy(dtype=float), frame[lat_column].to_numpy(dtype=float)
+        if bbox is not None:
+            keep = (xs >= bbox[0]) & (ys >= bbox[1]) & (xs <= bbox[2]) & (ys <= bbox[3])
+            frame, xs, ys = frame[keep], xs[keep], ys[keep]
+        if len(frame) == 0:
+            continue
+        yield _records_from_frame(frame.drop(columns=[lon_column, lat_column]).reset_index(drop=True), shapely.points(xs, ys))
+
+
+def _read_parquet_batches(path, chunk_size, bbox, geometry_column='geometry'):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet files requires pyarrow (pip install pyarrow)") from e
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size or 65536):
+        frame = batch.to_pandas()
+        geometries = shapely.from_wkb(frame.pop(geometry_column).to_numpy())
+        keep = _in_bbox(geometries, bbox)
+        if not keep.any():
+            continue
+        yield _records_from_frame(frame[keep].reset_index(drop=True), geometries[keep])
+
+
+def load_data_from_file(path, file_format=None, chunk_size=None, bbox=None, lon_column='lon', lat_column='lat'):
+    """
+    Load point (or other feature) records from a file on disk.
+
+    Supported formats are GeoJSON, GeoPackage, FlatGeobuf and Shapefile (read with pyogrio),
+    newline-delimited GeoJSON, CSV with longitude/latitude columns and GeoParquet (needs pyarrow).
+    Records have the same shape as `load_data_by_type` returns: the feature's attributes plus
+    'coordinates' [lon, lat] for points, or 'geometry' for other geometry types.
+
+    Parameters:
+    - path (str): The file to read.
+    - file_format (str): 'ogr', 'ndjson', 'csv' or 'parquet'. Guessed from the extension by default.
+    - chunk_size (int): When set, return a ChunkedData stream of batches of at most this many records.
+    - bbox (list): Optional [minx, miny, maxx, maxy]; records outside it are skipped while reading.
+    - lon_column (str): CSV column holding longitudes.
+    - lat_column (str): CSV column holding latitudes.
+
+    Returns:
+    - list or ChunkedData: All records, or a lazily read stream of record batches.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Data file not found: {path}")
+    if file_format is None:
+        file_format = FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format not in ('ogr', 'ndjson', 'csv', 'parquet'):
+        raise ValueError(f"Unknown data file format: {path}")
+
+    def batches():
+        if file_format == 'ogr':
+            return _read_ogr_batches(path, chunk_size, bbox)
+        if file_format == 'ndjson':
+            return _read_ndjson_batches(path, chunk_size, bbox)
+        if file_format == 'csv':
+            return _read_csv_batches(path, chunk_size, bbox, lon_column, lat_column)
+        return _read_parquet_batches(path, chunk_size, bbox)
+
+    stream = ChunkedData(batches)
+    return stream if chunk_size else stream.collect()
@@ -1,5 +1,22 @@
-from shapely.geometry import Point
-import geopandas as gpd
+import numpy as np
+import shapely
+from geoprocessing_pipeline.tracing import trace_span
+from geoprocessing_pipeline.lazy import is_instance, is_geodataframe
+from geoprocessing_pipeline.crs import GEOGRAPHIC_CRS
+
+# Comparison operators of a filter expression leaf, and how each tests a (non-null) value
+_COMPARISONS = {
+    '<': lambda v, x: v < x,
+    '<=': lambda v, x: v <= x,
+    '>': lambda v, x: v > x,
+    '>=': lambda v, x: v >= x,
+    '==': lambda v, x: v == x,
+    '!=': lambda v, x: v != x,
+    'between': lambda v, x: x[0] <= v <= x[1],
+    'in': lambda v, x: v in x,
+    'not in': lambda v, x: v not in x,
+}
+_NULL_TESTS = ('is null', 'is not null')
 
 def filter_points_by_complex_query(points, attribute, operator, value):
     """
@@ -14,19 +31,31 @@ def filter_points_by_complex_query(points, attribute, operator, value):
     Returns:
     - list: A list of points that match the filtering criteria.
     """
-    if operator == ">":
-        filtered_points = [p for p in points if p.get(attribute, 0) > value]
-    elif operator == "<":
-        filtered_points = [p for p in points if p.get(attribute, 0) < value]
-    elif operator == "==":
-        filtered_points = [p for p in points if p.get(attribute, 0) == value]
-    elif operator == "!=":
-        filtered_points = [p for p in points if p.get(attribute, 0) != value]
-    else:
-        raise ValueError(f"Unsupported operator: {operator}")
+    with trace_span('filter.query', rows_in=len(points)) as span:
+        if operator == ">":
+            filtered_points = [p for p in points if p.get(attribute, 0) > value]
+        elif operator == "<":
+            filtered_points = [p for p in points if p.get(attribute, 0) < value]
+        elif operator == "==":
+            filtered_points = [p for p in points if p.get(attribute, 0) == value]
+        elif operator == "!=":
+            filtered_points = [p for p in points if p.get(attribute, 0) != value]
+        else:
+            raise ValueError(f"Unsupported operator: {operator}")
+        span.set(rows_out=len(filtered_points))
     
     return filtered_points
 
+def _point_coordinates(points):
+    """
+    Coordinate array (n x 2) of a list of point dictionaries or a GeoDataFrame of points.
+    """
+    if is_geodataframe(points):
+        return np.column_stack((points.geometry.x.to_numpy(), points.geometry.y.to_numpy()))
+    coords = np.asarray([p['coordinates'][:2] for p in points], dtype=float)
+    return coords.reshape(-1, 2)
+
+
 def filter_points_within_isochrone(points, isochrone_polygon):
     """
     Check which points are within the isochrone polygon.
@@ -38,11 +67,282 @@ def filter_points_within_isochrone(points, isochrone_polygon):
     Returns:
     - GeoDataFrame: A GeoDataFrame of points that are within the isochrone.
     """
-    # Convert points into GeoDataFrame for spatial operations
-    point_coords = [Point(p['coordinates']) for p in points]
-    point_gdf = gpd.GeoDataFrame(geometry=point_coords, crs="EPSG:4326")
-    
-    # Find points within the isochrone
-    points_within = point_gdf[point_gdf.within(isochrone_polygon)]
-    return points_within
+    import geopandas as gpd
+
+    with trace_span('filter.within', rows_in=len(points)) as span:
+        # Build the point geometries in one array operation and test them against the prepared polygon
+        coords = _point_coordinates(points)
+        shapely.prepare(isochrone_polygon)
+        within = shapely.contains_xy(isochrone_polygon, coords[:, 0], coords[:, 1])
+        span.set(rows_out=int(within.sum()))
+    return gpd.GeoDataFrame(geometry=shapely.points(coords[within]), crs=GEOGRAPHIC_CRS)
+
+
+def _polygon_table(polygons, id_column=None):
+    """
+    Normalise polygons into (ids, geometries).
+
+    Accepts a GeoDataFrame (ids from `id_column`, else 'origin_id' when present, else the index),
+    a dictionary of id -> polygon, a list of polygons (ids are positions) or a single polygon.
+    """
+    if is_geodataframe(polygons):
+        if id_column is None and 'origin_id' in polygons.columns:
+            id_column = 'origin_id'
+        ids = polygons[id_column].to_numpy() if id_column else polygons.index.to_numpy()
+        return ids, polygons.geometry.to_numpy()
+    if isinstance(polygons, dict):
+        return np.asarray(list(polygons.keys())), np.asarray(list(polygons.values()), dtype=object)
+    if isinstance(polygons, (list, tuple, np.ndarray)) or is_instance(polygons, 'geopandas', 'GeoSeries'):
+        geometries = np.asarray(list(polygons), dtype=object)
+        return np.arange(len(geometries)), geometries
+    return np.arange(1), np.asarray([polygons], dtype=object)
+
+
+def _join_batch(points, polygon_ids, tree, chunk_size, offset=0):
+    """
+    Match one batch of points against the polygon tree, numbering points from `offset`.
+    """
+    import geopandas as gpd
+
+    coords = _point_coordinates(points)
+    point_indexes, polygon_indexes = [], []
+    with trace_span('join.query', rows_in=len(coords)) as span:
+        for start in range(0, len(coords), chunk_size):
+            chunk = shapely.points(coords[start:start + chunk_size])
+            chunk_idx, tree_idx = tree.query(chunk, predicate='within')
+            point_indexes.append(chunk_idx + start)
+            polygon_indexes.append(tree_idx)
+        span.set(rows_out=sum(len(idx) for idx in point_indexes))
+
+    point_index = np.concatenate(point_indexes) if point_indexes else np.zeros(0, dtype=np.int64)
+    polygon_index = np.concatenate(polygon_indexes) if polygon_indexes else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((polygon_index, point_index))
+    point_index, polygon_index = point_index[order], polygon_index[order]
+
+    if is_geodataframe(points):
+        point_ids = points.index.to_numpy()[point_index]
+    else:
+        point_ids = [points[i].get('id') for i in point_index]
+    return gpd.GeoDataFrame(
+        {'point_index': point_index + offset, 'point_id': point_ids, 'polygon_id': polygon_ids[polygon_index]},
+        geometry=shapely.points(coords[point_index]),
+        crs=GEOGRAPHIC_CRS,
+    )
+
+
+def spatial_join_points(points, polygons, id_column=None, chunk_size=100000):
+    """
+    Match many points against many polygons (e.g. isochrones) in one pass.
+
+    The polygons are prepared and put in an STRtree once; points are processed in chunks so
+    memory stays bounded, and each chunk is a single vectorized tree query.
+
+    Parameters:
+    - points (list or GeoDataFrame): Point dictionaries with 'coordinates', or a GeoDataFrame of points.
+      A ChunkedData stream of either is joined batch by batch, without reading it whole.
+    - polygons: The polygons (see `_polygon_table` for accepted shapes).
+    - id_column (str): Column of a polygon GeoDataFrame holding the polygon ids.
+    - chunk_size (int): Number of points queried at a time.
+
+    Returns:
+    - GeoDataFrame: One row per (point, polygon) match with 'point_index', 'point_id'
+      (the point's 'id', when it has one), 'polygon_id' and the point geometry. For a stream,
+      a ChunkedData stream of such tables, with 'point_index' counting across batches.
+    """
+    from geoprocessing_pipeline.data_loader import ChunkedData
+
+    polygon_ids, geometries = _polygon_table(polygons, id_column)
+    valid = ~shapely.is_missing(geometries)
+    polygon_ids, geometries = polygon_ids[valid], geometries[valid]
+    with trace_span('join.build_tree', rows_in=len(geometries)):
+        shapely.prepare(geometries)
+        tree = shapely.STRtree(geometries)
+
+    if not isinstance(points, ChunkedData):
+        return _join_batch(points, polygon_ids, tree, chunk_size)
+
+    def batches():
+        offset = 0
+        for batch in points:
+            yield _join_batch(batch, polygon_ids, tree, chunk_size, offset)
+            offset += len(batch)
+
+    return ChunkedData(batches)
+
+
+class AttributeIndex:
+    """
+    Sorted per-attribute index over a list of points, so range and equality tests become
+    binary searches. Columns are built lazily, once per attribute, the first time they are queried.
+
+    Parameters:
+    - points (list): A list of points (each point as a dictionary with various attributes).
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self._columns = {}
+
+    def column(self, attribute):
+        """
+        Return (sorted_values, order, null_positions) for an attribute, or None when its values
+        cannot be sorted together (e.g. a mix of numbers and strings).
+        """
+        if attribute not in self._columns:
+            values = [p.get(attribute) for p in self.points]
+            is_null = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+            positions = np.flatnonzero(~is_null)
+            column = None
+            try:
+                present = np.asarray([values[i] for i in positions])
+                # NaN does not sort like other values, so such columns are left to scans
+                sortable = present.dtype != object and present.ndim == 1
+                if sortable and present.dtype.kind == 'f' and np.isnan(present).any():
+                    sortable = False
+                if sortable:
+                    order = np.argsort(present, kind='stable')
+                    column = (present[order], positions[order], np.flatnonzero(is_null))
+            except (TypeError, ValueError):
+                pass
+            self._columns[attribute] = column
+        return self._columns[attribute]
+
+    def positions(self, attribute, operator, value):
+        """
+        Positions of the points matching one comparison, or None if the index cannot answer it.
+        """
+        column = self.column(attribute)
+        if column is None:
+            return None
+        sorted_values, order, nulls = column
+        if operator == 'is null':
+            return nulls
+        if operator == 'is not null':
+            return order
+
+        wanted = list(value) if operator in ('between', 'in', 'not in') else [value]
+        if not _comparable(sorted_values, wanted):
+            return None
+
+        try:
+            if operator == '<':
+                return order[:np.searchsorted(sorted_values, value, side='left')]
+            if operator == '<=':
+                return order[:np.searchsorted(sorted_values, value, side='right')]
+            if operator == '>':
+                return order[np.searchsorted(sorted_values, value, side='right'):]
+            if operator == '>=':
+                return order[np.searchsorted(sorted_values, value, side='left'):]
+            if operator == 'between':
+                low = np.searchsorted(sorted_values, value[0], side='left')
+                high = np.searchsorted(sorted_values, value[1], side='right')
+                return order[low:high]
+            if operator in ('==', '!=', 'in', 'not in'):
+                lows = np.searchsorted(sorted_values, wanted, side='left')
+                highs = np.searchsorted(sorted_values, wanted, side='right')
+                # Ranges of repeated values overlap, so they are marked rather than concatenated
+                matched = np.zeros(len(order), dtype=bool)
+                for low, high in zip(lows, highs):
+                    matched[low:high] = True
+                return order[matched] if operator in ('==', 'in') else order[~matched]
+        except TypeError:
+            # The value cannot be compared with the indexed column type
+            return None
+        return None
+
+
+def _comparable(sorted_values, values):
+    """
+    Whether query values compare with an indexed column the same way they would in Python
+    (numpy would otherwise coerce, e.g. compare numbers with strings as text).
+    """
+    if sorted_values.dtype.kind in 'biuf':
+        return all(isinstance(v, (int, float, np.number)) for v in values)
+    if sorted_values.dtype.kind == 'U':
+        return all(isinstance(v, str) for v in values)
+    return False
+
+
+def build_attribute_index(points):
+    """
+    Build an AttributeIndex over a list of points, to be reused across filter queries.
+    """
+    with trace_span('filter.build_index', rows_in=len(points)):
+        return AttributeIndex(points)
+
+
+def _leaf_mask_by_scan(points, attribute, operator, value):
+    test = _COMPARISONS.get(operator)
+    mask = np.zeros(len(points), dtype=bool)
+    for i, p in enumerate(points):
+        v = p.get(attribute)
+        if operator == 'is null':
+            mask[i] = v is None
+        elif operator == 'is not null':
+            mask[i] = v is not None
+        elif v is not None:
+            try:
+                mask[i] = test(v, value)
+            except TypeError:
+                pass
+    return mask
+
+
+def _expression_mask(points, expression, index, stats):
+    if 'and' in expression:
+        masks = [_expression_mask(points, e, index, stats) for e in expression['and']]
+        return np.logical_and.reduce(masks) if masks else np.ones(len(points), dtype=bool)
+    if 'or' in expression:
+        masks = [_expression_mask(points, e, index, stats) for e in expression['or']]
+        return np.logical_or.reduce(masks) if masks else np.zeros(len(points), dtype=bool)
+    if 'not' in expression:
+        return ~_expression_mask(points, expression['not'], index, stats)
+
+    attribute = expression['attribute']
+    operator = expression['operator'].lower()
+    value = expression.get('value')
+    if operator not in _COMPARISONS and operator not in _NULL_TESTS:
+        raise ValueError(f"Unsupported operator: {expression['operator']}")
+    if operator == 'between' and len(value) != 2:
+        raise ValueError("The 'between' operator takes a [low, high] value")
+
+    positions = index.positions(attribute, operator, value) if index is not None else None
+    if positions is None:
+        stats['scanned_leaves'] += 1
+        return _leaf_mask_by_scan(points, attribute, operator, value)
+
+    stats['indexed_leaves'] += 1
+    mask = np.zeros(len(points), dtype=bool)
+    mask[positions] = True
+    return mask
+
+
+def filter_points_by_expression(points, expression, index=None, stats=None):
+    """
+    Filters points with a compound query expression.
+
+    An expression is either a comparison, e.g. {"attribute": "height", "operator": "between", "value": [20, 40]},
+    or a combination {"and": [...]}, {"or": [...]}, {"not": {...}}. Supported operators are
+    <, <=, >, >=, ==, !=, between (inclusive), in, not in, is null and is not null.
+    Missing or None attributes are null, and only match 'is null'.
+
+    Parameters:
+    - points (list): A list of points (each point as a dictionary with various attributes).
+    - expression (dict): The query expression.
+    - index (AttributeIndex): Optional index over `points`; comparisons it can answer use binary searches.
+    - stats (dict): Optional dictionary that receives 'index_used', 'indexed_leaves' and 'scanned_leaves'.
+
+    Returns:
+    - list: The matching points, in their original order.
+    """
+    if index is not None and index.points is not points:
+        raise ValueError("The attribute index was built for a different list of points")
 
+    counts = {'indexed_leaves': 0, 'scanned_leaves': 0}
+    with trace_span('filter.expression', rows_in=len(points)) as span:
+        mask = _expression_mask(points, expression, index, counts)
+        span.set(rows_out=int(mask.sum()), **counts)
+    if stats is not None:
+        stats.update(counts)
+        stats['index_used'] = counts['indexed_leaves'] > 0
+    return [points[i] for i in np.flatnonzero(mask)]
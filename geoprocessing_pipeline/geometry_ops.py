@@ -0,0 +1,134 @@
+from functools import partial
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+from geoprocessing_pipeline.crs import GEOGRAPHIC_CRS, local_crs, transform_geometry
+from geoprocessing_pipeline.data_loader import ChunkedData, collect_records, map_records, records_to_frame
+from geoprocessing_pipeline.lazy import is_geodataframe, is_instance
+from geoprocessing_pipeline.tracing import trace_span
+
+# Segments per quarter circle of a buffer (shapely's default); fewer keep outputs small
+DEFAULT_QUAD_SEGS = 8
+
+
+def feature_frame(value):
+    """
+    GeoDataFrame of a collection of features: a GeoDataFrame, a GeoSeries, a single geometry,
+    or a list of point records ('coordinates') or feature records ('geometry').
+    """
+    import geopandas as gpd
+
+    if is_geodataframe(value):
+        return value
+    if is_instance(value, 'geopandas', 'GeoSeries'):
+        return gpd.GeoDataFrame(geometry=value)
+    if isinstance(value, BaseGeometry):
+        return gpd.GeoDataFrame(geometry=gpd.GeoSeries([value], crs=GEOGRAPHIC_CRS))
+    if isinstance(value, list):
+        return records_to_frame(value)
+    raise ValueError(f"Expected features, got {type(value).__name__}")
+
+
+def _with_geometries(frame, geometries, rows=None):
+    """
+    A copy of `frame` (or of its `rows`) with new geometries, keeping the attributes.
+    """
+    import geopandas as gpd
+
+    frame = (frame if rows is None else frame.iloc[rows]).copy()
+    frame[frame.geometry.name] = gpd.GeoSeries(geometries, index=frame.index, crs=frame.crs)
+    return frame
+
+
+def _buffer_batch(value, distance, quad_segs, crs):
+    frame = feature_frame(value)
+    geometries = frame.geometry.to_numpy()
+    with trace_span('buffer', rows_in=len(geometries)) as span:
+        metric_crs = crs or local_crs(*shapely.get_coordinates(geometries).T)
+        if metric_crs is None:
+            return _with_geometries(frame, geometries)
+        projected = transform_geometry(geometries, metric_crs)
+        buffered = shapely.buffer(projected, distance, quad_segs=quad_segs)
+        span.set(rows_out=len(buffered), vertices=int(shapely.get_num_coordinates(buffered).sum()))
+    return _with_geometries(frame, transform_geometry(buffered, GEOGRAPHIC_CRS, source=metric_crs))
+
+
+def buffer_features(data, distance, dissolve=False, quad_segs=DEFAULT_QUAD_SEGS, crs=None):
+    """
+    Buffer every feature of a collection by a distance in metres, in one array operation.
+
+    The geometries are projected in bulk to a metric CRS (by default the UTM zone at the centre
+    of the features), buffered together and projected back.
+
+    Parameters:
+    - data: The features (see `feature_frame`), or a ChunkedData stream of them, buffered batch by batch.
+    - distance (float): The buffer distance in metres.
+    - dissolve (bool): Merge the buffers into one (multi)polygon, dropping the attributes.
+    - quad_segs (int): Segments per quarter circle; fewer segments give smaller outputs.
+    - crs (str): The projected CRS to buffer in.
+
+    Returns:
+    - GeoDataFrame: The buffered features with their attributes, or a single dissolved row.
+    """
+    import geopandas as gpd
+
+    if quad_segs < 1:
+        raise ValueError(f"quad_segs must be at least 1: {quad_segs}")
+    if not dissolve:
+        return map_records(data, partial(_buffer_batch, distance=distance, quad_segs=quad_segs, crs=crs))
+
+    # Dissolved batches are merged once more, so buffers spanning batches join up
+    batches = data if isinstance(data, ChunkedData) else [data]
+    pieces = [_buffer_batch(batch, distance, quad_segs, crs).geometry.to_numpy() for batch in batches]
+    with trace_span('buffer.dissolve', rows_in=sum(len(piece) for piece in pieces)):
+        merged = shapely.union_all(np.concatenate(pieces)) if pieces else shapely.Polygon()
+    return gpd.GeoDataFrame(geometry=gpd.GeoSeries([merged], crs=GEOGRAPHIC_CRS))
+
+
+def _mask_geometry(mask):
+    """
+    One prepared (multi)polygon from a mask given as a geometry or a collection of features.
+    """
+    if not isinstance(mask, BaseGeometry):
+        mask = shapely.union_all(feature_frame(collect_records(mask)).geometry.to_numpy())
+    shapely.prepare(mask)
+    return mask
+
+
+def _clip_batch(value, mask, stats):
+    frame = feature_frame(value)
+    geometries = frame.geometry.to_numpy()
+    with trace_span('clip', rows_in=len(geometries)) as span:
+        # The index drops features away from the mask without testing their geometry
+        candidates = np.sort(shapely.STRtree(geometries).query(mask, predicate='intersects'))
+        inside = shapely.contains_properly(mask, geometries[candidates])
+        clipped = geometries[candidates].copy()
+        cut = candidates[~inside]
+        clipped[~inside] = shapely.intersection(geometries[cut], mask)
+        keep = ~shapely.is_empty(clipped)
+        span.set(rows_out=int(keep.sum()), cut=len(cut))
+    stats['features'] = stats.get('features', 0) + len(geometries)
+    stats['kept'] = stats.get('kept', 0) + int(keep.sum())
+    stats['cut'] = stats.get('cut', 0) + len(cut)
+    return _with_geometries(frame, clipped[keep], rows=candidates[keep])
+
+
+def clip_features(data, mask, stats=None):
+    """
+    Clip a collection of features to a mask.
+
+    A spatial index over the features finds the ones meeting the mask, so the others are dropped
+    without geometry work. Features entirely inside the mask are kept as they are; only those
+    crossing its boundary are intersected, in one array operation.
+
+    Parameters:
+    - data: The features (see `feature_frame`), or a ChunkedData stream of them, clipped batch by batch.
+    - mask: A geometry or collection of features; their union is the mask.
+    - stats (dict): Optional dictionary that receives 'features', 'kept' and 'cut' counts.
+
+    Returns:
+    - GeoDataFrame: The clipped features with their attributes, in their original order.
+    """
+    mask = _mask_geometry(mask)
+    stats = {} if stats is None else stats
+    return map_records(data, partial(_clip_batch, mask=mask, stats=stats))
@@ -1,41 +1,498 @@
-import networkx as nx
-import geopandas as gpd
-from shapely.geometry import Point
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shapely
 from math import sqrt
+from geoprocessing_pipeline.road_graph import as_road_graph
+from geoprocessing_pipeline.tiles import TiledGraphStore
+from geoprocessing_pipeline.tracing import trace_span
+from geoprocessing_pipeline.crs import GEOGRAPHIC_CRS, project, transform_geometry, utm_crs
+from geoprocessing_pipeline.lazy import is_geodataframe
 
-def euclidean_distance(coord1, coord2):
+def euclidean_distance(coord1, coord2, crs=None):
     """
-    Calculate the Euclidean distance between two coordinates (lon, lat).
+    Calculate the straight-line distance in metres between two coordinates (lon, lat).
+
+    The coordinates are projected to `crs`, by default the UTM zone of the first coordinate.
+    """
+    crs = crs or utm_crs(coord1[0], coord1[1])
+    xs, ys = project([coord1[0], coord2[0]], [coord1[1], coord2[1]], crs)
+    return sqrt((xs[0] - xs[1]) ** 2 + (ys[0] - ys[1]) ** 2)
+
+
+def get_node_index(osm_network):
+    """
+    Return the spatial node index for a graph, building it on first use.
+    """
+    return as_road_graph(osm_network).node_index
+
+
+def snap_points(osm_network, xs, ys):
     """
-    return sqrt((coord1[0] - coord2[0]) ** 2 + (coord1[1] - coord2[1]) ** 2)
+    Snap a batch of coordinates to their nearest graph nodes.
+
+    Parameters:
+    - osm_network (networkx.Graph or RoadGraph): The road network graph.
+    - xs (array-like): The x (longitude) coordinates to snap.
+    - ys (array-like): The y (latitude) coordinates to snap.
+
+    Returns:
+    - tuple: (node_ids, distances) arrays, one entry per input coordinate. Distances are in
+      metres, measured in the graph's projected CRS.
+    """
+    index = get_node_index(osm_network)
+    positions, distances = index.query(xs, ys)
+    if len(index) == 0:
+        return np.full(len(positions), None, dtype=object), distances
+    return index.node_ids[positions], distances
+
 
 def find_nearest_node(osm_network, point):
     """
     Find the nearest node in the graph to a given point.
     """
-    point_coords = (point.x, point.y)
-    min_distance = float('inf')
-    nearest_node = None
+    if osm_network.number_of_nodes() == 0:
+        return None
+
+    node_ids, _ = snap_points(osm_network, [point.x], [point.y])
+    return node_ids[0].item() if isinstance(node_ids[0], np.generic) else node_ids[0]
+
+
+# Seconds per unit for time budgets
+TIME_UNITS = {'seconds': 1, 'minutes': 60, 'hours': 3600}
+
+# Ways of turning the reached part of the network into a polygon
+POLYGON_METHODS = ('convex_hull', 'edge_buffer')
+
+
+def _convex_hull_polygon(road_graph, indices):
+    """
+    Convex hull of the coordinates of the reached nodes.
+    """
+    coords = np.column_stack((road_graph.x[indices], road_graph.y[indices]))
+    return shapely.multipoints(coords).convex_hull
+
+
+def _simplify_to_budget(polygon, max_vertices, tolerance):
+    """
+    Simplify a polygon until it has at most `max_vertices` coordinates, searching for the
+    smallest tolerance (in the polygon's units) that meets the budget.
+    """
+    if max_vertices is None or shapely.get_num_coordinates(polygon) <= max_vertices:
+        return polygon
+
+    low, high = 0.0, tolerance
+    best = shapely.simplify(polygon, high)
+    # Many disjoint parts can make the budget unreachable, so the upward search is bounded
+    for _ in range(20):
+        if shapely.get_num_coordinates(best) <= max_vertices:
+            break
+        low, high = high, high * 2
+        best = shapely.simplify(polygon, high)
+    else:
+        return best
+    for _ in range(12):
+        middle = (low + high) / 2
+        candidate = shapely.simplify(polygon, middle)
+        if shapely.get_num_coordinates(candidate) <= max_vertices:
+            high, best = middle, candidate
+        else:
+            low = middle
+    return best
+
+
+def polygon_options(parameters):
+    """
+    Read the isochrone polygon options of a pipeline step's parameters.
+
+    Config keys are 'polygonMethod' ('convexHull' or 'edgeBuffer'), 'buffer' (metres)
+    and 'maxVertices'.
+    """
+    methods = {'convexHull': 'convex_hull', 'edgeBuffer': 'edge_buffer'}
+    method = parameters.get('polygonMethod', 'convexHull')
+    if method not in methods:
+        raise ValueError(f"Unsupported polygon method: {method}")
+    return {
+        'method': methods[method],
+        'buffer': parameters.get('buffer', 25.0),
+        'max_vertices': parameters.get('maxVertices', 500),
+    }
 
-    for node in osm_network.nodes:
-        node_coords = (osm_network.nodes[node]['x'], osm_network.nodes[node]['y'])
-        distance = euclidean_distance(point_coords, node_coords)
 
-        if distance < min_distance:
-            min_distance = distance
-            nearest_node = node
+def edge_buffer_polygon(road_graph, node_distances, cutoff, buffer=25.0, max_vertices=500, weight='length', stats=None):
+    """
+    Polygonize the reached part of a network by buffering its edges.
 
-    return nearest_node
+    Edges between two reached nodes are kept whole; edges leaving the reached set are cut at
+    the point where the remaining budget runs out. The segments are noded and polygonized in
+    one pass: faces closed off entirely by reached edges (city blocks) are merged as a coverage,
+    and only the remaining loose segments are buffered individually, which keeps the union
+    small. The result is simplified to a vertex budget. Work is done in the graph's projected
+    CRS (see `RoadGraph.crs`), so `buffer` is in metres.
 
+    Parameters:
+    - road_graph (RoadGraph): The road network.
+    - node_distances (numpy.ndarray): Network distance per node position (inf when unreached).
+    - cutoff (float): The budget the distances were searched up to.
+    - buffer (float): Buffer radius in metres around each reached edge.
+    - max_vertices (int): Maximum number of polygon coordinates, or None for no limit.
+    - weight (str): The edge weight the distances are measured in.
+    - stats (dict): Optional dictionary that receives 'seconds', 'vertices' and 'edges'.
 
-def generate_isochrone(osm_network, point, distance):
+    Returns:
+    - Polygon or MultiPolygon: The isochrone polygon, or None when nothing was reached.
+    """
+    start = time.perf_counter()
+    reached = np.isfinite(node_distances) & (node_distances <= cutoff)
+    if not reached.any():
+        return None
+
+    sources = road_graph.edge_sources
+    targets = road_graph.targets
+    weights = road_graph.edge_weights(weight)
+    from_reached = reached[sources]
+    whole = from_reached & reached[targets]
+    partial_edges = from_reached & ~reached[targets]
+
+    # Fraction of each partial edge that fits in the remaining budget
+    fraction = np.zeros(len(targets))
+    fraction[whole] = 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        remaining = (cutoff - node_distances[sources[partial_edges]]) / weights[partial_edges]
+    fraction[partial_edges] = np.clip(np.nan_to_num(remaining, nan=1.0), 0.0, 1.0)
+
+    # Node coordinates in the graph's projected CRS (metres), projected once per graph
+    x, y = road_graph.projected_xy
+
+    used = np.flatnonzero((whole | partial_edges) & (fraction > 0))
+    start_xy = np.column_stack((x[sources[used]], y[sources[used]]))
+    end_xy = np.column_stack((x[targets[used]], y[targets[used]]))
+    end_xy = start_xy + (end_xy - start_xy) * fraction[used][:, None]
+    keep = (start_xy != end_xy).any(axis=1)
+    lines = shapely.linestrings(np.stack((start_xy[keep], end_xy[keep]), axis=1))
+
+    # Reached nodes only matter on their own when no edge leaves them (e.g. an isolated origin)
+    pieces = [shapely.buffer(shapely.points(x[reached], y[reached]), buffer, quad_segs=4)] if not len(lines) else []
+    if len(lines):
+        noded = shapely.get_parts(shapely.node(shapely.multilinestrings(lines)))
+        faces, cuts, dangles, invalid = shapely.polygonize_full(noded)
+        faces = shapely.get_parts(faces)
+        if len(faces):
+            pieces.append([shapely.buffer(shapely.coverage_union_all(faces), buffer, quad_segs=4)])
+        loose = np.concatenate([shapely.get_parts(g) for g in (cuts, dangles, invalid)])
+        pieces.append(shapely.buffer(loose, buffer, quad_segs=4))
+
+    polygon = shapely.union_all(np.concatenate(pieces))
+    polygon = _simplify_to_budget(polygon, max_vertices, tolerance=buffer / 4)
+    polygon = transform_geometry(polygon, GEOGRAPHIC_CRS, source=road_graph.crs)
+
+    if stats is not None:
+        stats['seconds'] = time.perf_counter() - start
+        stats['vertices'] = int(shapely.get_num_coordinates(polygon))
+        stats['edges'] = int(keep.sum())
+    return polygon
+
+
+def _isochrone_polygon(road_graph, source, cutoff, weight='length', method='convex_hull', buffer=25.0, max_vertices=500, stats=None):
+    """
+    Search the network from a source node position and polygonize the reached area.
+    """
+    if method not in POLYGON_METHODS:
+        raise ValueError(f"Unsupported polygon method: {method}")
+    if source < 0:
+        return None
+    with trace_span('isochrone.search', weight=weight) as span:
+        indices, distances = road_graph.bounded_dijkstra(source, cutoff, weight=weight)
+        span.set(rows_out=len(indices))
+
+    with trace_span('isochrone.polygon', method=method) as span:
+        span.set(rows_in=len(indices))
+        if method == 'convex_hull':
+            return _convex_hull_polygon(road_graph, indices)
+
+        node_distances = np.full(road_graph.number_of_nodes(), np.inf)
+        node_distances[indices] = distances
+        return edge_buffer_polygon(road_graph, node_distances, cutoff, buffer, max_vertices, weight, stats)
+
+
+def _search_graph(osm_network, xs, ys, cutoff, weight='length'):
+    """
+    The RoadGraph to search from the given origins: the network itself, or for a tiled store
+    only the tiles that a search bounded by `cutoff` can reach (see `TiledGraphStore`).
+    """
+    if isinstance(osm_network, TiledGraphStore):
+        return osm_network.region_graph(xs, ys, osm_network.reach_metres(cutoff, weight))
+    return as_road_graph(osm_network)
+
+
+def _snap_one(road_graph, point):
+    with trace_span('isochrone.snap', rows_in=1):
+        positions, _ = road_graph.node_index.query([point.x], [point.y])
+    return positions[0]
+
+
+def generate_isochrone(osm_network, point, distance, method='convex_hull', buffer=25.0, max_vertices=500, stats=None):
     """
     Generate an isochrone polygon from a given road network graph.
+
+    Parameters:
+    - osm_network (networkx.Graph, RoadGraph or TiledGraphStore): The road network graph.
+    - point (Point): The origin.
+    - distance (float): The network distance (in 'length' units) of the isochrone.
+    - method (str): 'convex_hull' of the reached nodes, or 'edge_buffer' (see `edge_buffer_polygon`).
+    - buffer (float): Edge buffer radius in metres ('edge_buffer' only).
+    - max_vertices (int): Vertex budget of the polygon ('edge_buffer' only).
+    - stats (dict): Optional dictionary that receives polygonization time and vertex count ('edge_buffer' only).
+
+    Returns:
+    - Polygon: The isochrone polygon, or None for an empty graph.
+    """
+    road_graph = _search_graph(osm_network, point.x, point.y, distance)
+    if road_graph.number_of_nodes() == 0:
+        return None
+    return _isochrone_polygon(road_graph, _snap_one(road_graph, point), distance, 'length', method, buffer, max_vertices, stats)
+
+
+def generate_time_isochrone(osm_network, point, time, unit='minutes', method='convex_hull', buffer=25.0, max_vertices=500, stats=None):
     """
-    nearest_node = find_nearest_node(osm_network, point)
-    subgraph = nx.ego_graph(osm_network, nearest_node, radius=distance, distance='length')
-    nodes = list(subgraph.nodes())
-    node_points = [Point((osm_network.nodes[node]['x'], osm_network.nodes[node]['y'])) for node in nodes]
-    isochrone_polygon = gpd.GeoSeries(node_points, crs="EPSG:4326").unary_union.convex_hull
-    
-    return isochrone_polygon
+    Generate an isochrone polygon for a travel-time budget.
+
+    Edge travel times are derived once per graph from edge lengths and speeds (see
+    `RoadGraph.travel_times`), so repeated time queries cost the same as distance queries.
+
+    Parameters:
+    - osm_network (networkx.Graph, RoadGraph or TiledGraphStore): The road network graph.
+    - point (Point): The origin.
+    - time (float): The travel-time budget.
+    - unit (str): 'seconds', 'minutes' or 'hours'.
+    - method, buffer, max_vertices, stats: As for `generate_isochrone`.
+
+    Returns:
+    - Polygon: The isochrone polygon, or None for an empty graph.
+    """
+    if unit not in TIME_UNITS:
+        raise ValueError(f"Unsupported time unit: {unit}")
+    cutoff = time * TIME_UNITS[unit]
+    road_graph = _search_graph(osm_network, point.x, point.y, cutoff, 'travel_time')
+    if road_graph.number_of_nodes() == 0:
+        return None
+    return _isochrone_polygon(road_graph, _snap_one(road_graph, point), cutoff, 'travel_time', method, buffer, max_vertices, stats)
+
+
+def _band_polygons(road_graph, indices, reached, distances, method, buffer, max_vertices):
+    """
+    Polygons of nested bands cut from one search result, for sorted distances.
+    """
+    if method == 'convex_hull':
+        order = np.argsort(reached, kind='stable')
+        coords = np.column_stack((road_graph.x[indices[order]], road_graph.y[indices[order]]))
+        band_ends = np.searchsorted(reached[order], distances, side='right')
+        return [shapely.multipoints(coords[:end]).convex_hull for end in band_ends]
+
+    node_distances = np.full(road_graph.number_of_nodes(), np.inf)
+    node_distances[indices] = reached
+    return [edge_buffer_polygon(road_graph, node_distances, d, buffer, max_vertices) for d in distances]
+
+
+def generate_isochrone_bands(osm_network, point, distances, method='convex_hull', buffer=25.0, max_vertices=500):
+    """
+    Generate nested isochrone polygons for several distances from a single network search.
+
+    The search runs once up to the largest distance; every band is then cut from that one
+    result, since the nodes within a smaller distance are a prefix of the distance-sorted nodes.
+
+    Parameters:
+    - osm_network (networkx.Graph, RoadGraph or TiledGraphStore): The road network graph.
+    - point (Point): The origin.
+    - distances (list): The network distances (in 'length' units) of the bands.
+    - method, buffer, max_vertices: As for `generate_isochrone`.
+
+    Returns:
+    - GeoDataFrame: One row per band, ordered by increasing 'distance'.
+    """
+    import geopandas as gpd
+
+    if method not in POLYGON_METHODS:
+        raise ValueError(f"Unsupported polygon method: {method}")
+    distances = sorted(distances)
+    road_graph = _search_graph(osm_network, point.x, point.y, distances[-1] if distances else 0)
+    polygons = [None] * len(distances)
+
+    if road_graph.number_of_nodes() > 0 and distances:
+        source = _snap_one(road_graph, point)
+        with trace_span('isochrone.search', weight='length') as span:
+            indices, reached = road_graph.bounded_dijkstra(source, distances[-1])
+            span.set(rows_out=len(indices))
+        with trace_span('isochrone.polygon', method=method, bands=len(distances)):
+            polygons = _band_polygons(road_graph, indices, reached, distances, method, buffer, max_vertices)
+
+    return gpd.GeoDataFrame({'distance': distances}, geometry=polygons, crs=GEOGRAPHIC_CRS)
+
+
+def _origin_table(origins):
+    """
+    Normalise origins into (ids, xs, ys).
+
+    Accepts a GeoDataFrame of points (its index is used as the origin id) or a list of
+    dictionaries with either 'lon'/'lat' keys or a 'coordinates' [lon, lat] pair and an optional 'id'.
+    """
+    if is_geodataframe(origins):
+        return list(origins.index), origins.geometry.x.to_numpy(), origins.geometry.y.to_numpy()
+
+    ids, xs, ys = [], [], []
+    for i, origin in enumerate(origins):
+        if 'coordinates' in origin:
+            lon, lat = origin['coordinates'][:2]
+        else:
+            lon, lat = origin['lon'], origin['lat']
+        ids.append(origin.get('id', i))
+        xs.append(lon)
+        ys.append(lat)
+    return ids, np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+
+
+# Per-process state for worker pools, so the graph is shipped once per worker rather than once per origin
+_WORKER_STATE = {}
+
+def _init_isochrone_worker(road_graph):
+    _WORKER_STATE['road_graph'] = road_graph
+
+def _isochrone_worker(args):
+    sources, distance, options = args
+    return [_isochrone_polygon(_WORKER_STATE['road_graph'], source, distance, **options) for source in sources]
+
+
+def generate_isochrones(osm_network, origins, distance, workers=1, chunk_size=64, method='convex_hull', buffer=25.0, max_vertices=500):
+    """
+    Generate isochrone polygons for many origins over the same road network.
+
+    Snapping is done for all origins in one batched query and the array graph is shared,
+    so only the per-origin network search is repeated.
+
+    Parameters:
+    - osm_network (networkx.Graph, RoadGraph or TiledGraphStore): The road network graph.
+    - origins (list or GeoDataFrame): The origins (see `_origin_table` for accepted shapes).
+    - distance (float): The network distance (in 'length' units) of each isochrone.
+    - workers (int): Number of worker processes. 1 runs everything in this process.
+    - chunk_size (int): Number of origins sent to a worker at a time.
+    - method, buffer, max_vertices: As for `generate_isochrone`.
+
+    Returns:
+    - GeoDataFrame: One row per origin with 'origin_id', 'distance' and the isochrone geometry.
+    """
+    import geopandas as gpd
+
+    if method not in POLYGON_METHODS:
+        raise ValueError(f"Unsupported polygon method: {method}")
+    ids, xs, ys = _origin_table(origins)
+    road_graph = _search_graph(osm_network, xs, ys, distance)
+    with trace_span('isochrone.snap', rows_in=len(xs)):
+        sources, _ = road_graph.node_index.query(xs, ys)
+    sources = sources.tolist()
+    options = {'method': method, 'buffer': buffer, 'max_vertices': max_vertices}
+
+    with trace_span('isochrone.batch', rows_in=len(sources), workers=workers) as span:
+        if workers and workers > 1 and len(sources) > chunk_size:
+            chunks = [(sources[i:i + chunk_size], distance, options) for i in range(0, len(sources), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_isochrone_worker, initargs=(road_graph,)) as pool:
+                polygons = [polygon for chunk in pool.map(_isochrone_worker, chunks) for polygon in chunk]
+        else:
+            polygons = [_isochrone_polygon(road_graph, source, distance, **options) for source in sources]
+        span.set(rows_out=sum(polygon is not None for polygon in polygons))
+
+    return gpd.GeoDataFrame(
+        {'origin_id': ids, 'distance': [distance] * len(ids)},
+        geometry=polygons,
+        crs=GEOGRAPHIC_CRS,
+    )
+
+
+def _point_coordinates(points):
+    """
+    Coordinates (xs, ys) of a batch of point records or a GeoDataFrame. Non-point geometries
+    stand in by their centroid; records without a location get NaN.
+    """
+    if is_geodataframe(points):
+        geometries = shapely.centroid(points.geometry.to_numpy())
+        return shapely.get_x(geometries), shapely.get_y(geometries)
+    xs, ys = np.full(len(points), np.nan), np.full(len(points), np.nan)
+    for i, point in enumerate(points):
+        if 'coordinates' in point:
+            xs[i], ys[i] = point['coordinates'][:2]
+        elif point.get('geometry') is not None:
+            centroid = point['geometry'].centroid
+            xs[i], ys[i] = centroid.x, centroid.y
+    return xs, ys
+
+
+def _annotate_accessibility(points, road_graph, node_distances, node_facilities, facility_ids, covered=None):
+    """
+    Add 'network_distance' and 'nearest_facility' to a batch of points from a finished search.
+    """
+    with trace_span('accessibility.snap', rows_in=len(points)) as span:
+        xs, ys = _point_coordinates(points)
+        positions, _ = road_graph.node_index.query(xs, ys)
+        snapped = positions >= 0
+        if covered is not None:
+            snapped[snapped] = covered(xs[snapped], ys[snapped])
+        distances = np.full(len(positions), np.inf)
+        distances[snapped] = node_distances[positions[snapped]]
+        facilities = np.full(len(positions), -1, dtype=np.int64)
+        facilities[snapped] = node_facilities[positions[snapped]]
+        span.set(rows_out=int(np.isfinite(distances).sum()))
+
+    nearest = [facility_ids[k] if k >= 0 else None for k in facilities.tolist()]
+    if is_geodataframe(points):
+        points = points.copy()
+        points['network_distance'] = np.where(np.isfinite(distances), distances, np.nan)
+        points['nearest_facility'] = nearest
+        return points
+    return [
+        {**point, 'network_distance': float(distance) if facility is not None else None, 'nearest_facility': facility}
+        for point, distance, facility in zip(points, distances.tolist(), nearest)
+    ]
+
+
+def network_accessibility(osm_network, points, facilities, max_distance=None, weight='length'):
+    """
+    Find each point's network distance to its nearest facility.
+
+    Facilities are snapped in one batch and a single multi-source search over the graph gives
+    every node its nearest facility; points are then snapped and looked up, so the cost is one
+    traversal however many points and facilities there are.
+
+    Parameters:
+    - osm_network (networkx.Graph, RoadGraph or TiledGraphStore): The road network graph.
+    - points (list, GeoDataFrame or ChunkedData): The points to annotate. A ChunkedData stream is
+      annotated batch by batch as it is read.
+    - facilities (list or GeoDataFrame): The facilities (see `_origin_table` for accepted shapes).
+    - max_distance (float): Search no further than this, in the units of `weight`. Required for a
+      TiledGraphStore, which loads only the tiles within reach of the facilities.
+    - weight (str): 'length' (metres) or 'travel_time' (seconds).
+
+    Returns:
+    - The points, each with 'network_distance' (in the units of `weight`) and 'nearest_facility'
+      (the facility id), both None (NaN in a GeoDataFrame) when no facility is within reach.
+    """
+    from geoprocessing_pipeline.data_loader import map_records
+
+    if weight not in ('length', 'travel_time'):
+        raise ValueError(f"Unsupported edge weight: {weight}")
+    facility_ids, xs, ys = _origin_table(facilities)
+    cutoff = np.inf if max_distance is None else max_distance
+    covered = None
+    if isinstance(osm_network, TiledGraphStore):
+        if max_distance is None:
+            raise ValueError("A tiled graph needs a maximum distance to bound the search")
+        # Points outside the loaded tiles could snap to the wrong node; they are out of reach anyway
+        covered = partial(osm_network.covers, osm_network.tiles_near(xs, ys, osm_network.reach_metres(cutoff, weight)))
+    road_graph = _search_graph(osm_network, xs, ys, cutoff, weight)
+
+    with trace_span('accessibility.search', rows_in=len(facility_ids), weight=weight) as span:
+        sources, _ = road_graph.node_index.query(xs, ys)
+        node_distances, node_facilities = road_graph.multi_source_dijkstra(sources, cutoff, weight)
+        span.set(rows_out=int(np.isfinite(node_distances).sum()))
+
+    return map_records(points, partial(_annotate_accessibility, road_graph=road_graph, node_distances=node_distances,
+                                       node_facilities=node_facilities, facility_ids=facility_ids, covered=covered))
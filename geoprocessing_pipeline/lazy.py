@@ -0,0 +1,31 @@
+import sys
+
+# Heavy dependencies (osmnx, networkx, geopandas, pandas, folium) are imported inside the
+# functions that use them, so importing the package and running steps that do not need them
+# stays fast. These helpers cover the type checks that would otherwise import them up front.
+
+# Dependencies that only the steps needing them may import
+HEAVY_MODULES = ('osmnx', 'networkx', 'geopandas', 'pandas', 'folium', 'matplotlib')
+
+# Cold import of the pipeline (package, step registry and scheduler) must stay under this
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+def is_instance(value, module_name, class_name):
+    """
+    isinstance() against a class of a heavy module, without importing that module.
+
+    A value cannot be an instance of a class whose module has not been imported yet, so
+    the check is False until something else has imported it.
+
+    Parameters:
+    - value: The object to check.
+    - module_name (str): The module defining the class, e.g. 'geopandas'.
+    - class_name (str): The class name in that module, e.g. 'GeoDataFrame'.
+    """
+    module = sys.modules.get(module_name)
+    return module is not None and isinstance(value, getattr(module, class_name))
+
+
+def is_geodataframe(value):
+    return is_instance(value, 'geopandas', 'GeoDataFrame')
@@ -1,57 +1,356 @@
-from geoprocessing_pipeline.data_loader import load_or_download_graph, load_data_by_type
-from geoprocessing_pipeline.isochrone import generate_isochrone
-from geoprocessing_pipeline.filter import filter_points_by_complex_query, filter_points_within_isochrone
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from geoprocessing_pipeline.steps import compile_step, graph_tile_size
+from geoprocessing_pipeline.cache import step_cache_key, value_cache_key
+from geoprocessing_pipeline.tracing import peak_rss_bytes, row_count
 
-def run_geoprocessing_pipeline(json_data):
+
+def build_step_graph(steps, external_inputs=()):
     """
-    Runs the geoprocessing pipeline based on a JSON configuration.
+    Build and validate the dependency graph of a pipeline from its input/output names.
+
+    Parameters:
+    - steps (list): The compiled steps, in configuration order.
+    - external_inputs (iterable): Names supplied by the caller at run time rather than by a step.
+
+    Returns:
+    - list: For each step, the positions of the steps it depends on.
+
+    Raises:
+    - ValueError: If an output name is produced twice, a step reads a name nothing produces,
+      or the references form a cycle.
+    """
+    external_inputs = set(external_inputs)
+    producers = {}
+    for position, step in enumerate(steps):
+        if step.output in producers or step.output in external_inputs:
+            raise ValueError(f"Output '{step.output}' is produced by more than one step")
+        producers[step.output] = position
+
+    dependencies = []
+    for step in steps:
+        missing = [name for name in step.references if name not in producers and name not in external_inputs]
+        if missing:
+            raise ValueError(f"Step '{step.function_name}' ({step.output}) reads undefined outputs: {', '.join(missing)}")
+        dependencies.append(sorted({producers[name] for name in step.references if name in producers}))
+
+    # Kahn's algorithm: anything left unvisited sits on a cycle
+    remaining = [len(deps) for deps in dependencies]
+    dependents = [[] for _ in steps]
+    for position, deps in enumerate(dependencies):
+        for dep in deps:
+            dependents[dep].append(position)
+    ready = [position for position, count in enumerate(remaining) if count == 0]
+    visited = 0
+    while ready:
+        position = ready.pop()
+        visited += 1
+        for dependent in dependents[position]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    if visited != len(steps):
+        cyclic = [steps[position].output for position, count in enumerate(remaining) if count > 0]
+        raise ValueError(f"Pipeline steps form a cycle: {', '.join(cyclic)}")
+
+    return dependencies
+
+
+class DeferredInput:
+    """
+    An external input loaded only once a step reading it has to run, so a run whose readers are
+    all in the result cache never loads it (e.g. a graph, keyed by its load step and source file).
+
+    Parameters:
+    - key (str): The input's result cache key, standing in for a hash of its value.
+    - load (callable): Called without arguments, at most once, to load the value.
+    """
+
+    def __init__(self, key, load):
+        self.key = key
+        self._load = load
+        self._lock = threading.Lock()
+        self.loaded = False
+        self._value = None
+
+    def value(self):
+        with self._lock:
+            if not self.loaded:
+                self._value = self._load()
+                self.loaded = True
+            return self._value
+
+
+def _resolve(inputs):
+    return {name: value.value() if isinstance(value, DeferredInput) else value for name, value in inputs.items()}
+
+
+def _run_cached_step(step, inputs, context, cache, key):
+    # Returns the output and whether it came from the cache
+    if cache is not None:
+        hit, output = cache.get(key)
+        if hit:
+            return output, True
+    output = step.run(_resolve(inputs), context)
+    if cache is not None:
+        cache.put(key, output, step.output)
+    return output, False
+
+
+def _run_compiled_step(step, inputs, context, cache=None, key=None, tracer=None):
+    if tracer is None:
+        return _run_cached_step(step, inputs, context, cache, key)
+    with tracer.activate(), tracer.span(step.output, category='step', function=step.function_name) as span:
+        counts = [count for count in map(row_count, inputs.values()) if count is not None]
+        span.set(rows_in=sum(counts) if counts else None)
+        output, hit = _run_cached_step(step, inputs, context, cache, key)
+        span.set(rows_out=row_count(output), cache_hit=hit)
+    return output, hit
+
+
+def _run_compiled_step_in_process(step, inputs, context, cache, key, tracer):
+    # Spans recorded in a worker process travel back with the output
+    output, hit = _run_compiled_step(step, inputs, context, cache, key, tracer)
+    return output, hit, tracer.take_spans() if tracer is not None else []
+
+
+class PipelinePlan:
+    """
+    A validated pipeline with every step's parameters resolved, ready to be run many times.
+
+    Build one with compile_pipeline(). Running a plan does no configuration parsing or
+    validation, so one plan can serve the same query template over many different inputs.
+
+    `results` names the final outputs. Unless given, they are the sinks: outputs no step reads.
+    """
+
+    def __init__(self, steps, dependencies, external_inputs=(), results=None):
+        self.steps = steps
+        self.dependencies = dependencies
+        self.external_inputs = tuple(external_inputs)
+
+        # Liveness: how many steps read each name. When a run releases outputs, a name's
+        # value is dropped once that many readers have finished, unless it is a final result.
+        self.uses = {}
+        for step in steps:
+            for name in set(step.references):
+                self.uses[name] = self.uses.get(name, 0) + 1
+        if results is None:
+            results = [step.output for step in steps if step.output not in self.uses]
+        unknown = [name for name in results
+                   if name not in self.external_inputs and name not in {step.output for step in steps}]
+        if unknown:
+            raise ValueError(f"Results name undefined outputs: {', '.join(unknown)}")
+        self.results = tuple(results)
+
+        # Configuration order, moved forward only where a step reads a later step's output
+        self.order = []
+        done = set()
+        pending = list(range(len(steps)))
+        while pending:
+            position = next(p for p in pending if all(dep in done for dep in dependencies[p]))
+            pending.remove(position)
+            self.order.append(position)
+            done.add(position)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def cache_keys(self, inputs=None):
+        """
+        Result cache key of every step output and external input, by name.
+
+        Keys are computed from the configuration alone (plus the external input values and
+        the files steps read), so they are known before anything runs.
+        """
+        keys = {name: value.key if isinstance(value, DeferredInput) else value_cache_key(value)
+                for name, value in (inputs or {}).items()}
+        for position in self.order:
+            step = self.steps[position]
+            keys[step.output] = step_cache_key(step, keys)
+        return keys
+
+    def run(self, inputs=None, workers=1, executor='thread', progress=None, cache=None, release=False, stats=None,
+            tracer=None):
+        """
+        Run the plan.
+
+        With more than one worker, every step whose inputs are ready runs concurrently, so
+        independent branches (e.g. graph loading and data filtering) overlap.
+
+        Parameters:
+        - inputs (dict): Values for the plan's external inputs, by name; DeferredInput values
+          are loaded only if a step reading them misses the cache.
+        - workers (int): Maximum number of steps run at the same time.
+        - executor (str): 'thread' or 'process'. Process workers need picklable step outputs.
+        - progress (callable): Optional callback, called with each compiled step when it finishes.
+        - cache (ResultCache): Optional on-disk cache; steps whose key is stored are not run.
+        - release (bool): Drop each output that is not a final result as soon as its last reader
+          finishes, so only `results` are returned.
+        - stats (dict): Optional dictionary filled with 'peak_rss_bytes' (overall), 'step_peak_rss_bytes'
+          (by output, measured when each step finishes) and 'released' (names in release order).
+        - tracer (Tracer): Optional tracer recording a span per step, and the phases inside it.
+
+        Returns:
+        - dict: The outputs of the pipeline steps by name, plus the external inputs (deferred
+          inputs that were never loaded are left out, unless they are results).
+
+        Raises:
+        - ValueError: If an external input is missing or the executor is unknown.
+        """
+        # This dictionary will hold the output of each function in the pipeline
+        outputs = dict(inputs or {})
+        missing = [name for name in self.external_inputs if name not in outputs]
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {', '.join(missing)}")
+        # Per-run state shared by the steps, e.g. attribute indexes by dataset name
+        context = {}
+        keys = self.cache_keys(outputs) if cache is not None else {}
+        remaining_uses = dict(self.uses)
+        stats = {} if stats is None else stats
+        stats.update({'peak_rss_bytes': None, 'step_peak_rss_bytes': {}, 'released': []})
+
+        def drop(name):
+            if name in self.results:
+                return
+            del outputs[name]
+            # Indexes built over a dataset keep it alive; drop them with it
+            context.get('attribute_indexes', {}).pop(name, None)
+            stats['released'].append(name)
+
+        def finish(step, output, hit):
+            outputs[step.output] = output
+            if cache is not None:
+                cache.record(step.output, hit)
+            if release:
+                for name in set(step.references):
+                    remaining_uses[name] -= 1
+                    if remaining_uses[name] == 0:
+                        drop(name)
+                if step.output not in remaining_uses:
+                    drop(step.output)
+            stats['step_peak_rss_bytes'][step.output] = peak_rss_bytes()
+            if progress:
+                progress(step)
+
+        def inputs_for(step):
+            return {name: outputs[name] for name in step.references}
+
+        def resolved():
+            for name, value in list(outputs.items()):
+                if isinstance(value, DeferredInput):
+                    if value.loaded or name in self.results:
+                        outputs[name] = value.value()
+                    else:
+                        del outputs[name]
+            stats['peak_rss_bytes'] = peak_rss_bytes()
+            return outputs
+
+        if workers <= 1:
+            for position in self.order:
+                step = self.steps[position]
+                finish(step, *_run_compiled_step(step, inputs_for(step), context, cache, keys.get(step.output), tracer))
+            return resolved()
+
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor: {executor}")
+        pool_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+        remaining = {position: set(deps) for position, deps in enumerate(self.dependencies)}
+        running = {}
+        with pool_class(max_workers=workers) as pool:
+            while remaining or running:
+                for position in [p for p, deps in remaining.items() if not deps]:
+                    del remaining[position]
+                    step = self.steps[position]
+                    if executor == 'thread':
+                        future = pool.submit(_run_compiled_step, step, inputs_for(step), context,
+                                             cache, keys.get(step.output), tracer)
+                    else:
+                        # Deferred inputs are loaded here, as their loaders stay in this process
+                        future = pool.submit(_run_compiled_step_in_process, step, _resolve(inputs_for(step)), {},
+                                             cache, keys.get(step.output), tracer)
+                    running[future] = position
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    position = running.pop(future)
+                    step = self.steps[position]
+                    for deps in remaining.values():
+                        deps.discard(position)
+                    result = future.result()
+                    if executor == 'process':
+                        if tracer is not None:
+                            tracer.add_spans(result[2])
+                        result = result[:2]
+                    finish(step, *result)
+
+        return resolved()
+
+
+def compile_pipeline(json_data, inputs=()):
+    """
+    Validate a pipeline configuration once and resolve it into a reusable plan.
 
     Parameters:
     - json_data (dict): A dictionary representing the JSON configuration for the pipeline.
+    - inputs (iterable): Names the steps may read that are supplied when the plan is run.
+
+    The configuration may list its final outputs under 'results'; see PipelinePlan.
 
     Returns:
-    - dict: A dictionary containing the outputs of the various pipeline steps.
+    - PipelinePlan: The compiled plan.
+
+    Raises:
+    - ValueError: If a step is unknown or misconfigured, or the steps' references are invalid.
     """
-    # This dictionary will hold the output of each function in the pipeline
-    outputs = {}
+    steps = [compile_step(func) for func in json_data['functions']]
+    return PipelinePlan(steps, build_step_graph(steps, inputs), inputs, json_data.get('results'))
+
+
+def split_graph_steps(json_data):
+    """
+    Take the loadOsmData steps out of a configuration, so their graphs can be loaded once and shared.
+
+    Compile the remaining configuration with the graph step outputs as inputs, and pass the
+    loaded graphs when running it.
 
-    # Iterate through each function step in the pipeline configuration
+    Returns:
+    - tuple: (the remaining configuration, {output name: (address, filepath, binary cache, tile size, crs)}),
+      where the tile size is None unless the step asks for a tiled graph, and the crs None
+      unless it names a projected CRS.
+    """
+    functions, graph_specs = [], {}
     for func in json_data['functions']:
-        func_name = func['functionName']
-
-        # Load or download OSM data
-        if func_name == "loadOsmData":
-            address = func['input']['data']['address']
-            filepath = func['input']['data']['filepath']
-            output = load_or_download_graph(address, filepath)
-        
-        # Generate Isochrone
-        elif func_name == "generateIsochrone":
-            osm_network = outputs[func['input']['data']]
-            distance = func['input']['parameters']['distance']
-            output = generate_isochrone(osm_network, distance)
-        
-        # Load generic data (points, buildings, etc.)
-        elif func_name == "loadData":
-            data_type = func['input']['parameters']['dataType']
-            output = load_data_by_type(data_type)
-        
-        # Filter Points by Complex Query (e.g., height > 20)
-        elif func_name == "filterPoints" and func['input']['parameters']['filterType'] == "byComplexQuery":
-            points = outputs[func['input']['data']]  # Use the points that were loaded earlier
-            attribute = func['input']['parameters']['filterCriteria']['attribute']
-            operator = func['input']['parameters']['filterCriteria']['operator']
-            value = func['input']['parameters']['filterCriteria']['value']
-            output = filter_points_by_complex_query(points, attribute, operator, value)
-        
-        # Check which points are within the isochrone
-        elif func_name == "checkPointsWithinIsochrone":
-            points = outputs[func['input']['data']]
-            isochrone_polygon = outputs[func['input']['parameters']['isochrone']]
-            output = filter_points_within_isochrone(points, isochrone_polygon)
-
-        # Store the output of this function in the outputs dictionary
-        outputs[func['output']] = output
-
-    return outputs
+        if func.get('functionName') == 'loadOsmData':
+            data = func['input']['data']
+            parameters = func['input'].get('parameters', {})
+            graph_specs[func['output']] = (data['address'], data['filepath'], bool(parameters.get('binaryCache', False)),
+                                           graph_tile_size(parameters), parameters.get('crs'))
+        else:
+            functions.append(func)
+    return dict(json_data, functions=functions), graph_specs
+
+
+def run_geoprocessing_pipeline(json_data, workers=1, executor='thread', progress=None, cache=None, release=False, stats=None,
+                               tracer=None):
+    """
+    Runs the geoprocessing pipeline based on a JSON configuration.
+
+    The configuration is compiled and validated before anything runs; see compile_pipeline()
+    to keep the plan and run it again.
 
+    Parameters:
+    - json_data (dict): A dictionary representing the JSON configuration for the pipeline.
+    - workers (int): Maximum number of steps run at the same time.
+    - executor (str): 'thread' or 'process'. Process workers need picklable step outputs.
+    - progress (callable): Optional callback, called with each compiled step when it finishes.
+    - cache (ResultCache): Optional on-disk cache of step outputs reused across runs.
+    - release (bool): Drop intermediate outputs once no later step reads them.
+    - stats (dict): Optional dictionary filled with peak memory figures; see PipelinePlan.run.
+    - tracer (Tracer): Optional tracer recording per-step and per-phase timings.
+
+    Returns:
+    - dict: A dictionary containing the outputs of the various pipeline steps.
+    """
+    return compile_pipeline(json_data).run(workers=workers, executor=executor, progress=progress, cache=cache,
+                                           release=release, stats=stats, tracer=tracer)
@@ -0,0 +1,335 @@
+import json
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+import folium
+from folium.plugins import FastMarkerCluster
+from folium.elements import MacroElement
+from folium.template import Template
+from geoprocessing_pipeline.data_loader import ChunkedData
+from geoprocessing_pipeline.lazy import is_geodataframe, is_instance
+
+# Point layers up to this size are drawn as individual features with popups
+MARKER_LIMIT = 1000
+
+# Larger point layers up to this size are clustered in the browser; beyond it they are
+# aggregated into grid cells here, so the page size stops growing with the point count
+CLUSTER_LIMIT = 20000
+
+# Zoom levels given their own aggregation grid, and the most cells any one grid may have
+AGGREGATE_ZOOMS = (8, 10, 12, 14, 16)
+AGGREGATE_CELL_LIMIT = 5000
+
+# Decimal places kept in coordinates (about 10 cm)
+COORDINATE_PRECISION = 6
+
+DEFAULT_LOCATION = [27.712, 85.318]
+
+LAYER_COLORS = ('blue', 'red', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'darkgreen')
+
+
+class LayerData:
+    """
+    The geometries of one result value, with access to their attributes by position.
+    """
+
+    def __init__(self, geometries, records=None, frame=None):
+        self.geometries = geometries
+        self._records = records
+        self._frame = frame
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def properties(self, positions):
+        """
+        JSON-serializable attributes of the features at `positions`.
+        """
+        if self._frame is not None:
+            rows = self._frame.drop(columns=self._frame.geometry.name).iloc[positions]
+            return json.loads(rows.to_json(orient='records', default_handler=str))
+        if self._records is not None:
+            return [{k: v for k, v in self._records[i].items() if k not in ('coordinates', 'geometry')
+                     and isinstance(v, (str, int, float, bool, type(None)))} for i in positions]
+        return [{} for _ in positions]
+
+
+def layer_data(value):
+    """
+    Extract the geometries of a result value (or of one batch of a ChunkedData stream).
+
+    Handles single geometries, GeoDataFrames, GeoSeries, and lists of point records (with
+    'coordinates' [lon, lat]) or feature records (with 'geometry').
+
+    Returns:
+    - LayerData or None: None when the value holds no geometries (e.g. a road graph).
+    """
+    if isinstance(value, BaseGeometry):
+        return None if value.is_empty else LayerData(np.asarray([value], dtype=object))
+    if is_geodataframe(value):
+        keep = ~(value.geometry.isna() | value.geometry.is_empty).to_numpy()
+        frame = value[keep]
+        return LayerData(frame.geometry.to_numpy(), frame=frame) if len(frame) else None
+    if is_instance(value, 'geopandas', 'GeoSeries'):
+        geometries = value.to_numpy()
+        geometries = geometries[~shapely.is_missing(geometries)]
+        return LayerData(geometries) if len(geometries) else None
+    if isinstance(value, list) and value and all(isinstance(record, dict) for record in value):
+        records = [record for record in value if 'coordinates' in record or isinstance(record.get('geometry'), BaseGeometry)]
+        if not records:
+            return None
+        point_positions = [i for i, record in enumerate(records) if 'coordinates' in record]
+        geometries = np.empty(len(records), dtype=object)
+        if point_positions:
+            coords = np.asarray([records[i]['coordinates'][:2] for i in point_positions], dtype=float)
+            geometries[point_positions] = shapely.points(coords)
+        for i, record in enumerate(records):
+            if 'coordinates' not in record:
+                geometries[i] = record['geometry']
+        return LayerData(geometries, records=records)
+    return None
+
+
+def _feature_collection(geometries, properties):
+    """
+    GeoJSON FeatureCollection text, serializing all geometries in one vectorized call.
+    """
+    geometries = shapely.set_precision(geometries, 10 ** -COORDINATE_PRECISION)
+    texts = shapely.to_geojson(geometries)
+    features = ','.join(
+        f'{{"type":"Feature","geometry":{text},"properties":{json.dumps(props)}}}'
+        for text, props in zip(texts, properties)
+    )
+    return f'{{"type":"FeatureCollection","features":[{features}]}}'
+
+
+def _cell_keys(xs, ys, cell_size):
+    # One integer key per cell, so the grouping is a plain 1-D unique
+    col = np.floor(xs / cell_size).astype(np.int64)
+    row = np.floor(ys / cell_size).astype(np.int64)
+    return col * (1 << 32) + row
+
+
+def _sum_cells(keys, sum_x, sum_y, counts):
+    """
+    Merge per-point (or per-cell) sums that share a cell key into one entry per cell.
+    """
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return (keys, np.bincount(inverse, sum_x), np.bincount(inverse, sum_y),
+            np.bincount(inverse, counts).astype(np.int64))
+
+
+def aggregate_points(xs, ys, cell_size):
+    """
+    Count points per square grid cell.
+
+    Parameters:
+    - xs, ys (numpy.ndarray): Point coordinates.
+    - cell_size (float): Cell width and height, in coordinate units.
+
+    Returns:
+    - tuple: Arrays (x, y, count) with one entry per non-empty cell; x and y are the mean
+      position of the cell's points.
+    """
+    if len(xs) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+    _, sum_x, sum_y, counts = _sum_cells(_cell_keys(xs, ys, cell_size), xs, ys, np.ones(len(xs)))
+    return sum_x / counts, sum_y / counts, counts
+
+
+class PointGrids:
+    """
+    Per-zoom grids of point counts, added to batch by batch so a point stream is never held in memory.
+    """
+
+    def __init__(self):
+        # Zoom level -> (cell keys, x sums, y sums, counts), for the zoom levels still kept
+        self.cells = {zoom: None for zoom in AGGREGATE_ZOOMS}
+
+    def add(self, xs, ys):
+        """
+        Count a batch of points into every grid.
+        """
+        for i, zoom in enumerate(list(self.cells)):
+            cells = (_cell_keys(xs, ys, zoom_cell_size(zoom)), xs, ys, np.ones(len(xs)))
+            if self.cells[zoom] is not None:
+                cells = tuple(np.concatenate(pair) for pair in zip(self.cells[zoom], cells))
+            cells = _sum_cells(*cells)
+            if i and len(cells[0]) > AGGREGATE_CELL_LIMIT:
+                # Finer grids would hold about as many cells as there are points
+                for finer in list(self.cells)[i:]:
+                    del self.cells[finer]
+                return
+            self.cells[zoom] = cells
+
+    def levels(self):
+        """
+        (zoom, x, y, count) of every kept grid, with x and y the mean position of each cell's points.
+        """
+        return [(zoom, sum_x / counts, sum_y / counts, counts)
+                for zoom, (_, sum_x, sum_y, counts) in self.cells.items()]
+
+
+def zoom_cell_size(zoom, pixels=32):
+    """
+    Cell size in degrees that spans about `pixels` screen pixels at a web map zoom level.
+    """
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+
+class ZoomLevels(MacroElement):
+    """
+    Show exactly one of a group's layers: the one for the highest zoom level not above the map's zoom.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this.map.get_name() }};
+            var group = {{ this.group.get_name() }};
+            var levels = [{% for zoom, layer in this.levels %}[{{ zoom }}, {{ layer.get_name() }}]{% if not loop.last %}, {% endif %}{% endfor %}];
+            function update() {
+                var shown = levels[0][1];
+                levels.forEach(function(level) { if (map.getZoom() >= level[0]) { shown = level[1]; } });
+                levels.forEach(function(level) {
+                    if (level[1] === shown) { group.addLayer(level[1]); } else { group.removeLayer(level[1]); }
+                });
+            }
+            map.on('zoomend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, folium_map, group, levels):
+        super().__init__()
+        self._name = 'ZoomLevels'
+        self.map = folium_map
+        self.group = group
+        self.levels = levels
+
+
+def _add_aggregated_points(folium_map, group, grids, color):
+    levels = []
+    for zoom, cx, cy, counts in grids.levels():
+        radius = np.clip(3 + 2 * np.log2(counts), 3, 30)
+        collection = _feature_collection(shapely.points(cx, cy), [{'count': int(c), 'radius': float(r)} for c, r in zip(counts, radius)])
+        layer = folium.GeoJson(
+            collection,
+            marker=folium.CircleMarker(fill=True),
+            style_function=lambda feature, color=color: {'radius': feature['properties']['radius'], 'color': color,
+                                                         'fillColor': color, 'fillOpacity': 0.5, 'weight': 1},
+            tooltip=folium.GeoJsonTooltip(fields=['count'], aliases=['Points']),
+        )
+        layer.add_to(group)
+        levels.append((zoom, layer))
+    # Added after the levels, so its script runs once they exist
+    ZoomLevels(folium_map, group, levels).add_to(group)
+
+
+def add_result_layer(folium_map, name, value, color='blue'):
+    """
+    Add a result value to a map as one layer, choosing a rendering that suits its size.
+
+    Polygons and lines are drawn as a single GeoJSON layer. Points are drawn as GeoJSON features
+    with popups up to MARKER_LIMIT, clustered in the browser up to CLUSTER_LIMIT, and beyond that
+    aggregated here into per-zoom grids of point counts.
+
+    A ChunkedData stream is read once, batch by batch: point features and coordinates are kept
+    only while the count allows drawing them, and larger streams are counted into the grids.
+
+    Returns:
+    - tuple or None: (how the points were drawn: 'features', 'cluster' or 'aggregate', and the
+      layer bounds (minx, miny, maxx, maxy)), or None when the value holds no geometries.
+    """
+    batches = value if isinstance(value, ChunkedData) else [value]
+    shapes, features, locations, bounds = [], [], [], []
+    grids = PointGrids()
+    point_count = 0
+    for batch in batches:
+        data = layer_data(batch)
+        if data is None:
+            continue
+        bounds.append(shapely.total_bounds(data.geometries))
+        is_point = shapely.get_type_id(data.geometries) == 0
+        positions = np.flatnonzero(~is_point)
+        if len(positions):
+            shapes.append((data.geometries[positions], data.properties(positions)))
+
+        positions = np.flatnonzero(is_point)
+        if not len(positions):
+            continue
+        point_count += len(positions)
+        geometries = data.geometries[positions]
+        xs, ys = shapely.get_x(geometries), shapely.get_y(geometries)
+        if point_count <= MARKER_LIMIT:
+            features.append((geometries, data.properties(positions)))
+        else:
+            features = []
+        if point_count <= CLUSTER_LIMIT:
+            locations.append((xs, ys))
+        else:
+            for batch_xs, batch_ys in locations:
+                grids.add(batch_xs, batch_ys)
+            locations = []
+            grids.add(xs, ys)
+
+    if not bounds:
+        return None
+    group = folium.FeatureGroup(name=name, show=True)
+    mode = 'features'
+    if shapes:
+        folium.GeoJson(
+            _feature_collection(np.concatenate([g for g, _ in shapes]), [p for _, props in shapes for p in props]),
+            style_function=lambda feature: {'fillColor': color, 'color': color, 'weight': 2, 'fillOpacity': 0.3},
+        ).add_to(group)
+
+    if point_count and point_count <= MARKER_LIMIT:
+        properties = [p for _, props in features for p in props]
+        fields = sorted({key for props in properties for key in props})
+        folium.GeoJson(
+            _feature_collection(np.concatenate([g for g, _ in features]), properties),
+            marker=folium.CircleMarker(radius=5, color=color, fill=True, fill_color=color, fill_opacity=0.7),
+            popup=folium.GeoJsonPopup(fields=fields) if fields else None,
+        ).add_to(group)
+    elif point_count and point_count <= CLUSTER_LIMIT:
+        mode = 'cluster'
+        xs, ys = np.concatenate([x for x, _ in locations]), np.concatenate([y for _, y in locations])
+        locations = np.round(np.column_stack((ys, xs)), COORDINATE_PRECISION).tolist()
+        FastMarkerCluster(locations).add_to(group)
+    elif point_count:
+        mode = 'aggregate'
+        _add_aggregated_points(folium_map, group, grids, color)
+
+    group.add_to(folium_map)
+    minx, miny = np.min(bounds, axis=0)[:2]
+    maxx, maxy = np.max(bounds, axis=0)[2:]
+    return mode, (minx, miny, maxx, maxy)
+
+
+def render_results_map(results, map_filepath):
+    """
+    Draw every result that holds geometries as a layer of a folium map and save it as HTML.
+
+    Parameters:
+    - results (dict): The pipeline results; each value with geometries becomes a layer named after it.
+    - map_filepath (str): Where to write the HTML file.
+
+    Returns:
+    - dict: The rendering used for each drawn layer ('features', 'cluster' or 'aggregate').
+    """
+    folium_map = folium.Map(location=DEFAULT_LOCATION, zoom_start=13)
+    modes, bounds = {}, []
+    for name, value in results.items():
+        drawn = add_result_layer(folium_map, name, value, LAYER_COLORS[len(modes) % len(LAYER_COLORS)])
+        if drawn is not None:
+            modes[name], layer_bounds = drawn
+            bounds.append(layer_bounds)
+
+    if bounds:
+        minx, miny = np.min(bounds, axis=0)[:2]
+        maxx, maxy = np.max(bounds, axis=0)[2:]
+        folium_map.fit_bounds([[float(miny), float(minx)], [float(maxy), float(maxx)]])
+    folium.LayerControl().add_to(folium_map)
+    folium_map.save(map_filepath)
+    return modes
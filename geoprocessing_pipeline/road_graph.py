@@ -0,0 +1,456 @@
+import os
+import json
+import weakref
+from heapq import heapify, heappush, heappop
+import numpy as np
+import shapely
+from geoprocessing_pipeline.tracing import trace_span
+from geoprocessing_pipeline.crs import local_crs, project
+
+# Arrays written by RoadGraph.save, one .npy file each so they can be memory-mapped on load
+_ARRAY_NAMES = ('node_ids', 'x', 'y', 'offsets', 'targets', 'weights', 'speeds')
+
+# Attributes written by RoadGraph.save next to the arrays (meta.json belongs to the caches that hold them)
+_ATTRIBUTES_NAME = 'graph.json'
+
+# Free-flow speeds (km/h) by OSM highway type, used for edges without a usable maxspeed
+HIGHWAY_SPEEDS_KPH = {
+    'motorway': 100.0, 'motorway_link': 60.0,
+    'trunk': 80.0, 'trunk_link': 50.0,
+    'primary': 60.0, 'primary_link': 40.0,
+    'secondary': 50.0, 'secondary_link': 40.0,
+    'tertiary': 40.0, 'tertiary_link': 30.0,
+    'unclassified': 30.0, 'residential': 30.0,
+    'living_street': 10.0, 'service': 20.0, 'road': 30.0, 'track': 15.0,
+}
+DEFAULT_SPEED_KPH = 30.0
+
+# Array graphs are built once per networkx graph object and reused by every later query
+_ROAD_GRAPH_CACHE = weakref.WeakKeyDictionary()
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def _parse_speed_kph(value):
+    """
+    Parse an OSM maxspeed/speed_kph value ("50", "30 mph", "50;40", "['40', '60']") into km/h.
+    Returns NaN for values that are not numeric (e.g. "none", "signals").
+    """
+    speeds = []
+    for part in value.strip("[]").replace(";", ",").split(","):
+        part = part.strip().strip("'\"").lower()
+        factor = 1.609344 if part.endswith("mph") else 1.0
+        try:
+            speeds.append(float(part.replace("mph", "").replace("km/h", "").strip()) * factor)
+        except ValueError:
+            continue
+    return float(np.mean(speeds)) if speeds else np.nan
+
+
+def edge_speeds_kph(maxspeeds, highways, highway_speeds=None):
+    """
+    Resolve per-edge speeds from raw maxspeed and highway tags.
+
+    Each distinct tag value is parsed once and mapped back onto the edges with array indexing,
+    so the cost scales with the number of distinct values rather than the number of edges.
+
+    Parameters:
+    - maxspeeds (array-like of str): Raw maxspeed (or speed_kph) tag per edge, '' when missing.
+    - highways (array-like of str): Highway type per edge, '' when missing.
+    - highway_speeds (dict): Fallback speeds by highway type. Defaults to HIGHWAY_SPEEDS_KPH.
+
+    Returns:
+    - numpy.ndarray: Speed in km/h per edge.
+    """
+    highway_speeds = HIGHWAY_SPEEDS_KPH if highway_speeds is None else highway_speeds
+    maxspeeds = np.asarray(maxspeeds, dtype=str)
+    highways = np.asarray(highways, dtype=str)
+    if len(maxspeeds) == 0:
+        return np.zeros(0)
+
+    unique_speeds, speed_codes = np.unique(maxspeeds, return_inverse=True)
+    speeds = np.array([_parse_speed_kph(v) for v in unique_speeds])[speed_codes]
+
+    unique_highways, highway_codes = np.unique(highways, return_inverse=True)
+    fallback = np.array([highway_speeds.get(h, DEFAULT_SPEED_KPH) for h in unique_highways])[highway_codes]
+
+    missing = ~(speeds > 0)
+    speeds[missing] = fallback[missing]
+    return speeds
+
+
+def _tag_value(value):
+    # OSM tags merged by osmnx may be lists; the first entry stands for the edge
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return str(value[0]) if value else ''
+    return str(value)
+
+
+class NodeIndex:
+    """
+    Spatial index (STRtree) over the node coordinates of a road network.
+
+    With a projected `crs`, the nodes are indexed in metres and queried lon/lat coordinates are
+    projected in bulk, so "nearest" does not depend on latitude.
+
+    Parameters:
+    - node_ids (array-like): The graph node ids, in index order.
+    - xs (array-like): The x coordinate of each node: longitude, or easting in `crs`.
+    - ys (array-like): The y coordinate of each node: latitude, or northing in `crs`.
+    - crs (str): The projected CRS of `xs`/`ys`, or None for lon/lat.
+    """
+
+    def __init__(self, node_ids, xs, ys, crs=None):
+        self.node_ids = np.asarray(node_ids)
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.crs = crs
+        self._tree = shapely.STRtree(shapely.points(self.xs, self.ys))
+
+    @classmethod
+    def from_graph(cls, osm_network, crs=None):
+        """
+        Build an index from the 'x'/'y' attributes of every node in a graph, projected to `crs` if given.
+        """
+        node_ids = list(osm_network.nodes)
+        xs = np.fromiter((osm_network.nodes[n]['x'] for n in node_ids), dtype=float, count=len(node_ids))
+        ys = np.fromiter((osm_network.nodes[n]['y'] for n in node_ids), dtype=float, count=len(node_ids))
+        if crs is not None:
+            xs, ys = project(xs, ys, crs)
+        return cls(node_ids, xs, ys, crs)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def query(self, xs, ys):
+        """
+        Find the nearest indexed node for each coordinate in a batch.
+
+        Parameters:
+        - xs (array-like): The x (longitude) coordinates to snap.
+        - ys (array-like): The y (latitude) coordinates to snap.
+
+        Returns:
+        - tuple: (positions, distances) arrays, where positions index into `node_ids`.
+          Distances are in metres with a projected `crs`, in degrees otherwise.
+        """
+        xs = np.atleast_1d(np.asarray(xs, dtype=float))
+        ys = np.atleast_1d(np.asarray(ys, dtype=float))
+        positions = np.full(len(xs), -1, dtype=np.int64)
+        distances = np.full(len(xs), np.inf)
+        if len(self) == 0 or len(xs) == 0:
+            return positions, distances
+        if self.crs is not None:
+            xs, ys = project(xs, ys, self.crs)
+
+        (input_idx, tree_idx), dist = self._tree.query_nearest(
+            shapely.points(xs, ys), return_distance=True, all_matches=False
+        )
+        positions[input_idx] = tree_idx
+        distances[input_idx] = dist
+        return positions, distances
+
+
+class RoadGraph:
+    """
+    Immutable, array-backed (CSR) road network.
+
+    Node i has coordinates (x[i], y[i]) and original id node_ids[i]. Its outgoing edges are
+    targets[offsets[i]:offsets[i + 1]] with the matching entries of `weights`.
+
+    Parameters:
+    - node_ids (array-like): The original graph node ids.
+    - x (array-like): Node x (longitude) coordinates.
+    - y (array-like): Node y (latitude) coordinates.
+    - offsets (array-like): CSR row offsets, of length number_of_nodes + 1.
+    - targets (array-like): CSR edge targets (node positions).
+    - weights (array-like): CSR edge weights (edge 'length').
+    - speeds (array-like): CSR edge speeds in km/h. Defaults to DEFAULT_SPEED_KPH everywhere.
+    - crs (str): The projected CRS used for metric work (snapping, buffers). Defaults to the
+      UTM zone at the centre of the nodes.
+    """
+
+    def __init__(self, node_ids, x, y, offsets, targets, weights, speeds=None, crs=None):
+        self.node_ids = _read_only(np.asanyarray(node_ids))
+        self.x = _read_only(np.asanyarray(x, dtype=float))
+        self.y = _read_only(np.asanyarray(y, dtype=float))
+        self.offsets = _read_only(np.asanyarray(offsets, dtype=np.int64))
+        self.targets = _read_only(np.asanyarray(targets, dtype=np.int64))
+        self.weights = _read_only(np.asanyarray(weights, dtype=float))
+        if speeds is None:
+            speeds = np.full(len(self.targets), DEFAULT_SPEED_KPH)
+        self.speeds = _read_only(np.asanyarray(speeds, dtype=float))
+        self._crs = crs
+        self._travel_times = None
+        self._edge_sources = None
+        self._projected = None
+        self._node_index = None
+
+    @classmethod
+    def from_networkx(cls, osm_network, weight='length'):
+        """
+        Build a RoadGraph from a networkx graph (such as the one returned by `load_or_download_graph`).
+
+        Undirected graphs get an edge in each direction; parallel edges are all kept, and
+        edges without the weight attribute count as 1 (as in networkx). Edge speeds come from
+        'speed_kph' or 'maxspeed', falling back to HIGHWAY_SPEEDS_KPH by 'highway' type.
+
+        Parameters:
+        - osm_network (networkx.Graph): The road network graph with 'x'/'y' node attributes.
+        - weight (str): The edge attribute used as the edge weight.
+
+        Returns:
+        - RoadGraph: The array-backed graph.
+        """
+        node_ids = list(osm_network.nodes)
+        n = len(node_ids)
+        positions = {node: i for i, node in enumerate(node_ids)}
+        x = np.fromiter((osm_network.nodes[node]['x'] for node in node_ids), dtype=float, count=n)
+        y = np.fromiter((osm_network.nodes[node]['y'] for node in node_ids), dtype=float, count=n)
+
+        sources, targets, weights, maxspeeds, highways = [], [], [], [], []
+        for u, v, data in osm_network.edges(data=True):
+            sources.append(positions[u])
+            targets.append(positions[v])
+            weights.append(data.get(weight, 1))
+            maxspeeds.append(_tag_value(data.get('speed_kph', data.get('maxspeed'))))
+            highways.append(_tag_value(data.get('highway')))
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=float)
+        speeds = edge_speeds_kph(maxspeeds, highways)
+        if not osm_network.is_directed():
+            sources, targets = np.concatenate((sources, targets)), np.concatenate((targets, sources))
+            weights = np.concatenate((weights, weights))
+            speeds = np.concatenate((speeds, speeds))
+
+        return cls.from_edges(node_ids, x, y, sources, targets, weights, speeds)
+
+    @classmethod
+    def from_edges(cls, node_ids, x, y, sources, targets, weights, speeds=None, crs=None):
+        """
+        Build a RoadGraph from parallel edge arrays (source position, target position, weight, speed).
+        """
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+        if speeds is not None:
+            speeds = np.asarray(speeds)[order]
+        return cls(node_ids, x, y, offsets, np.asarray(targets)[order], np.asarray(weights)[order], speeds, crs)
+
+    def with_crs(self, crs):
+        """
+        The same graph (sharing its arrays) with another projected CRS for metric work.
+        """
+        if crs == self.crs:
+            return self
+        road_graph = RoadGraph(self.node_ids, self.x, self.y, self.offsets, self.targets, self.weights, self.speeds, crs)
+        road_graph._travel_times, road_graph._edge_sources = self._travel_times, self._edge_sources
+        return road_graph
+
+    def save(self, directory):
+        """
+        Write the graph arrays to a directory as .npy files, and its CRS to graph.json.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            array = getattr(self, name)
+            np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=array.dtype == object)
+        # A graph whose CRS was never set or used saves null and picks its UTM zone again on load
+        with open(os.path.join(directory, _ATTRIBUTES_NAME), 'w') as f:
+            json.dump({'crs': self._crs}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Read a graph written by `save`.
+
+        Parameters:
+        - directory (str): The directory holding the .npy files.
+        - mmap (bool): Memory-map the arrays instead of reading them into memory.
+          Node ids that are not numeric are always read in full.
+
+        Returns:
+        - RoadGraph: The loaded graph.
+        """
+        arrays = {}
+        for name in _ARRAY_NAMES:
+            path = os.path.join(directory, f"{name}.npy")
+            try:
+                arrays[name] = np.load(path, mmap_mode='r' if mmap else None)
+            except ValueError:
+                # Object arrays (e.g. string node ids) are pickled and cannot be memory-mapped
+                arrays[name] = np.load(path, allow_pickle=True)
+        try:
+            with open(os.path.join(directory, _ATTRIBUTES_NAME), 'r') as f:
+                crs = json.load(f).get('crs')
+        except (OSError, ValueError):
+            # Graphs saved before the CRS was recorded
+            crs = None
+        return cls(**arrays, crs=crs)
+
+    def __getstate__(self):
+        # The spatial index is cheap to rebuild and is not sent to worker processes
+        state = self.__dict__.copy()
+        state['_node_index'] = None
+        return state
+
+    @property
+    def edge_sources(self):
+        """
+        Source node position of every CSR edge (the expanded form of `offsets`), built on first use.
+        """
+        if self._edge_sources is None:
+            counts = np.diff(self.offsets)
+            self._edge_sources = _read_only(np.repeat(np.arange(len(counts), dtype=np.int64), counts))
+        return self._edge_sources
+
+    @property
+    def crs(self):
+        """
+        The projected CRS used for metric work: the one given, or the local UTM zone (None for an empty graph).
+        """
+        if self._crs is None:
+            self._crs = local_crs(self.x, self.y)
+        return self._crs
+
+    @property
+    def projected_xy(self):
+        """
+        Node coordinates in `crs` (metres), projected once per graph in one bulk transform.
+        """
+        if self._projected is None:
+            xs, ys = project(self.x, self.y, self.crs) if self.crs is not None else (self.x, self.y)
+            self._projected = (_read_only(np.asarray(xs)), _read_only(np.asarray(ys)))
+        return self._projected
+
+    @property
+    def travel_times(self):
+        """
+        Edge travel times in seconds (length in metres over speed), computed once per graph.
+        """
+        if self._travel_times is None:
+            self._travel_times = _read_only(self.weights / (self.speeds / 3.6))
+        return self._travel_times
+
+    def edge_weights(self, weight='length'):
+        """
+        Return the CSR edge weight array for 'length' or 'travel_time'.
+        """
+        if weight == 'length':
+            return self.weights
+        if weight == 'travel_time':
+            return self.travel_times
+        raise ValueError(f"Unsupported edge weight: {weight}")
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.targets)
+
+    @property
+    def node_index(self):
+        """
+        Spatial index over the projected node coordinates, built on first use.
+        """
+        if self._node_index is None:
+            self._node_index = NodeIndex(self.node_ids, *self.projected_xy, crs=self.crs)
+        return self._node_index
+
+    def bounded_dijkstra(self, source, cutoff, weight='length'):
+        """
+        Shortest-path search from one node, bounded by a maximum distance.
+
+        Parameters:
+        - source (int): The position (not the id) of the source node.
+        - cutoff (float): The maximum path weight to explore.
+        - weight (str): 'length' (metres) or 'travel_time' (seconds).
+
+        Returns:
+        - tuple: (indices, distances) arrays of the reached node positions and their distances.
+        """
+        offsets, targets, weights = self.offsets, self.targets, self.edge_weights(weight)
+        best = {source: 0.0}
+        settled = {}
+        heap = [(0.0, source)]
+        while heap:
+            dist, node = heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = dist
+            start, end = offsets[node], offsets[node + 1]
+            for neighbour, edge_weight in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                candidate = dist + edge_weight
+                if candidate <= cutoff and candidate < best.get(neighbour, np.inf):
+                    best[neighbour] = candidate
+                    heappush(heap, (candidate, neighbour))
+
+        indices = np.fromiter(settled.keys(), dtype=np.int64, count=len(settled))
+        distances = np.fromiter(settled.values(), dtype=float, count=len(settled))
+        return indices, distances
+
+    def multi_source_dijkstra(self, sources, cutoff=np.inf, weight='length'):
+        """
+        One shortest-path search from many nodes at once, giving every node its distance to the
+        nearest source and which source that is.
+
+        Parameters:
+        - sources (array-like): Positions of the source nodes. Negative positions are skipped;
+          when several sources share a node, the first one counts.
+        - cutoff (float): The maximum path weight to explore.
+        - weight (str): 'length' (metres) or 'travel_time' (seconds).
+
+        Returns:
+        - tuple: (distances, nearest) arrays over all nodes, where `nearest` indexes into
+          `sources`. Nodes not reached within the cutoff have distance inf and nearest -1.
+        """
+        n = self.number_of_nodes()
+        offsets, targets = self.offsets.tolist(), self.targets.tolist()
+        weights = self.edge_weights(weight).tolist()
+        best = [np.inf] * n
+        nearest = [-1] * n
+        heap = []
+        for k, source in enumerate(np.asarray(sources, dtype=np.int64).tolist()):
+            if source >= 0 and nearest[source] < 0:
+                best[source] = 0.0
+                nearest[source] = k
+                heap.append((0.0, source))
+        heapify(heap)
+
+        settled = bytearray(n)
+        while heap:
+            dist, node = heappop(heap)
+            if settled[node]:
+                continue
+            settled[node] = 1
+            origin = nearest[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = dist + weights[edge]
+                if candidate <= cutoff and candidate < best[neighbour]:
+                    best[neighbour] = candidate
+                    nearest[neighbour] = origin
+                    heappush(heap, (candidate, neighbour))
+
+        return np.asarray(best, dtype=float), np.asarray(nearest, dtype=np.int64)
+
+
+def as_road_graph(osm_network):
+    """
+    Return the RoadGraph for a network, converting (and caching) networkx graphs on first use.
+    """
+    if isinstance(osm_network, RoadGraph):
+        return osm_network
+    road_graph = _ROAD_GRAPH_CACHE.get(osm_network)
+    if road_graph is None:
+        with trace_span('graph.convert', rows_in=osm_network.number_of_edges()) as span:
+            road_graph = RoadGraph.from_networkx(osm_network)
+            span.set(rows_out=road_graph.number_of_edges())
+        _ROAD_GRAPH_CACHE[osm_network] = road_graph
+    return road_graph
@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import shapely
+from shapely.geometry import Point, mapping
+from shapely.geometry.base import BaseGeometry
+from geoprocessing_pipeline.road_graph import RoadGraph
+from geoprocessing_pipeline.data_loader import ChunkedData, collect_records, graph_with_crs, load_data_by_type, load_road_graph
+from geoprocessing_pipeline.pipeline import compile_pipeline, split_graph_steps
+from geoprocessing_pipeline.isochrone import generate_isochrone, generate_time_isochrone, POLYGON_METHODS
+from geoprocessing_pipeline.filter import filter_points_by_expression
+from geoprocessing_pipeline.lazy import is_geodataframe
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Compiled pipeline plans kept per distinct request configuration
+PLAN_CACHE_SIZE = 128
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 415: 'Unsupported Media Type', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """
+    A request the server rejects, with the HTTP status to answer it with.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def to_jsonable(value):
+    """
+    Convert a step output into JSON-serializable data.
+
+    Geometries become GeoJSON geometries, GeoDataFrames GeoJSON FeatureCollections, lazy
+    streams are read in full, and graphs are summarised by their size.
+    """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, np.generic):
+        return to_jsonable(value.item())
+    if isinstance(value, np.ndarray):
+        return [to_jsonable(v) for v in value.tolist()]
+    if isinstance(value, BaseGeometry):
+        return mapping(value) if not value.is_empty else None
+    if is_geodataframe(value):
+        return json.loads(value.to_json(na='null', to_wgs84=value.crs is not None))
+    if isinstance(value, ChunkedData):
+        return to_jsonable(collect_records(value))
+    if isinstance(value, RoadGraph) or hasattr(value, 'number_of_edges'):
+        return {'type': 'graph', 'nodes': value.number_of_nodes(), 'edges': value.number_of_edges()}
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return repr(value)
+
+
+class LatencyStats:
+    """
+    Request latencies per route over a sliding window, with percentiles.
+    """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.latencies = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds):
+        with self._lock:
+            self.latencies.setdefault(route, deque(maxlen=self.window)).append(seconds)
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def summary(self):
+        """
+        Count, and p50/p90/p99/max latency in milliseconds over the window, per route.
+        """
+        with self._lock:
+            snapshot = {route: np.asarray(values) for route, values in self.latencies.items()}
+            counts = dict(self.counts)
+        summary = {}
+        for route, values in snapshot.items():
+            p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+            summary[route] = {'count': counts[route], 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+                              'max_ms': float(values.max()) * 1000}
+        return summary
+
+
+class PipelineServer:
+    """
+    Local HTTP service answering pipeline, isochrone and filter requests against warm graphs.
+
+    Graphs are loaded once, up front, and shared by every request. Requests are parsed on the
+    asyncio event loop; the work itself runs on a bounded thread pool, and requests arriving
+    while `max_queue` are already waiting for a worker are turned away with 503. The worker
+    threads bound how many requests run at once, but do not add CPU parallelism: graph searches
+    are Python code holding the GIL, so only the numpy and shapely work of requests overlaps.
+
+    Requests cannot reach other files: POST bodies must be sent as application/json (so a web
+    page cannot post them as a simple cross-origin form), loadOsmData steps must name a
+    preloaded graph, and loadData steps may only read files under `data_dirs`.
+
+    Routes:
+    - POST /pipeline: a pipeline configuration; returns its results. loadOsmData steps use the
+      preloaded graph their filepath names, in the CRS they ask for; tiling is not needed for
+      graphs already in memory and is ignored.
+    - POST /isochrone: {"lon", "lat", "distance"} or {"lon", "lat", "time", "unit"}, plus optional
+      "graph", "method", "buffer" and "maxVertices"; returns a GeoJSON geometry.
+    - POST /filter: {"points" or "dataType"} with an "expression" and/or an "isochrone"
+      (a /isochrone request); returns the matching points.
+    - GET /stats: latency percentiles per route, queue depth and the loaded graphs.
+    - GET /health
+
+    Parameters:
+    - graphs (dict): Preloaded graphs by name. Names are matched against request "graph" values
+      and loadOsmData filepaths.
+    - workers (int): Size of the worker thread pool.
+    - max_queue (int): Requests allowed to wait for a worker before new ones are rejected.
+    - data_dirs (list): Directories whose files loadData steps may read; none by default.
+    """
+
+    def __init__(self, graphs=None, workers=4, max_queue=64, data_dirs=None):
+        self.graphs = dict(graphs or {})
+        self.data_dirs = [os.path.realpath(directory) for directory in data_dirs or []]
+        # Preloaded graphs set to other CRSs, by (graph name, crs)
+        self._projected = {}
+        self._projected_lock = threading.Lock()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.latency = LatencyStats()
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+        self.started = time.time()
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline-worker')
+        self._routes = {
+            ('POST', '/pipeline'): self.run_pipeline,
+            ('POST', '/isochrone'): self.run_isochrone,
+            ('POST', '/filter'): self.run_filter,
+            ('GET', '/stats'): lambda body: self.stats(),
+            ('GET', '/health'): lambda body: {'status': 'ok'},
+        }
+
+    @classmethod
+    def from_graph_files(cls, graph_files, **kwargs):
+        """
+        Create a server with graphs preloaded from GraphML files through their binary cache.
+
+        Parameters:
+        - graph_files (dict): GraphML filepath -> address to download it from if it is missing.
+        """
+        server = cls(**kwargs)
+        for filepath, address in graph_files.items():
+            server.graphs[filepath] = load_road_graph(address, filepath)
+        return server
+
+    def _graph(self, name):
+        if name is None:
+            if len(self.graphs) != 1:
+                raise RequestError(400, f"Name a graph, one of: {', '.join(self.graphs) or 'none loaded'}")
+            return next(iter(self.graphs.values()))
+        for key in (name, os.path.abspath(name)):
+            if key in self.graphs:
+                return self.graphs[key]
+        matches = [graph for path, graph in self.graphs.items() if os.path.abspath(path) == os.path.abspath(name)]
+        if matches:
+            return matches[0]
+        raise RequestError(404, f"Unknown graph: {name}")
+
+    def _check_config(self, config):
+        # Reject steps that would download graphs or read files the server was not given
+        for func in config['functions']:
+            if not isinstance(func, dict):
+                continue
+            name = func.get('functionName')
+            step_input = func.get('input') or {}
+            if name == 'loadOsmData':
+                filepath = (step_input.get('data') or {}).get('filepath')
+                try:
+                    self._graph(filepath)
+                except RequestError:
+                    raise RequestError(403, f"loadOsmData must name a preloaded graph, one of: {', '.join(self.graphs) or 'none loaded'}")
+            elif name == 'loadData':
+                path = (step_input.get('parameters') or {}).get('path')
+                if path is not None and not self._readable(path):
+                    raise RequestError(403, f"loadData may not read {path}")
+
+    def _readable(self, path):
+        path = os.path.realpath(str(path))
+        return any(os.path.commonpath([path, directory]) == directory for directory in self.data_dirs)
+
+    def _plan(self, config):
+        # Compiled plans are reused for repeated configurations
+        key = json.dumps(config, sort_keys=True)
+        with self._plans_lock:
+            if key in self._plans:
+                self._plans.move_to_end(key)
+                return self._plans[key]
+        remaining, graph_specs = split_graph_steps(config)
+        plan = compile_pipeline(remaining, inputs=list(graph_specs))
+        with self._plans_lock:
+            self._plans[key] = (plan, graph_specs)
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan, graph_specs
+
+    def run_pipeline(self, config):
+        if not isinstance(config, dict) or 'functions' not in config:
+            raise RequestError(400, "Expected a pipeline configuration with 'functions'")
+        self._check_config(config)
+        plan, graph_specs = self._plan(config)
+        inputs = {}
+        for name, (_, filepath, _, _, crs) in graph_specs.items():
+            inputs[name] = self._graph_in_crs(filepath, crs)
+        return to_jsonable(plan.run(inputs, release=True))
+
+    def _graph_in_crs(self, name, crs):
+        # Preloaded graphs work in their local UTM zone; another CRS gets a copy sharing their arrays
+        graph = self._graph(name)
+        if crs is None:
+            return graph
+        key = (id(graph), crs)
+        with self._projected_lock:
+            if key not in self._projected:
+                self._projected[key] = graph_with_crs(graph, crs)
+            return self._projected[key]
+
+    def _isochrone(self, request):
+        graph = self._graph(request.get('graph'))
+        method = {'convexHull': 'convex_hull', 'edgeBuffer': 'edge_buffer'}.get(request.get('method'), request.get('method', 'convex_hull'))
+        if method not in POLYGON_METHODS:
+            raise RequestError(400, f"Unsupported polygon method: {request['method']}")
+        options = {'method': method, 'buffer': request.get('buffer', 25.0), 'max_vertices': request.get('maxVertices', 500)}
+        point = Point(float(request['lon']), float(request['lat']))
+        if 'time' in request:
+            return generate_time_isochrone(graph, point, request['time'], request.get('unit', 'minutes'), **options)
+        return generate_isochrone(graph, point, request['distance'], **options)
+
+    def run_isochrone(self, request):
+        return to_jsonable(self._isochrone(request))
+
+    def run_filter(self, request):
+        points = request['points'] if 'points' in request else load_data_by_type(request['dataType'])
+        if 'expression' in request:
+            points = filter_points_by_expression(points, request['expression'])
+        if 'isochrone' in request:
+            polygon = self._isochrone(request['isochrone'])
+            if polygon is None:
+                return []
+            # Keep the point records (and their attributes) rather than bare geometries
+            coords = np.asarray([p['coordinates'][:2] for p in points], dtype=float).reshape(-1, 2)
+            shapely.prepare(polygon)
+            inside = shapely.contains_xy(polygon, coords[:, 0], coords[:, 1])
+            points = [p for p, keep in zip(points, inside) if keep]
+        return to_jsonable(points)
+
+    def stats(self):
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'workers': self.workers,
+            'queue_depth': self.queued,
+            'running': self.running,
+            'rejected': self.rejected,
+            'graphs': {name: {'nodes': g.number_of_nodes(), 'edges': g.number_of_edges()} for name, g in self.graphs.items()},
+            'compiled_plans': len(self._plans),
+            'latency': self.latency.summary(),
+        }
+
+    def _call(self, handler, body):
+        # Runs on a worker thread
+        with self._counts_lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return handler(body)
+        finally:
+            with self._counts_lock:
+                self.running -= 1
+
+    async def dispatch(self, method, path, body, content_type='application/json'):
+        """
+        Route one request and return (status, JSON-serializable response).
+        """
+        path = path.split('?', 1)[0]
+        handler = self._routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self._routes):
+                raise RequestError(405, f"{method} is not allowed on {path}")
+            raise RequestError(404, f"No route for {path}")
+        if path in ('/stats', '/health'):
+            return handler(None)
+
+        if content_type.split(';', 1)[0].strip().lower() != 'application/json':
+            raise RequestError(415, "Requests must be sent with Content-Type: application/json")
+        try:
+            request = json.loads(body or b'null')
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        with self._counts_lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise RequestError(503, "Too many queued requests")
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, self._call, handler, request)
+        except (KeyError, TypeError) as e:
+            raise RequestError(400, f"Malformed request: missing or invalid {e}")
+        except ValueError as e:
+            raise RequestError(400, str(e))
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve HTTP/1.1 requests on one connection, keeping it open unless asked to close.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                length = int(headers.get('content-length', 0) or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'Request body too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                start = time.perf_counter()
+                try:
+                    status, response = 200, await self.dispatch(method, target, body, headers.get('content-type', ''))
+                except RequestError as e:
+                    status, response = e.status, {'error': str(e)}
+                except Exception as e:  # A failing request must not take the server down
+                    status, response = 500, {'error': f"{type(e).__name__}: {e}"}
+                self.latency.record(target.split('?', 1)[0], time.perf_counter() - start)
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, response, keep_alive):
+        payload = json.dumps(response).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def start(self, host='127.0.0.1', port=8080, unix_socket=None):
+        """
+        Start listening on a TCP port (or a Unix socket path) and return the asyncio server.
+        """
+        if unix_socket:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_forever(self, host='127.0.0.1', port=8080, unix_socket=None):
+        server = await self.start(host, port, unix_socket)
+        address = unix_socket or '%s:%s' % server.sockets[0].getsockname()[:2]
+        print(f"Serving on {address} with {self.workers} workers, graphs: {', '.join(self.graphs) or 'none'}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,293 @@
+from functools import partial
+from collections import namedtuple
+from shapely.geometry import Point
+from geoprocessing_pipeline.data_loader import load_or_download_graph, load_road_graph, load_tiled_graph, graph_with_crs, load_data_by_type, load_data_from_file, map_records, collect_records, ChunkedData
+from geoprocessing_pipeline.isochrone import generate_isochrone, generate_isochrones, generate_isochrone_bands, generate_time_isochrone, network_accessibility, polygon_options, TIME_UNITS
+from geoprocessing_pipeline.tiles import DEFAULT_TILE_SIZE
+from geoprocessing_pipeline.geometry_ops import buffer_features, clip_features, DEFAULT_QUAD_SEGS
+from geoprocessing_pipeline.filter import filter_points_by_complex_query, filter_points_by_expression, filter_points_within_isochrone, build_attribute_index, spatial_join_points
+
+# Step implementations by functionName. Each entry compiles one step configuration into a CompiledStep.
+STEP_REGISTRY = {}
+
+# A validated step with its parameters resolved.
+# `run(inputs, context)` takes the referenced outputs by name and a per-run context dictionary.
+# `sources` lists the files the step reads, so cached results can be invalidated when they change.
+CompiledStep = namedtuple('CompiledStep', ['function_name', 'output', 'references', 'run', 'sources'], defaults=((),))
+
+
+def register_step(function_name):
+    """
+    Decorator registering the compile function of a pipeline step under its functionName.
+    """
+    def decorator(compile_func):
+        STEP_REGISTRY[function_name] = compile_func
+        return compile_func
+    return decorator
+
+
+def compile_step(func):
+    """
+    Validate one step configuration and resolve its parameters.
+
+    Parameters:
+    - func (dict): One entry of the configuration's 'functions' list.
+
+    Returns:
+    - CompiledStep: The compiled step.
+
+    Raises:
+    - ValueError: If the step is unknown or its configuration is incomplete.
+    """
+    function_name = func.get('functionName')
+    if function_name not in STEP_REGISTRY:
+        raise ValueError(f"Unknown pipeline step: {function_name}")
+    if 'output' not in func:
+        raise ValueError(f"Step '{function_name}' has no output name")
+    try:
+        return STEP_REGISTRY[function_name](func)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid configuration for step '{function_name}' ({func['output']}): missing or malformed {e}") from e
+
+
+def _coordinates(parameters):
+    return Point(parameters['coordinates']['lon'], parameters['coordinates']['lat'])
+
+
+def _print_polygon_stats(polygon_stats):
+    if polygon_stats:
+        print(f"Isochrone polygon: {polygon_stats['vertices']} vertices in {polygon_stats['seconds']:.3f}s")
+
+
+# Load or download OSM data
+def _run_load_osm_data(inputs, context, address, filepath, binary_cache, tile_size=None, crs=None):
+    if tile_size:
+        graph = load_tiled_graph(address, filepath, tile_size)
+    elif binary_cache:
+        graph = load_road_graph(address, filepath)
+    else:
+        graph = load_or_download_graph(address, filepath)
+    return graph_with_crs(graph, crs)
+
+def graph_tile_size(parameters):
+    """
+    Tile size of a loadOsmData step: 'tileSize' degrees, or the default with just "tiled": true.
+    None loads the whole graph.
+    """
+    if 'tileSize' in parameters:
+        return float(parameters['tileSize'])
+    return DEFAULT_TILE_SIZE if parameters.get('tiled') else None
+
+@register_step("loadOsmData")
+def compile_load_osm_data(func):
+    data = func['input']['data']
+    parameters = func['input'].get('parameters', {})
+    run = partial(_run_load_osm_data, address=data['address'], filepath=data['filepath'],
+                  binary_cache=bool(parameters.get('binaryCache')), tile_size=graph_tile_size(parameters),
+                  crs=parameters.get('crs'))
+    return CompiledStep("loadOsmData", func['output'], [], run, [data['filepath']])
+
+
+# Generate Isochrone
+def _run_generate_isochrone(inputs, context, data, point, distance, options):
+    polygon_stats = {}
+    output = generate_isochrone(inputs[data], point, distance, stats=polygon_stats, **options)
+    _print_polygon_stats(polygon_stats)
+    return output
+
+@register_step("generateIsochrone")
+def compile_generate_isochrone(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    run = partial(_run_generate_isochrone, data=data, point=_coordinates(parameters),
+                  distance=parameters['distance'], options=polygon_options(parameters))
+    return CompiledStep("generateIsochrone", func['output'], [data], run)
+
+
+# Generate an isochrone for a travel-time budget
+def _run_generate_time_isochrone(inputs, context, data, point, time_budget, unit, options):
+    polygon_stats = {}
+    output = generate_time_isochrone(inputs[data], point, time_budget, unit, stats=polygon_stats, **options)
+    _print_polygon_stats(polygon_stats)
+    return output
+
+@register_step("generateTimeBasedIsochrone")
+def compile_generate_time_isochrone(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    run = partial(_run_generate_time_isochrone, data=data, point=_coordinates(parameters), time_budget=parameters['time'],
+                  unit=parameters.get('unit', 'minutes'), options=polygon_options(parameters))
+    return CompiledStep("generateTimeBasedIsochrone", func['output'], [data], run)
+
+
+# Generate nested isochrone bands for several distances from one search
+def _run_generate_isochrone_bands(inputs, context, data, point, distances, options):
+    return generate_isochrone_bands(inputs[data], point, distances, **options)
+
+@register_step("generateIsochroneBands")
+def compile_generate_isochrone_bands(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    run = partial(_run_generate_isochrone_bands, data=data, point=_coordinates(parameters),
+                  distances=list(parameters['distances']), options=polygon_options(parameters))
+    return CompiledStep("generateIsochroneBands", func['output'], [data], run)
+
+
+# Generate Isochrones for many origins at once
+def _run_generate_isochrones(inputs, context, data, origins, distance, workers, options):
+    if isinstance(origins, str):
+        origins = collect_records(inputs[origins])  # Origins loaded by an earlier step
+    return generate_isochrones(inputs[data], origins, distance, workers=workers, **options)
+
+@register_step("generateIsochrones")
+def compile_generate_isochrones(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    origins = parameters['origins']
+    references = [data, origins] if isinstance(origins, str) else [data]
+    run = partial(_run_generate_isochrones, data=data, origins=origins, distance=parameters['distance'],
+                  workers=parameters.get('workers', 1), options=polygon_options(parameters))
+    return CompiledStep("generateIsochrones", func['output'], references, run)
+
+
+# Load generic data (points, buildings, etc.)
+def _run_load_data(inputs, context, data_type, path, file_options):
+    if path is not None:
+        # Read from disk, optionally as a stream of fixed-size batches
+        return load_data_from_file(path, **file_options)
+    return load_data_by_type(data_type)
+
+@register_step("loadData")
+def compile_load_data(func):
+    parameters = func['input']['parameters']
+    path = parameters.get('path')
+    file_options = {
+        'file_format': parameters.get('format'),
+        'chunk_size': parameters.get('chunkSize'),
+        'bbox': parameters.get('bbox'),
+        'lon_column': parameters.get('lonColumn', 'lon'),
+        'lat_column': parameters.get('latColumn', 'lat'),
+    }
+    data_type = parameters['dataType'] if path is None else parameters.get('dataType')
+    run = partial(_run_load_data, data_type=data_type, path=path, file_options=file_options)
+    return CompiledStep("loadData", func['output'], [], run, [path] if path is not None else [])
+
+
+# Filter Points by Complex Query (e.g., height > 20)
+def _run_filter_by_complex_query(inputs, context, data, attribute, operator, value):
+    return map_records(inputs[data], partial(filter_points_by_complex_query, attribute=attribute, operator=operator, value=value))
+
+# Filter Points by a compound expression (and/or/not, between, in, is null)
+def _run_filter_by_expression(inputs, context, data, output_name, expression, use_index):
+    points = inputs[data]
+    if not isinstance(points, list):
+        # Streamed batches are filtered one at a time, by scanning
+        return map_records(points, partial(filter_points_by_expression, expression=expression))
+
+    index = None
+    if use_index:
+        # One sorted attribute index per dataset, shared by every query on it
+        attribute_indexes = context.setdefault('attribute_indexes', {})
+        if data not in attribute_indexes or attribute_indexes[data].points is not points:
+            attribute_indexes[data] = build_attribute_index(points)
+        index = attribute_indexes[data]
+    filter_stats = {}
+    output = filter_points_by_expression(points, expression, index=index, stats=filter_stats)
+    print(f"Filter {output_name}: {len(output)} of {len(points)} points, index used: {filter_stats['index_used']}")
+    return output
+
+@register_step("filterPoints")
+def compile_filter_points(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    filter_type = parameters['filterType']
+    if filter_type == "byComplexQuery":
+        criteria = parameters['filterCriteria']
+        run = partial(_run_filter_by_complex_query, data=data, attribute=criteria['attribute'],
+                      operator=criteria['operator'], value=criteria['value'])
+    elif filter_type == "byExpression":
+        run = partial(_run_filter_by_expression, data=data, output_name=func['output'],
+                      expression=parameters['expression'], use_index=parameters.get('useIndex', True))
+    else:
+        raise ValueError(f"Unknown filterType for filterPoints: {filter_type}")
+    return CompiledStep("filterPoints", func['output'], [data], run)
+
+
+# Check which points are within the isochrone
+def _run_check_points_within_isochrone(inputs, context, data, isochrone):
+    return map_records(inputs[data], partial(filter_points_within_isochrone, isochrone_polygon=inputs[isochrone]))
+
+@register_step("checkPointsWithinIsochrone")
+def compile_check_points_within_isochrone(func):
+    data, isochrone = func['input']['data'], func['input']['parameters']['isochrone']
+    run = partial(_run_check_points_within_isochrone, data=data, isochrone=isochrone)
+    return CompiledStep("checkPointsWithinIsochrone", func['output'], [data, isochrone], run)
+
+
+# Match points against many isochrones at once
+def _run_join_points_to_isochrones(inputs, context, data, isochrones, chunk_size):
+    # Points are matched independently, so a stream is joined batch by batch
+    return spatial_join_points(inputs[data], inputs[isochrones], chunk_size=chunk_size)
+
+@register_step("joinPointsToIsochrones")
+def compile_join_points_to_isochrones(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    run = partial(_run_join_points_to_isochrones, data=data, isochrones=parameters['isochrones'],
+                  chunk_size=parameters.get('chunkSize', 100000))
+    return CompiledStep("joinPointsToIsochrones", func['output'], [data, parameters['isochrones']], run)
+
+
+# Network distance from every point to its nearest facility, from one multi-source search
+def _run_network_accessibility(inputs, context, data, network, facilities, max_distance, weight):
+    if isinstance(facilities, str):
+        facilities = collect_records(inputs[facilities])  # Facilities loaded by an earlier step
+    return network_accessibility(inputs[network], inputs[data], facilities, max_distance, weight)
+
+@register_step("networkAccessibility")
+def compile_network_accessibility(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    network, facilities = parameters['network'], parameters['facilities']
+    if 'maxTime' in parameters:
+        unit = parameters.get('unit', 'minutes')
+        if unit not in TIME_UNITS:
+            raise ValueError(f"Unsupported time unit: {unit}")
+        max_distance, weight = parameters['maxTime'] * TIME_UNITS[unit], 'travel_time'
+    else:
+        max_distance, weight = parameters.get('maxDistance'), 'length'
+    references = [data, network, facilities] if isinstance(facilities, str) else [data, network]
+    run = partial(_run_network_accessibility, data=data, network=network, facilities=facilities,
+                  max_distance=max_distance, weight=weight)
+    return CompiledStep("networkAccessibility", func['output'], references, run)
+
+
+# Buffer every feature by a distance in metres
+def _run_create_buffer(inputs, context, data, distance, dissolve, quad_segs, crs):
+    return buffer_features(inputs[data], distance, dissolve=dissolve, quad_segs=quad_segs, crs=crs)
+
+@register_step("createBuffer")
+def compile_create_buffer(func):
+    data, parameters = func['input']['data'], func['input']['parameters']
+    quad_segs = int(parameters.get('quadSegs', DEFAULT_QUAD_SEGS))
+    if quad_segs < 1:
+        raise ValueError(f"quadSegs must be at least 1 for createBuffer ({func['output']})")
+    run = partial(_run_create_buffer, data=data, distance=float(parameters['distance']),
+                  dissolve=bool(parameters.get('dissolve', False)), quad_segs=quad_segs, crs=parameters.get('crs'))
+    return CompiledStep("createBuffer", func['output'], [data], run)
+
+
+# Clip features to a mask
+def _run_clip(inputs, context, data, mask, output_name):
+    clip_stats = {}
+    output = clip_features(inputs[data], inputs[mask], stats=clip_stats)
+    if not isinstance(output, ChunkedData):
+        print(f"Clip {output_name}: {clip_stats['kept']} of {clip_stats['features']} features kept, "
+              f"{clip_stats['cut']} cut at the mask boundary")
+    return output
+
+@register_step("clip")
+def compile_clip(func):
+    data = func['input']['data']
+    if isinstance(data, list):
+        # "data": [features, mask]
+        if len(data) != 2:
+            raise ValueError(f"clip ({func['output']}) takes [features, mask] as its data")
+        data, mask = data
+    else:
+        mask = func['input']['parameters']['mask']
+    run = partial(_run_clip, data=data, mask=mask, output_name=func['output'])
+    return CompiledStep("clip", func['output'], [data, mask], run)
@@ -0,0 +1,102 @@
+# Deterministic synthetic road grids and point clouds, so tests and benchmarks run offline
+import numpy as np
+from geoprocessing_pipeline.road_graph import RoadGraph, HIGHWAY_SPEEDS_KPH
+from geoprocessing_pipeline.crs import project, utm_crs
+
+# Synthetic data is centred on the coordinates the shipped configs query
+CENTRE_LON, CENTRE_LAT = 85.318, 27.712
+
+# Grid spacing in degrees of latitude (about 100 m)
+GRID_SPACING = 0.0009
+
+# Highway types drawn for synthetic edges, and how often
+_HIGHWAYS = ('residential', 'tertiary', 'secondary', 'primary')
+_HIGHWAY_WEIGHTS = (0.7, 0.15, 0.1, 0.05)
+
+
+def grid_shape(n_nodes):
+    """
+    Rows and columns of the most square grid with at least `n_nodes` nodes.
+    """
+    cols = int(np.ceil(np.sqrt(n_nodes)))
+    rows = int(np.ceil(n_nodes / cols))
+    return rows, cols
+
+
+def grid_road_graph(n_nodes, seed=0, drop_fraction=0.1):
+    """
+    Deterministic road grid with jittered nodes, a few missing streets and mixed road types.
+
+    Parameters:
+    - n_nodes (int): Approximate number of nodes (rounded up to a full grid).
+    - seed (int): Random seed; the same seed always gives the same graph.
+    - drop_fraction (float): Fraction of streets removed, so searches are not on a perfect lattice.
+
+    Returns:
+    - RoadGraph: The graph, with every street in both directions and lengths in metres.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = grid_shape(n_nodes)
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    lon_spacing = GRID_SPACING / np.cos(np.radians(CENTRE_LAT))
+    jitter = rng.uniform(-0.2, 0.2, size=(2, rows * cols))
+    x = CENTRE_LON + (col - cols / 2 + jitter[0]) * lon_spacing
+    y = CENTRE_LAT + (row - rows / 2 + jitter[1]) * GRID_SPACING
+
+    node = np.arange(rows * cols).reshape(rows, cols)
+    horizontal = np.column_stack((node[:, :-1].ravel(), node[:, 1:].ravel()))
+    vertical = np.column_stack((node[:-1, :].ravel(), node[1:, :].ravel()))
+    streets = np.concatenate((horizontal, vertical))
+    streets = streets[rng.random(len(streets)) >= drop_fraction]
+
+    # Street lengths measured in the local UTM zone
+    crs = utm_crs(CENTRE_LON, CENTRE_LAT)
+    px, py = project(x, y, crs)
+    lengths = np.hypot(px[streets[:, 1]] - px[streets[:, 0]], py[streets[:, 1]] - py[streets[:, 0]])
+    highways = rng.choice(len(_HIGHWAYS), size=len(streets), p=_HIGHWAY_WEIGHTS)
+    speeds = np.array([HIGHWAY_SPEEDS_KPH[h] for h in _HIGHWAYS])[highways]
+
+    sources = np.concatenate((streets[:, 0], streets[:, 1]))
+    targets = np.concatenate((streets[:, 1], streets[:, 0]))
+    return RoadGraph.from_edges(
+        np.arange(rows * cols, dtype=np.int64), x, y, sources, targets,
+        np.concatenate((lengths, lengths)), np.concatenate((speeds, speeds)), crs,
+    )
+
+
+def to_networkx(road_graph):
+    """
+    The networkx MultiDiGraph of a RoadGraph, with the node and edge attributes osmnx graphs carry.
+    """
+    import networkx as nx
+
+    G = nx.MultiDiGraph()
+    G.add_nodes_from((int(n), {'x': float(x), 'y': float(y)})
+                     for n, x, y in zip(road_graph.node_ids, road_graph.x, road_graph.y))
+    sources = road_graph.node_ids[road_graph.edge_sources]
+    targets = road_graph.node_ids[road_graph.targets]
+    G.add_edges_from((int(u), int(v), {'length': float(w), 'maxspeed': str(int(s))})
+                     for u, v, w, s in zip(sources, targets, road_graph.weights, road_graph.speeds))
+    return G
+
+
+def point_cloud(n_points, road_graph=None, seed=0):
+    """
+    Deterministic point records in the same shape `load_data_by_type('points')` returns.
+
+    Points are spread uniformly over the graph's extent (or around the centre without one),
+    with integer heights between 0 and 100.
+
+    Returns:
+    - list: Dictionaries with 'id', 'coordinates' [lon, lat] and 'height'.
+    """
+    rng = np.random.default_rng(seed + 1)
+    if road_graph is not None and road_graph.number_of_nodes():
+        minx, maxx = float(road_graph.x.min()), float(road_graph.x.max())
+        miny, maxy = float(road_graph.y.min()), float(road_graph.y.max())
+    else:
+        minx, maxx, miny, maxy = CENTRE_LON - 0.05, CENTRE_LON + 0.05, CENTRE_LAT - 0.05, CENTRE_LAT + 0.05
+    xs = rng.uniform(minx, maxx, n_points).tolist()
+    ys = rng.uniform(miny, maxy, n_points).tolist()
+    heights = rng.integers(0, 101, n_points).tolist()
+    return [{"id": i, "coordinates": [xs[i], ys[i]], "height": heights[i]} for i in range(n_points)]
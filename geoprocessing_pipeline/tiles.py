@@ -0,0 +1,300 @@
+import os
+import json
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from geoprocessing_pipeline.road_graph import RoadGraph
+from geoprocessing_pipeline.tracing import trace_span
+from geoprocessing_pipeline.crs import degree_bounds
+
+# Bump when the on-disk tile layout changes, so old tile stores are rebuilt
+TILE_STORE_VERSION = 2
+
+TILE_INDEX_NAME = 'tiles.json'
+
+# Tile width and height in degrees (about 5.5 km of latitude)
+DEFAULT_TILE_SIZE = 0.05
+
+# Arrays written per tile. Node positions are the nodes' positions in the whole graph, and
+# edges refer to their endpoints by those positions, so edges crossing into another tile
+# (boundary edges) resolve once that tile is loaded too.
+_TILE_ARRAYS = ('positions', 'node_ids', 'x', 'y', 'edge_sources', 'edge_targets', 'weights', 'speeds')
+
+# Searches can only reach nodes within their cutoff in straight-line distance; the margin
+# absorbs the scale error of the projection away from the centre of its zone
+_RADIUS_MARGIN = 1.05
+
+
+def _tile_name(col, row):
+    return f"{col}_{row}"
+
+
+def build_tile_store(road_graph, directory, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Partition a road graph into square tiles on disk, with an index of the tiles.
+
+    Each tile holds its nodes and their outgoing edges. Edges whose target lies in another tile
+    are boundary edges; the index records how many each tile has and which tiles they lead to.
+
+    Parameters:
+    - road_graph (RoadGraph): The whole graph.
+    - directory (str): Where to write the tiles and the tiles.json index.
+    - tile_size (float): Tile width and height in degrees.
+
+    Returns:
+    - dict: The tile index.
+    """
+    if tile_size <= 0:
+        raise ValueError(f"Tile size must be positive: {tile_size}")
+    cols = np.floor(np.asarray(road_graph.x) / tile_size).astype(np.int64)
+    rows = np.floor(np.asarray(road_graph.y) / tile_size).astype(np.int64)
+    cells, node_tile = np.unique(np.column_stack((cols, rows)), axis=0, return_inverse=True)
+    node_tile = node_tile.ravel()
+
+    sources, targets = road_graph.edge_sources, np.asarray(road_graph.targets)
+    edge_tile = node_tile[sources]
+    node_order = np.argsort(node_tile, kind='stable')
+    node_bounds = np.searchsorted(node_tile[node_order], np.arange(len(cells) + 1))
+    edge_order = np.argsort(edge_tile, kind='stable')
+    edge_bounds = np.searchsorted(edge_tile[edge_order], np.arange(len(cells) + 1))
+
+    os.makedirs(directory, exist_ok=True)
+    tiles = {}
+    for t, (col, row) in enumerate(cells.tolist()):
+        nodes = node_order[node_bounds[t]:node_bounds[t + 1]]
+        edges = edge_order[edge_bounds[t]:edge_bounds[t + 1]]
+        arrays = {
+            'positions': nodes.astype(np.int64),
+            'node_ids': np.asarray(road_graph.node_ids)[nodes],
+            'x': np.asarray(road_graph.x)[nodes],
+            'y': np.asarray(road_graph.y)[nodes],
+            'edge_sources': sources[edges],
+            'edge_targets': targets[edges],
+            'weights': np.asarray(road_graph.weights)[edges],
+            'speeds': np.asarray(road_graph.speeds)[edges],
+        }
+        name = _tile_name(col, row)
+        tile_dir = os.path.join(directory, name)
+        os.makedirs(tile_dir, exist_ok=True)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tile_dir, f"{array_name}.npy"), array, allow_pickle=array.dtype == object)
+
+        crossing = node_tile[arrays['edge_targets']] != t
+        neighbours = np.unique(node_tile[arrays['edge_targets'][crossing]])
+        tiles[name] = {
+            'col': col,
+            'row': row,
+            'bounds': [float(arrays['x'].min()), float(arrays['y'].min()), float(arrays['x'].max()), float(arrays['y'].max())],
+            'nodes': len(nodes),
+            'edges': len(edges),
+            'boundary_edges': int(crossing.sum()),
+            'neighbours': [_tile_name(*cells[n].tolist()) for n in neighbours],
+        }
+
+    index = {
+        'version': TILE_STORE_VERSION,
+        'tile_size': tile_size,
+        'nodes': road_graph.number_of_nodes(),
+        'edges': road_graph.number_of_edges(),
+        'max_speed_kph': float(np.max(road_graph.speeds)) if road_graph.number_of_edges() else 0.0,
+        'crs': road_graph.crs,
+        'tiles': tiles,
+    }
+    with open(os.path.join(directory, TILE_INDEX_NAME), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def read_tile_index(directory):
+    """
+    The tiles.json index of a tile store, or None if it is missing, unreadable or outdated.
+    """
+    try:
+        with open(os.path.join(directory, TILE_INDEX_NAME), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == TILE_STORE_VERSION else None
+
+
+class TiledGraphStore:
+    """
+    A road graph stored as spatial tiles, loading only the tiles a query can reach.
+
+    Searches bounded by a network distance cannot leave the circle of that radius around
+    their origin, so `region_graph` assembles just the tiles overlapping those circles.
+    Boundary edges into tiles that are not loaded are dropped; they lead beyond the search.
+
+    Parameters:
+    - directory (str): A directory written by `build_tile_store`.
+    - max_cached_regions (int): Assembled region graphs kept for reuse by later queries.
+    - crs (str): The projected CRS for metric work, shared by every region graph. Defaults to
+      the one recorded when the store was built (the UTM zone at the centre of the graph).
+    """
+
+    def __init__(self, directory, max_cached_regions=8, crs=None):
+        index = read_tile_index(directory)
+        if index is None:
+            raise ValueError(f"Not a tile store: {directory}")
+        self.directory = directory
+        self.index = index
+        self.tile_size = index['tile_size']
+        self.crs = crs or index['crs']
+        self.max_cached_regions = max_cached_regions
+        self._grid = {(tile['col'], tile['row']): name for name, tile in index['tiles'].items()}
+        self._regions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def with_crs(self, crs):
+        """
+        The same store with another projected CRS for its region graphs.
+        """
+        if crs == self.crs:
+            return self
+        return TiledGraphStore(self.directory, self.max_cached_regions, crs)
+
+    def __repr__(self):
+        return f"TiledGraphStore({self.directory!r}, {len(self._grid)} tiles, {self.index['nodes']} nodes)"
+
+    def __getstate__(self):
+        # Assembled regions are rebuilt from the tiles rather than sent to other processes
+        state = self.__dict__.copy()
+        del state['_regions'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._regions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reach_metres(self, cutoff, weight='length'):
+        """
+        The straight-line distance a search bounded by `cutoff` can cover, in metres.
+        """
+        if weight == 'length':
+            return cutoff
+        if weight == 'travel_time':
+            return cutoff * self.index['max_speed_kph'] / 3.6
+        raise ValueError(f"Unsupported edge weight: {weight}")
+
+    def tiles_near(self, xs, ys, radius):
+        """
+        Names of the tiles within `radius` metres of any of the given coordinates.
+        """
+        if self.crs is None:
+            return []
+        minx, miny, maxx, maxy = degree_bounds(xs, ys, radius * _RADIUS_MARGIN, self.crs)
+        col_lo = np.floor(minx / self.tile_size).astype(np.int64)
+        col_hi = np.floor(maxx / self.tile_size).astype(np.int64)
+        row_lo = np.floor(miny / self.tile_size).astype(np.int64)
+        row_hi = np.floor(maxy / self.tile_size).astype(np.int64)
+
+        names = set()
+        for c0, c1, r0, r1 in zip(col_lo.tolist(), col_hi.tolist(), row_lo.tolist(), row_hi.tolist()):
+            if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self._grid):
+                # Larger than the whole store: test the stored tiles instead of every cell
+                names.update(name for (c, r), name in self._grid.items() if c0 <= c <= c1 and r0 <= r <= r1)
+                continue
+            for c in range(c0, c1 + 1):
+                for r in range(r0, r1 + 1):
+                    name = self._grid.get((c, r))
+                    if name is not None:
+                        names.add(name)
+        return sorted(names)
+
+    def _cell_keys(self, cols, rows):
+        # One integer per grid cell, for vectorized membership tests
+        return (np.asarray(cols, dtype=np.int64) << 32) | (np.asarray(rows, dtype=np.int64) & 0xFFFFFFFF)
+
+    def covers(self, names, xs, ys):
+        """
+        Whether each coordinate lies in one of the tiles `names` or in a cell without a tile.
+
+        Coordinates in other tiles may be nearer to nodes that a graph of `names` lacks.
+        """
+        cols = np.floor(np.asarray(xs, dtype=float) / self.tile_size)
+        rows = np.floor(np.asarray(ys, dtype=float) / self.tile_size)
+        keys = self._cell_keys(cols, rows)
+        tiles = self.index['tiles']
+        stored = self._cell_keys([tile['col'] for tile in tiles.values()], [tile['row'] for tile in tiles.values()])
+        loaded = self._cell_keys([tiles[name]['col'] for name in names], [tiles[name]['row'] for name in names])
+        return np.isin(keys, loaded) | ~np.isin(keys, stored)
+
+    def _read_tile(self, name):
+        tile_dir = os.path.join(self.directory, name)
+        arrays = {}
+        for array_name in _TILE_ARRAYS:
+            path = os.path.join(tile_dir, f"{array_name}.npy")
+            try:
+                arrays[array_name] = np.load(path, mmap_mode='r')
+            except ValueError:
+                arrays[array_name] = np.load(path, allow_pickle=True)
+        return arrays
+
+    def load_tiles(self, names):
+        """
+        Assemble the graph of a set of tiles, keeping the edges between loaded nodes.
+
+        Returns:
+        - RoadGraph: The graph of the tiles' nodes.
+        """
+        with trace_span('tiles.load', rows_in=len(names)) as span:
+            tiles = [self._read_tile(name) for name in names]
+            if not tiles:
+                return RoadGraph.from_edges(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0),
+                                            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0),
+                                            crs=self.crs)
+            joined = {name: np.concatenate([tile[name] for tile in tiles]) for name in _TILE_ARRAYS}
+            order = np.argsort(joined['positions'], kind='stable')
+            positions = joined['positions'][order]
+
+            # Map whole-graph positions to positions in this graph, dropping edges to unloaded tiles
+            targets = np.searchsorted(positions, joined['edge_targets'])
+            loaded = targets < len(positions)
+            loaded[loaded] = positions[targets[loaded]] == joined['edge_targets'][loaded]
+            sources = np.searchsorted(positions, joined['edge_sources'][loaded])
+            graph = RoadGraph.from_edges(
+                joined['node_ids'][order], joined['x'][order], joined['y'][order],
+                sources, targets[loaded], joined['weights'][loaded], joined['speeds'][loaded], crs=self.crs,
+            )
+            span.set(rows_out=graph.number_of_edges(), nodes=graph.number_of_nodes())
+        return graph
+
+    def region_graph(self, xs, ys, radius):
+        """
+        The graph of the tiles within `radius` metres of the given coordinates.
+
+        The most recently assembled regions are kept, so repeated queries around the same
+        places reuse the graph (and its spatial index).
+        """
+        names = tuple(self.tiles_near(xs, ys, radius))
+        with self._lock:
+            graph = self._regions.get(names)
+            if graph is not None:
+                self._regions.move_to_end(names)
+                return graph
+        graph = self.load_tiles(names)
+        with self._lock:
+            self._regions[names] = graph
+            while len(self._regions) > self.max_cached_regions:
+                self._regions.popitem(last=False)
+        return graph
+
+
+def write_tile_store(road_graph, directory, tile_size=DEFAULT_TILE_SIZE, meta=None):
+    """
+    Build a tile store in a temporary directory and swap it in, so readers never see a partial store.
+
+    Parameters:
+    - meta (dict): Optional source stamp written to the store's meta.json.
+    """
+    tmp_dir = f"{directory}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    build_tile_store(road_graph, tmp_dir, tile_size)
+    if meta is not None:
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return TiledGraphStore(directory)
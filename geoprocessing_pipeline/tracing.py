@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The tracer spans are recorded into, if any. Unset, trace_span() does nothing.
+_current_tracer = contextvars.ContextVar('geoprocessing_tracer', default=None)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process and its finished worker processes, in bytes.
+
+    Returns None where the resource module is unavailable (e.g. on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+def row_count(value):
+    """
+    Number of rows (records, features, geometries) in a step input or output, or None if unknown.
+
+    Lazy streams are not counted, as that would read them.
+    """
+    if value is None or isinstance(value, (str, bytes, dict)):
+        return None
+    if hasattr(value, 'geom_type') and not hasattr(value, '__len__'):
+        return 1  # A single shapely geometry
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+class Span:
+    """
+    One timed phase. Use `set` to attach row counts or other details while it is open.
+    """
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.rows_in = None
+        self.rows_out = None
+
+    def set(self, rows_in=None, rows_out=None, **args):
+        if rows_in is not None:
+            self.rows_in = rows_in
+        if rows_out is not None:
+            self.rows_out = rows_out
+        self.args.update(args)
+
+
+class _NullSpan:
+    # Stands in for a span when no tracer is active
+    def set(self, rows_in=None, rows_out=None, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Records wall time, CPU time, peak RSS growth and row counts of pipeline steps and the phases
+    inside them.
+
+    Spans are recorded by `trace_span` while the tracer is active (see `activate`). A tracer can
+    be sent to worker processes; spans they record come back with `take_spans` and are merged
+    with `add_spans`. Times are taken from the monotonic clock, shared by processes on one host.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes start with no spans of their own
+        return {'spans': []}
+
+    def __setstate__(self, state):
+        self.spans = state['spans']
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """
+        Make this the tracer `trace_span` records into, for the current thread or task.
+        """
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    @contextmanager
+    def span(self, name, category='phase', rows_in=None, **args):
+        """
+        Time a block of code.
+
+        Parameters:
+        - name (str): The span's name, e.g. 'isochrone.search'.
+        - category (str): 'step' for pipeline steps, 'phase' for work inside them.
+        - rows_in (int): Optional input row count, when known up front.
+        - args: Extra details stored with the span.
+
+        Yields:
+        - Span: Call its `set` method to record rows_in / rows_out.
+        """
+        span = Span(name, category, args)
+        span.rows_in = rows_in
+        rss_before = peak_rss_bytes()
+        cpu_start = time.thread_time()
+        start_ns = time.monotonic_ns()
+        try:
+            yield span
+        finally:
+            end_ns = time.monotonic_ns()
+            cpu_seconds = time.thread_time() - cpu_start
+            rss_after = peak_rss_bytes()
+            record = {
+                'name': name,
+                'category': category,
+                'start_us': start_ns // 1000,
+                'wall_seconds': (end_ns - start_ns) / 1e9,
+                'cpu_seconds': cpu_seconds,
+                'peak_rss_delta_bytes': rss_after - rss_before if rss_before is not None else None,
+                'rows_in': span.rows_in,
+                'rows_out': span.rows_out,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': span.args,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def take_spans(self):
+        """
+        Remove and return the recorded spans.
+        """
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def add_spans(self, spans):
+        """
+        Merge spans recorded elsewhere, e.g. by a worker process.
+        """
+        with self._lock:
+            self.spans.extend(spans)
+
+    def to_json(self):
+        """
+        The recorded spans, ordered by start time.
+        """
+        return {'spans': sorted(self.spans, key=lambda span: span['start_us'])}
+
+    def to_chrome_trace(self):
+        """
+        The recorded spans as Chrome trace events, for chrome://tracing or Perfetto.
+        """
+        events = []
+        for span in sorted(self.spans, key=lambda span: span['start_us']):
+            args = dict(span['args'])
+            for field in ('cpu_seconds', 'peak_rss_delta_bytes', 'rows_in', 'rows_out'):
+                if span[field] is not None:
+                    args[field] = span[field]
+            events.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': span['start_us'],
+                'dur': max(int(span['wall_seconds'] * 1e6), 1),
+                'pid': span['pid'],
+                'tid': span['tid'],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2, default=str)
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary(self, category='step'):
+        """
+        One line per span of a category: wall and CPU time, peak RSS growth and row counts.
+        """
+        lines = []
+        for span in self.to_json()['spans']:
+            if span['category'] != category:
+                continue
+            rss = span['peak_rss_delta_bytes']
+            rss_text = f"{rss / 1024 ** 2:+.1f} MiB" if rss is not None else "n/a"
+            lines.append(f"{span['name']}: {span['wall_seconds']:.3f}s wall, {span['cpu_seconds']:.3f}s CPU, "
+                         f"peak RSS {rss_text}, rows {span['rows_in']} -> {span['rows_out']}")
+        return "\n".join(lines)
+
+
+def current_tracer():
+    """
+    The active tracer, or None.
+    """
+    return _current_tracer.get()
+
+
+def trace_span(name, **args):
+    """
+    Time a block of code into the active tracer; does nothing when no tracer is active.
+
+    Usage:
+        with trace_span('isochrone.search') as span:
+            ...
+            span.set(rows_out=len(reached))
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, **args)
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import shapely
+from shapely.geometry.base import BaseGeometry
+from geoprocessing_pipeline.road_graph import RoadGraph, as_road_graph
+from geoprocessing_pipeline.data_loader import ChunkedData, records_to_frame
+from geoprocessing_pipeline.lazy import is_geodataframe
+from geoprocessing_pipeline.tiles import TiledGraphStore
+
+# Rows converted and written at a time, so large outputs are never copied as a whole
+DEFAULT_CHUNK_SIZE = 100000
+
+MANIFEST_NAME = 'manifest.json'
+
+VECTOR_EXTENSIONS = {'parquet': '.parquet', 'flatgeobuf': '.fgb'}
+
+
+def default_vector_format():
+    """
+    'parquet' (GeoParquet) when pyarrow is installed, otherwise 'flatgeobuf' (written with pyogrio).
+    """
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return 'flatgeobuf'
+    return 'parquet'
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def _is_feature_records(value):
+    return isinstance(value, list) and bool(value) and isinstance(value[0], dict) and \
+        ('coordinates' in value[0] or isinstance(value[0].get('geometry'), BaseGeometry))
+
+
+def _frame_chunks(value, chunk_size):
+    """
+    GeoDataFrame chunks of at most `chunk_size` rows from a GeoDataFrame, a list of records
+    or a ChunkedData stream of either.
+    """
+    batches = value if isinstance(value, ChunkedData) else [value]
+    for batch in batches:
+        for start in range(0, len(batch), chunk_size):
+            chunk = batch.iloc[start:start + chunk_size] if is_geodataframe(batch) else records_to_frame(batch[start:start + chunk_size])
+            if len(chunk):
+                yield chunk
+
+
+def _align(chunk, columns):
+    # Later chunks are written with the columns of the first one
+    geometry = chunk.geometry.name
+    return chunk.reindex(columns=[c for c in columns if c != geometry] + [geometry])
+
+
+def _arrow_schema(attributes):
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(attributes, preserve_index=False)
+    # A column without values in the first chunk has no type yet; later values are written as strings
+    return pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field for field in schema])
+
+
+def _arrow_table(attributes, schema):
+    """
+    An Arrow table of a chunk's attributes with the types of the first chunk, e.g. an int column
+    that gained nulls (and became float in pandas) is cast back to int.
+    """
+    import pyarrow as pa
+
+    columns = []
+    for field in schema:
+        try:
+            column = pa.array(attributes[field.name], from_pandas=True)
+            columns.append(column.cast(field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Column '{field.name}' cannot be written as {field.type}, its type in the first chunk: {e}") from e
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _write_geoparquet(chunks, path):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, rows = None, 0
+    try:
+        for chunk in chunks:
+            geometry = chunk.geometry
+            if writer is None:
+                columns = list(chunk.columns)
+                attributes = pd.DataFrame(chunk.drop(columns=geometry.name))
+                base_schema = _arrow_schema(attributes)
+                column_metadata = {'encoding': 'WKB', 'geometry_types': []}
+                if geometry.crs is not None:
+                    column_metadata['crs'] = geometry.crs.to_json_dict()
+                geo = {'version': '1.0.0', 'primary_column': geometry.name, 'columns': {geometry.name: column_metadata}}
+                schema = base_schema.append(pa.field(geometry.name, pa.binary())).with_metadata({b'geo': json.dumps(geo).encode('utf-8')})
+                writer = pq.ParquetWriter(path, schema)
+            else:
+                chunk = _align(chunk, columns)
+                geometry = chunk.geometry
+                attributes = pd.DataFrame(chunk.drop(columns=geometry.name))
+            table = _arrow_table(attributes, base_schema)
+            table = table.append_column(geometry.name, pa.array(shapely.to_wkb(geometry.values), type=pa.binary()))
+            writer.write_table(table.replace_schema_metadata(schema.metadata))
+            rows += len(chunk)
+    except BaseException:
+        # A chunk that cannot be written leaves no truncated file behind
+        if writer is not None:
+            writer.close()
+            os.remove(path)
+        raise
+    if writer is not None:
+        writer.close()
+    return rows
+
+
+def _write_flatgeobuf(chunks, path):
+    import pyogrio
+
+    # Without the packed spatial index, features keep their order and chunks are appended as
+    # they come rather than re-sorted on every append
+    options = {'SPATIAL_INDEX': 'NO'}
+    columns, rows = None, 0
+    try:
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+                # Streams may mix geometry types from chunk to chunk
+                pyogrio.write_dataframe(chunk, path, driver='FlatGeobuf', geometry_type='Unknown', layer_options=options)
+            else:
+                pyogrio.write_dataframe(_align(chunk, columns), path, driver='FlatGeobuf', append=True, layer_options=options)
+            rows += len(chunk)
+    except BaseException:
+        # A chunk that cannot be written leaves no truncated file behind
+        if columns is not None and os.path.exists(path):
+            os.remove(path)
+        raise
+    return rows
+
+
+def write_vector(value, path, vector_format='parquet', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write vector features chunk by chunk as GeoParquet or FlatGeobuf.
+
+    A ChunkedData stream is written batch by batch, so it never has to fit in memory; a
+    GeoDataFrame or list of records is converted `chunk_size` rows at a time.
+
+    Parameters:
+    - value: A GeoDataFrame, a list of point/feature records, or a ChunkedData stream of either.
+    - path (str): The output file.
+    - vector_format (str): 'parquet' or 'flatgeobuf'.
+    - chunk_size (int): Rows converted and written at a time.
+
+    Returns:
+    - int: The number of rows written. Nothing is written for an empty value.
+    """
+    chunks = _frame_chunks(value, chunk_size)
+    if vector_format == 'parquet':
+        return _write_geoparquet(chunks, path)
+    if vector_format == 'flatgeobuf':
+        return _write_flatgeobuf(chunks, path)
+    raise ValueError(f"Unknown vector format: {vector_format}")
+
+
+def write_geometry(geometry, path):
+    """
+    Write a single geometry (e.g. an isochrone polygon) as WKB.
+    """
+    with open(path, 'wb') as f:
+        f.write(shapely.to_wkb(geometry))
+    return 0 if geometry.is_empty else 1
+
+
+def write_output(name, value, output_dir, vector_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write one pipeline output in the format that suits it.
+
+    - Road graphs (RoadGraph or networkx): a directory of .npy arrays, readable with RoadGraph.load.
+    - Tiled graph stores: a .json reference to the store's directory, which is not copied.
+    - Single geometries: a .wkb file.
+    - GeoDataFrames, point/feature records and ChunkedData streams: GeoParquet or FlatGeobuf.
+    - Anything else: JSON.
+
+    Returns:
+    - dict: The manifest entry: 'path' (relative to `output_dir`, None when nothing was written),
+      'format', 'rows', 'bytes' and 'seconds'.
+    """
+    vector_format = vector_format or default_vector_format()
+    start = time.perf_counter()
+    if isinstance(value, RoadGraph) or hasattr(value, 'number_of_edges'):
+        road_graph = as_road_graph(value)
+        filename, file_format = f"{name}.graph", 'road_graph'
+        road_graph.save(os.path.join(output_dir, filename))
+        rows = road_graph.number_of_edges()
+    elif isinstance(value, TiledGraphStore):
+        filename, file_format = f"{name}.json", 'tile_store'
+        with open(os.path.join(output_dir, filename), 'w') as f:
+            json.dump({'directory': os.path.abspath(value.directory), 'tile_size': value.tile_size,
+                       'tiles': len(value.index['tiles']), 'nodes': value.index['nodes']}, f)
+        rows = value.index['edges']
+    elif isinstance(value, BaseGeometry):
+        filename, file_format = f"{name}.wkb", 'wkb'
+        rows = write_geometry(value, os.path.join(output_dir, filename))
+    elif is_geodataframe(value) or isinstance(value, ChunkedData) or _is_feature_records(value):
+        filename, file_format = f"{name}{VECTOR_EXTENSIONS[vector_format]}", vector_format
+        rows = write_vector(value, os.path.join(output_dir, filename), vector_format, chunk_size)
+    else:
+        filename, file_format = f"{name}.json", 'json'
+        with open(os.path.join(output_dir, filename), 'w') as f:
+            json.dump(value, f, default=str)
+        rows = len(value) if isinstance(value, (list, dict)) else 1
+
+    # Empty vector outputs write no file
+    path = os.path.join(output_dir, filename)
+    written = os.path.exists(path)
+    return {
+        'path': filename if written else None,
+        'format': file_format,
+        'rows': rows,
+        'bytes': _path_size(path) if written else 0,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def write_results(results, output_dir, workers=4, vector_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write every pipeline output to `output_dir`, independent outputs in parallel, and record
+    them in a manifest.json.
+
+    Parameters:
+    - results (dict): The pipeline outputs by name.
+    - output_dir (str): The directory to write to (created if missing).
+    - workers (int): Outputs written at the same time.
+    - vector_format (str): 'parquet' or 'flatgeobuf'; by default GeoParquet when pyarrow is installed.
+    - chunk_size (int): Rows converted and written at a time.
+
+    Returns:
+    - dict: The manifest, with an entry per output under 'outputs'.
+    """
+    vector_format = vector_format or default_vector_format()
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {name: pool.submit(write_output, name, value, output_dir, vector_format, chunk_size)
+                   for name, value in results.items()}
+        outputs = {name: future.result() for name, future in futures.items()}
+
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'vector_format': vector_format,
+        'seconds': time.perf_counter() - start,
+        'outputs': outputs,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -1,109 +1,58 @@
 import sys
 import os
+import glob
 import json
 import time
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import shutil  # Added to delete the existing folder
-import geopandas as gpd
-import folium
-from folium.plugins import MarkerCluster
-from shapely.geometry import Point, Polygon
 from tqdm import tqdm
 
 # Add the project root to PYTHONPATH
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from geoprocessing_pipeline.data_loader import load_or_download_graph, load_data_by_type
-from geoprocessing_pipeline.isochrone import generate_isochrone
-from geoprocessing_pipeline.filter import filter_points_by_complex_query, filter_points_within_isochrone
+from geoprocessing_pipeline import pipeline
+from geoprocessing_pipeline.data_loader import GraphStore
+from geoprocessing_pipeline.cache import ResultCache, source_cache_key
+from geoprocessing_pipeline.pipeline import DeferredInput
+from geoprocessing_pipeline.tracing import Tracer
+from geoprocessing_pipeline.writers import write_results
 
 
-def handle_osm_network_dummy(osm_network, output_dir, name):
-    """
-    Dummy function to handle osmNetwork.
-    Currently passes without doing anything.
-    TODO: Implement proper handling of osmNetwork (e.g., save as GraphML or adjacency list).
-    """
-    print(f"Handling osmNetwork is a TODO for now: {name}")
-    pass  # Placeholder for future implementation
-
-
-import folium
-import geopandas as gpd
-from shapely.geometry import Point
-from folium.plugins import MarkerCluster
-
 def plot_generic_geometries(results, output_dir, query_name):
     """
     Walk through the results dictionary, detect geometries or coordinates, 
     and add them to a folium map as layers.
+
+    Each layer is serialized as a whole; large point layers are clustered or aggregated
+    (see `geoprocessing_pipeline.rendering`) so the map stays small enough to open.
     """
-    # Initialize a Folium map centered around a default point (Kathmandu)
-    folium_map = folium.Map(location=[27.712, 85.318], zoom_start=13)
-
-    # Dictionary for storing layers
-    layers = {}
-
-    # 1. Plot Isochrone Output as a GeoJson Layer
-    isochrone = results.get('isochroneOutput')
-    if isochrone and isinstance(isochrone, Point):
-        isochrone_layer = folium.FeatureGroup(name='Isochrone', show=True)
-        folium.GeoJson(
-            isochrone,
-            name="Isochrone",
-            style_function=lambda x: {'fillColor': 'blue', 'color': 'black', 'weight': 2, 'fillOpacity': 0.3}
-        ).add_to(isochrone_layer)
-        layers['Isochrone'] = isochrone_layer
-
-    # 2. Plot Points within Isochrone as a Marker Layer
-    points_within_isochrone = results.get('pointsWithinIsochrone', gpd.GeoDataFrame(geometry=[]))
-    if not points_within_isochrone.empty:
-        points_within_isochrone_layer = folium.FeatureGroup(name='Points Within Isochrone', show=True)
-        for _, row in points_within_isochrone.iterrows():
-            folium.Marker(
-                location=[row.geometry.y, row.geometry.x],
-                popup="Point within Isochrone"
-            ).add_to(points_within_isochrone_layer)
-        layers['PointsWithinIsochrone'] = points_within_isochrone_layer
-
-    # 3. Plot Filtered Points by Height
-    filtered_points_by_height = results.get('filteredPointsByHeight', [])
-    if filtered_points_by_height:
-        filtered_points_layer = folium.FeatureGroup(name='Filtered Points by Height', show=True)
-        for point in filtered_points_by_height:
-            coordinates = point.get('coordinates')
-            if coordinates and isinstance(coordinates, list) and len(coordinates) == 2:
-                folium.Marker(
-                    location=[coordinates[1], coordinates[0]],  # lat, lon order
-                    popup=f"ID: {point['id']}, Height: {point['height']}",
-                    icon=folium.Icon(color='red')
-                ).add_to(filtered_points_layer)
-        layers['FilteredPointsByHeight'] = filtered_points_layer
-
-    # Add each layer to the map
-    for layer_name, layer in layers.items():
-        layer.add_to(folium_map)
-
-    # Add Layer Control to the map
-    folium.LayerControl().add_to(folium_map)
-
-    # Save the map as an HTML file
+    # Imported here: folium is only needed once there are results to draw
+    from geoprocessing_pipeline.rendering import render_results_map
+
     map_filepath = os.path.join(output_dir, f"{query_name}_map.html")
-    folium_map.save(map_filepath)
-    print(f"Folium map saved as {map_filepath}")
+    layers = render_results_map(results, map_filepath)
+    print(f"Folium map saved as {map_filepath} ({', '.join(f'{name}: {mode}' for name, mode in layers.items()) or 'no layers'})")
 
 
-def process_and_save_results(query_name, results):
+def process_and_save_results(query_name, results, results_dir='results', write_workers=4):
     """
-    Processes the results from the pipeline and creates a folium map with all geometries found.
+    Processes the results from the pipeline: writes every output (see
+    `geoprocessing_pipeline.writers`) with a manifest.json, and creates a folium map with all
+    geometries found.
 
     Parameters:
     - query_name (str): The name for the results directory.
     - results (dict): The results returned from the pipeline.
+    - results_dir (str): The directory holding one results directory per query.
+    - write_workers (int): Outputs written at the same time.
+
+    Returns:
+    - str: The results directory of this query.
     """
-    
-    print(results)
     # Create output directory for this query
-    output_dir = os.path.join('results', query_name)
+    output_dir = os.path.join(results_dir, query_name)
 
     # Check if the output directory already exists, if so, delete it
     if os.path.exists(output_dir):
@@ -112,103 +61,173 @@ def process_and_save_results(query_name, results):
 
     os.makedirs(output_dir, exist_ok=True)
 
-    osm_network = results.get('osmNetwork', None)
-    if osm_network:
-        handle_osm_network_dummy(osm_network, output_dir, "osm_network")
+    manifest = write_results(results, output_dir, workers=write_workers)
+    for name, entry in manifest['outputs'].items():
+        print(f"  {name}: {entry['rows']} rows -> {entry['path'] or 'nothing written'} "
+              f"({entry['bytes'] / 1024:.1f} KiB, {entry['seconds']:.2f}s)")
 
     # Plot all geometries found in the results
     plot_generic_geometries(results, output_dir, query_name)
+    return output_dir
 
 
-def run_geoprocessing_pipeline(json_data):
+def run_geoprocessing_pipeline(json_data, workers=1, cache=None, stats=None, tracer=None, inputs=None, show_progress=True,
+                               release=True):
     """
-    Runs the geoprocessing pipeline based on a JSON configuration.
+    Runs the geoprocessing pipeline based on a JSON configuration, with a progress bar.
 
     Parameters:
     - json_data (dict): A dictionary representing the JSON configuration for the pipeline.
+    - workers (int): Maximum number of independent steps run at the same time.
+    - cache (ResultCache): Optional on-disk cache of step outputs reused across runs.
+    - stats (dict): Optional dictionary filled with peak memory figures.
+    - tracer (Tracer): Optional tracer recording per-step and per-phase timings.
+    - inputs (dict): Values the configuration reads without producing them, e.g. graphs, which may be
+      DeferredInputs loaded only if a step reading them misses the cache.
+    - show_progress (bool): Show a progress bar of the steps.
+    - release (bool): Drop every output that is not a final result as soon as no later step reads
+      it, and return only the results. The results are those listed under 'results' in the
+      configuration, else the outputs no step reads. Pass False to keep and return every output.
 
     Returns:
     - dict: A dictionary containing the outputs of the various pipeline steps.
     """
-    outputs = {}
-
-    for func in tqdm(json_data['functions'], desc="Running Pipeline", unit="function"):
-        func_name = func['functionName']
-
-        # Load or download OSM data
-        if func_name == "loadOsmData":
-            address = func['input']['data']['address']
-            filepath = func['input']['data']['filepath']
-            output = load_or_download_graph(address, filepath)
-        
-        # Generate Isochrone
-        elif func_name == "generateIsochrone":
-            osm_network = outputs[func['input']['data']]
-            distance = func['input']['parameters']['distance']
-            lat = func['input']['parameters']['coordinates']['lat']
-            lon = func['input']['parameters']['coordinates']['lon']
-            isochrone_point = Point(lon, lat)
-            output = generate_isochrone(osm_network, isochrone_point, distance)
-        
-        # Load generic data (points, buildings, etc.)
-        elif func_name == "loadData":
-            data_type = func['input']['parameters']['dataType']
-            output = load_data_by_type(data_type)
-        
-        # Filter Points by Complex Query (e.g., height > 20)
-        elif func_name == "filterPoints" and func['input']['parameters']['filterType'] == "byComplexQuery":
-            points = outputs[func['input']['data']]  # Use the points that were loaded earlier
-            attribute = func['input']['parameters']['filterCriteria']['attribute']
-            operator = func['input']['parameters']['filterCriteria']['operator']
-            value = func['input']['parameters']['filterCriteria']['value']
-            output = filter_points_by_complex_query(points, attribute, operator, value)
-        
-        # Check which points are within the isochrone
-        elif func_name == "checkPointsWithinIsochrone":
-            points = outputs[func['input']['data']]
-            isochrone_polygon = outputs[func['input']['parameters']['isochrone']]
-            output = filter_points_within_isochrone(points, isochrone_polygon)
-
-        # Store the output of this function in the outputs dictionary
-        outputs[func['output']] = output
-
-    return outputs
-
-
-def main():
-  
-    config_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'configs', 'filter_points.json'))
-    
-    print(f"Config file path: {config_file_path}")
-    
-    if not os.path.exists(config_file_path):
-        print(f"Error: The configuration file {config_file_path} does not exist.")
-        return
-
-    # Extract the configuration file name (without extension) to use as the query_name
-    config_filename = os.path.splitext(os.path.basename(config_file_path))[0]
-    query_name = config_filename  # Use the config file name as the query name
-    
-    start_time = time.time()
-
-    # Load the JSON configuration
+    plan = pipeline.compile_pipeline(json_data, inputs=list(inputs or {}))
+    with tqdm(total=len(plan), desc="Running Pipeline", unit="function", disable=not show_progress) as progress_bar:
+        return plan.run(inputs, workers=workers, cache=cache, stats=stats, tracer=tracer,
+                        release=release,
+                        progress=lambda func: progress_bar.update())
+
+
+def expand_config_paths(patterns):
+    """
+    Resolve config arguments (files, directories of .json files or glob patterns) into paths.
+
+    Raises:
+    - ValueError: If nothing matches an argument, or two configs would share a results directory.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.json')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern] if os.path.exists(pattern) else []
+        if not matches:
+            raise ValueError(f"No configuration files match {pattern}")
+        paths.extend(os.path.abspath(path) for path in matches if os.path.abspath(path) not in paths)
+
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Configurations would share results directories: {', '.join(duplicates)}")
+    return paths
+
+
+def run_config(config_path, graphs, results_dir='results', step_workers=1, cache=None, trace=False, show_progress=True,
+               keep_intermediate=False):
+    """
+    Run one configuration of a batch and save its results to `<results_dir>/<config name>`.
+    Only the final results are saved, unless `keep_intermediate` is set.
+
+    Returns:
+    - dict: A summary with the config 'name', 'status' ('ok' or 'failed'), 'error', 'seconds',
+      'steps' and 'peak_rss_bytes'.
+    """
+    query_name = os.path.splitext(os.path.basename(config_path))[0]
+    summary = {'name': query_name, 'status': 'ok', 'error': None, 'seconds': 0.0, 'steps': 0, 'peak_rss_bytes': None}
+    start_time = time.perf_counter()
     try:
-        with open(config_file_path, 'r') as f:
+        with open(config_path, 'r') as f:
             pipeline_config = json.load(f)
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {e}")
-        return
-    
-    # Run the geoprocessing pipeline
-    results = run_geoprocessing_pipeline(pipeline_config)
-
-    # Process and save the results
-    process_and_save_results(query_name, results)
+        config, graph_specs = pipeline.split_graph_steps(pipeline_config)
+        # Graphs are keyed by their load step and GraphML file, and loaded only when a step
+        # reading them misses the result cache
+        inputs = {name: DeferredInput(source_cache_key(['loadOsmData', *spec], [spec[1]]), partial(graphs.get, *spec))
+                  for name, spec in graph_specs.items()}
+        summary['steps'] = len(pipeline_config['functions'])
+
+        tracer = Tracer() if trace else None
+        stats = {}
+        results = run_geoprocessing_pipeline(config, workers=step_workers, cache=cache, stats=stats, tracer=tracer,
+                                             inputs=inputs, show_progress=show_progress, release=not keep_intermediate)
+        summary['peak_rss_bytes'] = stats['peak_rss_bytes']
+        output_dir = process_and_save_results(query_name, results, results_dir)
+
+        if tracer is not None:
+            tracer.write_json(os.path.join(output_dir, 'trace.json'))
+            tracer.write_chrome_trace(os.path.join(output_dir, 'trace.chrome.json'))
+            print(f"Step timings for {query_name} (trace written to {output_dir}):\n{tracer.summary()}")
+    except Exception as e:  # A failing config is reported in the summary and the batch goes on
+        summary['status'] = 'failed'
+        summary['error'] = f"{type(e).__name__}: {e}"
+        print(f"Error running {config_path}: {summary['error']}")
+    summary['seconds'] = time.perf_counter() - start_time
+    return summary
+
+
+def print_batch_summary(summaries, wall_seconds, graphs):
+    """
+    Print per-config timings, graph loads and the batch totals.
+    """
+    print("\nBatch summary:")
+    for summary in summaries:
+        detail = f"{summary['steps']} steps" if summary['status'] == 'ok' else summary['error']
+        print(f"  {summary['name']}: {summary['status']} in {summary['seconds']:.2f}s ({detail})")
+    for (filepath, binary_cache, tile_size, crs), seconds in graphs.load_seconds.items():
+        kind = f" (tiles of {tile_size} degrees)" if tile_size else " (binary cache)" if binary_cache else ""
+        kind += f" in {crs}" if crs else ""
+        print(f"  Graph {filepath}{kind}: loaded once in {seconds:.2f}s")
+
+    config_seconds = sum(summary['seconds'] for summary in summaries)
+    failed = sum(summary['status'] != 'ok' for summary in summaries)
+    print(f"  {len(summaries)} configs, {failed} failed: {wall_seconds:.2f}s wall, {config_seconds:.2f}s summed over configs")
+    peaks = [summary['peak_rss_bytes'] for summary in summaries if summary['peak_rss_bytes'] is not None]
+    if peaks:
+        print(f"  Peak memory: {max(peaks) / 1024 ** 2:.1f} MiB")
+
+
+def main(argv=None):
+    default_config = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'configs', 'filter_points.json'))
+    parser = argparse.ArgumentParser(description="Run one or more pipeline configurations.")
+    parser.add_argument('configs', nargs='*', default=[default_config],
+                        help="Config files, directories of configs or glob patterns (default: configs/filter_points.json)")
+    parser.add_argument('--workers', type=int, default=1, help="Configurations run at the same time (default 1)")
+    parser.add_argument('--step-workers', type=int, default=1, help="Steps of one configuration run at the same time (default 1)")
+    parser.add_argument('--results-dir', default='results', help="Where the results/<config> directories go (default results)")
+    parser.add_argument('--cache-dir', default=os.environ.get('PIPELINE_CACHE_DIR'),
+                        help="Reuse step outputs from earlier runs (default $PIPELINE_CACHE_DIR)")
+    parser.add_argument('--trace', action='store_true', default=bool(os.environ.get('PIPELINE_TRACE')),
+                        help="Write per-step traces next to the results (default $PIPELINE_TRACE)")
+    parser.add_argument('--keep-intermediate', action='store_true',
+                        help="Save every step output, not only the final results")
+    args = parser.parse_args(argv)
 
-    end_time = time.time()
-    total_time = end_time - start_time
-    print(f"\nTotal time taken for the entire pipeline: {total_time:.2f} seconds")
+    try:
+        config_paths = expand_config_paths(args.configs)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Running {len(config_paths)} configuration(s) with {args.workers} worker(s)")
+
+    cache = ResultCache(args.cache_dir) if args.cache_dir else None
+    graphs = GraphStore()
+    start_time = time.perf_counter()
+    run = partial(run_config, graphs=graphs, results_dir=args.results_dir, step_workers=args.step_workers,
+                  cache=cache, trace=args.trace, show_progress=args.workers <= 1, keep_intermediate=args.keep_intermediate)
+    if args.workers <= 1:
+        summaries = [run(path) for path in config_paths]
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            summaries = list(pool.map(run, config_paths))
+    wall_seconds = time.perf_counter() - start_time
+
+    if cache is not None:
+        print(f"Result cache ({args.cache_dir}):\n{cache.summary()}")
+    print_batch_summary(summaries, wall_seconds, graphs)
+    return 1 if any(summary['status'] != 'ok' for summary in summaries) else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
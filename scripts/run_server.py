@@ -0,0 +1,47 @@
+import sys
+import os
+import asyncio
+import argparse
+
+# Add the project root to PYTHONPATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from geoprocessing_pipeline.server import PipelineServer
+
+
+def parse_graph_argument(text):
+    """
+    Parse a --graph argument, 'PATH' or 'PATH=ADDRESS' (the place downloaded if PATH is missing).
+    """
+    filepath, _, address = text.partition('=')
+    return filepath, address or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve pipeline, isochrone and filter requests against graphs kept in memory.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on (default 8080)")
+    parser.add_argument('--unix-socket', help="Listen on this Unix socket path instead of a TCP port")
+    parser.add_argument('--graph', action='append', default=[], metavar='PATH[=ADDRESS]',
+                        help="GraphML file to preload, downloading ADDRESS if it is missing (repeatable)")
+    parser.add_argument('--data-dir', action='append', default=[], metavar='DIR',
+                        help="Directory whose files loadData steps may read (repeatable; none by default)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Requests processed at the same time, on threads sharing the GIL (default: CPU count)")
+    parser.add_argument('--max-queue', type=int, default=64, help="Requests waiting for a worker before new ones get 503 (default 64)")
+    args = parser.parse_args(argv)
+
+    graph_files = dict(parse_graph_argument(text) for text in args.graph)
+    server = PipelineServer.from_graph_files(graph_files, workers=args.workers, max_queue=args.max_queue,
+                                             data_dirs=args.data_dir)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
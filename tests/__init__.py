@@ -1,14 +1,36 @@
 # tests/__init__.py
 
+from .test_benchmarks import TestBenchmarks
+from .test_cache import TestCache
+from .test_crs import TestCrs
 from .test_data_loader import TestDataLoader
 from .test_filter import TestFilter
+from .test_geometry_ops import TestGeometryOps
 from .test_isochrone import TestIsochrone
 from .test_pipeline import TestPipeline
+from .test_rendering import TestRendering
+from .test_road_graph import TestRoadGraph
+from .test_server import TestServer
+from .test_startup import TestStartup
+from .test_tiles import TestTiles
+from .test_tracing import TestTracing
+from .test_writers import TestWriters
 
 __all__ = [
+    'TestBenchmarks',
+    'TestCache',
+    'TestCrs',
     'TestDataLoader',
     'TestFilter',
+    'TestGeometryOps',
     'TestIsochrone',
-    'TestPipeline'
+    'TestPipeline',
+    'TestRendering',
+    'TestRoadGraph',
+    'TestServer',
+    'TestStartup',
+    'TestTiles',
+    'TestTracing',
+    'TestWriters'
 ]
 
@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from geoprocessing_pipeline.synthetic import grid_road_graph, point_cloud, to_networkx
+from benchmarks.run_benchmarks import parse_scale, offline_config, run_benchmarks, compare_results
+from geoprocessing_pipeline.road_graph import RoadGraph
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_synthetic_data_is_deterministic(self):
+        """
+        Test that the same seed gives the same graph and points, and another seed does not.
+        """
+        graph = grid_road_graph(1000, seed=3)
+        self.assertEqual(graph.number_of_nodes(), 1024)
+        np.testing.assert_array_equal(graph.weights, grid_road_graph(1000, seed=3).weights)
+        self.assertFalse(np.array_equal(graph.x, grid_road_graph(1000, seed=4).x))
+        self.assertEqual(point_cloud(50, graph, seed=3), point_cloud(50, graph, seed=3))
+
+        # Every street runs both ways, at plausible block lengths
+        self.assertEqual(graph.number_of_edges() % 2, 0)
+        self.assertTrue(((graph.weights > 50) & (graph.weights < 160)).all())
+        self.assertEqual(RoadGraph.from_networkx(to_networkx(graph)).number_of_edges(), graph.number_of_edges())
+
+    def test_run_and_compare(self):
+        """
+        Test that results are keyed by case and scale, and slowdowns past the threshold are flagged.
+        """
+        self.assertEqual(parse_scale('10k'), 10000)
+        self.assertEqual(parse_scale('1M'), 1000000)
+        config, graphs, datasets = offline_config({"functions": [
+            {"functionName": "loadOsmData", "output": "osmNetwork"},
+            {"functionName": "loadData", "output": "points"},
+            {"functionName": "checkPointsWithinIsochrone", "output": "within"},
+        ]})
+        self.assertEqual((len(config['functions']), graphs, datasets), (1, ["osmNetwork"], ["points"]))
+
+        current = run_benchmarks([500], repeat=1, pattern='filter_points_by_*', log=lambda message: None)
+        self.assertEqual(set(current['results']), {'filter_points_by_complex_query@500', 'filter_points_by_expression@500'})
+
+        baseline = {'results': {key: dict(result, median_seconds=result['median_seconds'] / 2)
+                                for key, result in current['results'].items()}}
+        rows, regressions = compare_results(current, baseline, threshold=0.5)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(sorted(regressions), sorted(current['results']))
+        self.assertEqual(compare_results(current, current, threshold=0.5)[1], [])
+
+if __name__ == '__main__':
+    unittest.main()
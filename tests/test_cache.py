@@ -0,0 +1,170 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import networkx as nx
+import geopandas as gpd
+from shapely.geometry import Polygon
+from geoprocessing_pipeline.cache import ResultCache, source_cache_key
+from geoprocessing_pipeline.road_graph import RoadGraph
+from geoprocessing_pipeline.pipeline import compile_pipeline, DeferredInput
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_serializers_round_trip(self):
+        """
+        Test that graphs, polygons, GeoDataFrames and records read back equal to what was stored.
+        """
+        graph = nx.MultiDiGraph()
+        graph.add_node(1, x=85.31, y=27.71)
+        graph.add_node(2, x=85.32, y=27.71)
+        graph.add_edge(1, 2, length=980.0)
+        polygon = Polygon([(85.31, 27.71), (85.32, 27.71), (85.32, 27.72)])
+        frame = gpd.GeoDataFrame({'origin_id': [7, 8]}, geometry=[polygon, polygon.buffer(0.001)], crs="EPSG:4326")
+        records = [{"id": 1, "coordinates": [85.318, 27.712], "height": 15}]
+
+        cache = ResultCache(self.cache_dir)
+        for key, value in (('graph', RoadGraph.from_networkx(graph)), ('polygon', polygon), ('frame', frame), ('records', records)):
+            self.assertTrue(cache.put(key, value))
+
+        hit, road_graph = cache.get('graph')
+        self.assertTrue(hit)
+        self.assertIsInstance(road_graph, RoadGraph)
+        np.testing.assert_array_equal(road_graph.weights, [980.0])
+        self.assertTrue(cache.get('polygon')[1].equals(polygon))
+        stored_frame = cache.get('frame')[1]
+        self.assertEqual(stored_frame['origin_id'].tolist(), [7, 8])
+        self.assertTrue(stored_frame.geometry.geom_equals(frame.geometry).all())
+        self.assertEqual(stored_frame.crs, frame.crs)
+        self.assertEqual(cache.get('records')[1], records)
+        self.assertEqual(cache.get('missing'), (False, None))
+
+    def test_road_graph_keeps_crs(self):
+        """
+        Test that a cached graph keeps an explicit CRS instead of falling back to its UTM zone.
+        """
+        graph = nx.MultiDiGraph()
+        graph.add_node(1, x=85.31, y=27.71)
+        graph.add_node(2, x=85.32, y=27.71)
+        graph.add_edge(1, 2, length=980.0)
+
+        cache = ResultCache(self.cache_dir)
+        self.assertTrue(cache.put('graph', RoadGraph.from_networkx(graph).with_crs("EPSG:3857")))
+        self.assertTrue(cache.put('default', RoadGraph.from_networkx(graph)))
+        self.assertEqual(cache.get('graph')[1].crs, "EPSG:3857")
+        self.assertEqual(cache.get('default')[1].crs, "EPSG:32645")
+
+    @patch('geoprocessing_pipeline.steps.load_data_by_type')
+    def test_pipeline_reuses_unchanged_steps(self, mock_load_data_by_type):
+        """
+        Test that a second run reads unchanged steps from the cache and recomputes only what changed.
+        """
+        mock_load_data_by_type.return_value = [
+            {"id": 1, "coordinates": [85.318, 27.712], "height": 15},
+            {"id": 2, "coordinates": [85.325, 27.717], "height": 25},
+        ]
+
+        def config(threshold):
+            return {"functions": [
+                {"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"},
+                {"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+                    "filterType": "byComplexQuery",
+                    "filterCriteria": {"attribute": "height", "operator": ">", "value": threshold}}},
+                 "output": "tallPoints"},
+            ]}
+
+        cache = ResultCache(self.cache_dir)
+        first = compile_pipeline(config(20)).run(cache=cache)
+        second = compile_pipeline(config(20)).run(cache=cache)
+        self.assertEqual(second["tallPoints"], first["tallPoints"])
+        self.assertEqual(mock_load_data_by_type.call_count, 1)
+        self.assertEqual(cache.stats["points"], {'hits': 1, 'misses': 1})
+        self.assertEqual(cache.stats["tallPoints"], {'hits': 1, 'misses': 1})
+
+        # Only the downstream threshold changed: the load is still a hit
+        third = compile_pipeline(config(10)).run(cache=cache)
+        self.assertEqual(len(third["tallPoints"]), 2)
+        self.assertEqual(mock_load_data_by_type.call_count, 1)
+        self.assertEqual(cache.stats["tallPoints"], {'hits': 1, 'misses': 2})
+
+    def test_deferred_input_loaded_only_on_miss(self):
+        """
+        Test that an input keyed by its source file is not loaded when every step reading it hits the cache.
+        """
+        path = os.path.join(self.cache_dir, 'points.source')
+        with open(path, 'w') as f:
+            f.write("v1")
+        loads = []
+
+        def load():
+            loads.append(path)
+            return [{"id": 1, "coordinates": [85.318, 27.712], "height": 15}]
+
+        config = {"functions": [{"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+            "filterType": "byComplexQuery", "filterCriteria": {"attribute": "height", "operator": ">", "value": 10}}},
+            "output": "tallPoints"}]}
+        cache = ResultCache(self.cache_dir)
+        for expected_loads in (1, 1):
+            points = DeferredInput(source_cache_key(['points'], [path]), load)
+            results = compile_pipeline(config, inputs=["points"]).run({"points": points}, cache=cache)
+            self.assertEqual([p["id"] for p in results["tallPoints"]], [1])
+            self.assertEqual(len(loads), expected_loads)
+        self.assertNotIn("points", results)
+
+        # A changed source file changes the key, so the reader misses and the input is loaded
+        with open(path, 'w') as f:
+            f.write("v2!")
+        points = DeferredInput(source_cache_key(['points'], [path]), load)
+        results = compile_pipeline(config, inputs=["points"]).run({"points": points}, cache=cache)
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(results["points"][0]["id"], 1)
+
+    def test_source_file_changes_invalidate(self):
+        """
+        Test that a step reading a file is recomputed when the file changes.
+        """
+        path = os.path.join(self.cache_dir, 'points.csv')
+        with open(path, 'w') as f:
+            f.write("id,lon,lat\n1,85.31,27.71\n")
+        plan = compile_pipeline({"functions": [
+            {"functionName": "loadData", "input": {"parameters": {"path": path}}, "output": "points"}
+        ]})
+        cache = ResultCache(os.path.join(self.cache_dir, 'cache'))
+        plan.run(cache=cache)
+        plan.run(cache=cache)
+
+        with open(path, 'a') as f:
+            f.write("2,85.32,27.72\n")
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        results = plan.run(cache=cache)
+        self.assertEqual(len(results["points"]), 2)
+        self.assertEqual(cache.stats["points"], {'hits': 1, 'misses': 2})
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entries are removed once the size cap is exceeded.
+        """
+        cache = ResultCache(self.cache_dir, max_bytes=2500)
+        payload = b'x' * 1000
+        cache.put('a', payload)
+        cache.put('b', payload)
+        os.utime(os.path.join(self.cache_dir, 'a'), (1, 1))
+        os.utime(os.path.join(self.cache_dir, 'b'), (2, 2))
+        cache.get('a')  # Refresh 'a', so 'b' is now the oldest
+        cache.put('c', payload)
+
+        self.assertTrue(cache.get('a')[0])
+        self.assertFalse(cache.get('b')[0])
+        self.assertTrue(cache.get('c')[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+import networkx as nx
+from pyproj import Geod
+from shapely.geometry import Point
+from geoprocessing_pipeline.crs import utm_crs, local_crs, transformer, project, unproject, transform_geometry, degree_bounds
+from geoprocessing_pipeline.data_loader import graph_with_crs
+from geoprocessing_pipeline.isochrone import euclidean_distance, snap_points
+from geoprocessing_pipeline.road_graph import RoadGraph
+
+class TestCrs(unittest.TestCase):
+
+    def test_utm_zone_selection(self):
+        """
+        Test that the local UTM zone follows longitude and hemisphere.
+        """
+        self.assertEqual(utm_crs(85.318, 27.712), "EPSG:32645")
+        self.assertEqual(utm_crs(-58.38, -34.6), "EPSG:32721")
+        self.assertEqual(utm_crs(180.0, 0.0), "EPSG:32660")
+        self.assertEqual(local_crs([85.2, 85.4], [27.6, 27.8]), "EPSG:32645")
+        self.assertIsNone(local_crs([], []))
+
+    def test_bulk_transform(self):
+        """
+        Test that coordinate arrays round-trip through a cached transformer.
+        """
+        self.assertIs(transformer("EPSG:4326", "EPSG:32645"), transformer("EPSG:4326", "EPSG:32645"))
+        xs, ys = np.array([85.3, 85.31, 85.32]), np.array([27.7, 27.71, 27.72])
+        px, py = project(xs, ys, "EPSG:32645")
+        self.assertTrue((px > 100000).all() and (py > 3000000).all())
+        np.testing.assert_allclose(unproject(px, py, "EPSG:32645"), (xs, ys))
+
+        circle = transform_geometry(Point(px[0], py[0]).buffer(100), "EPSG:4326", source="EPSG:32645")
+        self.assertTrue(circle.contains(Point(85.3, 27.7)))
+        self.assertAlmostEqual(euclidean_distance((85.318, 27.712), (85.318, 27.722)), 1108, delta=5)
+
+    def test_degree_bounds_cover_radius(self):
+        """
+        Test that the lon/lat box around a coordinate holds every point at the given distance.
+        """
+        geod = Geod(ellps="WGS84")
+        for lon, lat in ((85.318, 27.712), (25.0, 65.0)):
+            minx, miny, maxx, maxy = degree_bounds([lon], [lat], 1000, utm_crs(lon, lat))
+            azimuths = np.arange(0, 360, 15)
+            ring_x, ring_y, _ = geod.fwd(np.full(len(azimuths), lon), np.full(len(azimuths), lat), azimuths, np.full(len(azimuths), 1000.0))
+            self.assertTrue(((ring_x >= minx[0]) & (ring_x <= maxx[0]) & (ring_y >= miny[0]) & (ring_y <= maxy[0])).all())
+
+    def test_snapping_in_metres(self):
+        """
+        Test that snapping picks the nearest node in metres, which at high latitude is not the nearest in degrees.
+        """
+        graph = nx.Graph()
+        graph.add_node('east', x=25.0015, y=65.0)   # About 70 m away
+        graph.add_node('north', x=25.0, y=65.001)   # About 111 m away, but nearer in degrees
+        graph.add_edge('east', 'north', length=150)
+
+        node_ids, distances = snap_points(graph, [25.0], [65.0])
+        self.assertEqual(node_ids[0], 'east')
+        self.assertAlmostEqual(distances[0], 70, delta=3)
+
+        projected = graph_with_crs(graph, "EPSG:3067")
+        self.assertIsInstance(projected, RoadGraph)
+        self.assertEqual(projected.crs, "EPSG:3067")
+        self.assertEqual(snap_points(projected, [25.0], [65.0])[0][0], 'east')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import unittest
 import os
+import json
+import tempfile
+import numpy as np
+import networkx as nx
 from unittest.mock import patch, MagicMock
-from geoprocessing_pipeline.data_loader import load_or_download_graph, load_data_by_type
+from geoprocessing_pipeline.data_loader import load_or_download_graph, load_road_graph, load_data_by_type, graph_cache_dir, load_data_from_file, ChunkedData
 
 class TestDataLoader(unittest.TestCase):
 
@@ -97,6 +101,106 @@ class TestDataLoader(unittest.TestCase):
         
         self.assertTrue("Unknown data type: roads" in str(context.exception))
 
+    @patch('osmnx.load_graphml')
+    def test_load_road_graph_binary_cache(self, mock_load_graphml):
+        """
+        Test that the binary cache is written on first load and used (memory-mapped) afterwards.
+        """
+        graph = nx.MultiDiGraph()
+        graph.add_node(1, x=85.318, y=27.712)
+        graph.add_node(2, x=85.325, y=27.717)
+        graph.add_edge(1, 2, length=500)
+        mock_load_graphml.return_value = graph
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "graph.graphml")
+            with open(filepath, 'w') as f:
+                f.write("<graphml/>")
+
+            first = load_road_graph("Kathmandu, Nepal", filepath)
+            self.assertTrue(os.path.isdir(graph_cache_dir(filepath)))
+            self.assertEqual(mock_load_graphml.call_count, 1)
+
+            # Same file: served from the cache without parsing GraphML
+            second = load_road_graph("Kathmandu, Nepal", filepath)
+            self.assertEqual(mock_load_graphml.call_count, 1)
+            self.assertIsInstance(second.x, np.memmap)
+            np.testing.assert_array_equal(first.targets, second.targets)
+
+            # Touched but unchanged: the content hash still matches
+            os.utime(filepath, ns=(0, 0))
+            load_road_graph("Kathmandu, Nepal", filepath)
+            self.assertEqual(mock_load_graphml.call_count, 1)
+
+            # Changed content: the cache is rebuilt
+            with open(filepath, 'w') as f:
+                f.write("<graphml></graphml>")
+            load_road_graph("Kathmandu, Nepal", filepath)
+            self.assertEqual(mock_load_graphml.call_count, 2)
+
+    def test_load_data_from_file_formats(self):
+        """
+        Test reading the same points from CSV, newline-delimited GeoJSON and GeoJSON.
+        """
+        points = [{"id": i, "height": 10 * i, "coordinates": [85.30 + 0.01 * i, 27.70]} for i in range(5)]
+        features = [
+            {"type": "Feature", "properties": {"id": p["id"], "height": p["height"]},
+             "geometry": {"type": "Point", "coordinates": p["coordinates"]}}
+            for p in points
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = {ext: os.path.join(tmp_dir, f"points.{ext}") for ext in ("csv", "geojsonl", "geojson")}
+            with open(paths["csv"], 'w') as f:
+                f.write("id,height,lon,lat\n")
+                f.writelines(f"{p['id']},{p['height']},{p['coordinates'][0]},{p['coordinates'][1]}\n" for p in points)
+            with open(paths["geojsonl"], 'w') as f:
+                f.writelines(json.dumps(feature) + "\n" for feature in features)
+            with open(paths["geojson"], 'w') as f:
+                json.dump({"type": "FeatureCollection", "features": features}, f)
+
+            for path in paths.values():
+                self.assertEqual(load_data_from_file(path), points)
+
+    def test_load_data_from_file_streaming_with_bbox(self):
+        """
+        Test chunked reading: batches are lazy, re-iterable and skip records outside the bbox.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "points.csv")
+            with open(path, 'w') as f:
+                f.write("id,lon,lat\n")
+                f.writelines(f"{i},{85.30 + 0.01 * i},27.70\n" for i in range(10))
+
+            stream = load_data_from_file(path, chunk_size=4, bbox=[85.315, 27.6, 85.365, 27.8])
+            self.assertIsInstance(stream, ChunkedData)
+            self.assertEqual([[r["id"] for r in batch] for batch in stream], [[2, 3], [4, 5, 6]])
+            self.assertEqual([r["id"] for r in stream.collect()], [2, 3, 4, 5, 6])
+
+            with self.assertRaises(ValueError):
+                load_data_from_file(path, file_format="xlsx")
+
+    def test_ogr_streaming_reads_file_once(self):
+        """
+        Test that a chunked OGR file is read through once rather than reopened for every batch.
+        """
+        import pyogrio
+
+        features = [
+            {"type": "Feature", "properties": {"id": i}, "geometry": {"type": "Point", "coordinates": [85.30 + 0.01 * i, 27.70]}}
+            for i in range(10)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "points.geojson")
+            with open(path, 'w') as f:
+                json.dump({"type": "FeatureCollection", "features": features}, f)
+
+            with patch('pyogrio.read_dataframe', wraps=pyogrio.read_dataframe) as mock_read, \
+                    patch('pyogrio.open_arrow', wraps=pyogrio.open_arrow) as mock_open:
+                stream = load_data_from_file(path, chunk_size=3, bbox=[85.315, 27.6, 85.385, 27.8])
+                self.assertEqual([[r["id"] for r in batch] for batch in stream], [[2, 3, 4], [5, 6, 7], [8]])
+                self.assertEqual(mock_read.call_count + mock_open.call_count, 1)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,6 +1,7 @@
 import unittest
 from shapely.geometry import Polygon
-from geoprocessing_pipeline.filter import filter_points_by_complex_query, filter_points_within_isochrone
+from geoprocessing_pipeline.filter import filter_points_by_complex_query, filter_points_by_expression, filter_points_within_isochrone, build_attribute_index, spatial_join_points
+from geoprocessing_pipeline.data_loader import ChunkedData
 
 class TestFilter(unittest.TestCase):
 
@@ -104,6 +105,80 @@ class TestFilter(unittest.TestCase):
         # We expect no points to be within this far-away polygon
         self.assertEqual(len(points_within_isochrone), 0)
 
+    def test_filter_points_by_expression(self):
+        """
+        Test compound expressions give the same results with and without the attribute index.
+        """
+        points = self.points + [
+            {"id": 5, "coordinates": [85.340, 27.730], "height": None},
+            {"id": 6, "coordinates": [85.345, 27.735], "kind": "tower"},
+        ]
+        index = build_attribute_index(points)
+        cases = [
+            ({"attribute": "height", "operator": "between", "value": [20, 30]}, [2, 3]),
+            ({"or": [{"attribute": "height", "operator": "<", "value": 20},
+                     {"attribute": "id", "operator": "in", "value": [4, 6]}]}, [1, 4, 6]),
+            ({"and": [{"attribute": "height", "operator": ">=", "value": 25},
+                      {"not": {"attribute": "height", "operator": "==", "value": 30}}]}, [2, 4]),
+            ({"attribute": "height", "operator": "is null"}, [5, 6]),
+            ({"attribute": "height", "operator": "!=", "value": 15}, [2, 3, 4]),
+            ({"attribute": "kind", "operator": "==", "value": "tower"}, [6]),
+            ({"attribute": "height", "operator": "not in", "value": [25, 15, 25]}, [3, 4]),
+            ({"attribute": "id", "operator": "in", "value": [2, 2, 5]}, [2, 5]),
+        ]
+        for expression, expected_ids in cases:
+            for use_index in (False, True):
+                stats = {}
+                result = filter_points_by_expression(points, expression, index=index if use_index else None, stats=stats)
+                self.assertEqual([p["id"] for p in result], expected_ids)
+                self.assertEqual(stats['index_used'], use_index)
+
+    def test_filter_points_by_expression_falls_back_to_scan(self):
+        """
+        Test that comparisons the index cannot answer are scanned, and bad operators are rejected.
+        """
+        index = build_attribute_index(self.points)
+        stats = {}
+        result = filter_points_by_expression(self.points, {"attribute": "height", "operator": "<", "value": "a"}, index=index, stats=stats)
+
+        self.assertEqual(result, [])
+        self.assertFalse(stats['index_used'])
+        with self.assertRaises(ValueError):
+            filter_points_by_expression(self.points, {"attribute": "height", "operator": "~", "value": 1})
+
+    def test_spatial_join_points(self):
+        """
+        Test matching points against several polygons, across chunk boundaries.
+        """
+        far_away_polygon = Polygon([
+            (85.350, 27.740), (85.360, 27.740), (85.360, 27.750), (85.350, 27.750)
+        ])
+        small_polygon = Polygon([
+            (85.320, 27.715), (85.332, 27.715), (85.332, 27.722), (85.320, 27.722)
+        ])
+        polygons = {"all": self.isochrone_polygon, "none": far_away_polygon, "small": small_polygon}
+
+        matches = spatial_join_points(self.points, polygons, chunk_size=3)
+
+        pairs = list(zip(matches['point_id'], matches['polygon_id']))
+        self.assertEqual(pairs, [(1, "all"), (2, "all"), (2, "small"), (3, "all"), (3, "small"), (4, "all")])
+        self.assertEqual(list(matches['point_index']), [0, 1, 1, 2, 2, 3])
+
+    def test_spatial_join_points_stream(self):
+        """
+        Test that a stream of points is joined batch by batch, numbering points across batches.
+        """
+        stream = ChunkedData(lambda: iter([self.points[:3], self.points[3:]]))
+        polygons = {"all": self.isochrone_polygon}
+
+        matches = spatial_join_points(stream, polygons)
+
+        self.assertIsInstance(matches, ChunkedData)
+        batches = list(matches)
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+        self.assertEqual(list(matches.collect()['point_index']), [0, 1, 2, 3])
+        self.assertEqual(list(batches[1]['point_id']), [4])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,80 @@
+import os
+import json
+import unittest
+import numpy as np
+import shapely
+from shapely.geometry import Point, box
+from geoprocessing_pipeline.crs import project, transform_geometry
+from geoprocessing_pipeline.data_loader import ChunkedData
+from geoprocessing_pipeline.geometry_ops import buffer_features, clip_features
+from geoprocessing_pipeline.pipeline import compile_pipeline
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'configs')
+
+class TestGeometryOps(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [
+            {"id": 1, "coordinates": [85.318, 27.712], "height": 15},
+            {"id": 2, "coordinates": [85.3185, 27.712], "height": 25},
+            {"id": 3, "coordinates": [85.340, 27.730], "height": 30},
+        ]
+
+    def test_buffer_in_metres(self):
+        """
+        Test that buffers are measured in metres, keep attributes and follow the segment count.
+        """
+        buffered = buffer_features(self.points, 500, quad_segs=2)
+
+        self.assertEqual(list(buffered['height']), [15, 25, 30])
+        self.assertEqual(list(shapely.get_num_coordinates(buffered.geometry.to_numpy())), [9, 9, 9])
+        metric = transform_geometry(buffered.geometry.iloc[0], "EPSG:32645")
+        centre = Point(*np.ravel(project([85.318], [27.712], "EPSG:32645")))
+        self.assertAlmostEqual(metric.hausdorff_distance(centre), 500, delta=1)
+
+    def test_buffer_dissolve_and_stream(self):
+        """
+        Test that dissolved buffers merge across batches and streams are buffered batch by batch.
+        """
+        stream = ChunkedData(lambda: iter([self.points[:1], self.points[1:]]))
+        dissolved = buffer_features(stream, 100, dissolve=True)
+        self.assertEqual(len(dissolved), 1)
+        self.assertEqual(len(shapely.get_parts(dissolved.geometry.iloc[0])), 2)  # Points 1 and 2 overlap
+
+        batches = list(buffer_features(stream, 100))
+        self.assertEqual([len(batch) for batch in batches], [1, 2])
+        with self.assertRaises(ValueError):
+            buffer_features(self.points, 100, quad_segs=0)
+
+    def test_clip(self):
+        """
+        Test that features inside the mask are kept whole, crossing ones are cut and outside ones dropped.
+        """
+        features = [
+            {"id": "inside", "geometry": box(0.2, 0.2, 0.4, 0.4)},
+            {"id": "outside", "geometry": box(2, 2, 3, 3)},
+            {"id": "crossing", "geometry": box(0.5, 0.5, 1.5, 1.5)},
+            {"id": "point", "coordinates": [0.9, 0.1]},
+        ]
+        stats = {}
+        clipped = clip_features(features, [{"geometry": box(0, 0, 1, 1)}], stats=stats)
+
+        self.assertEqual(list(clipped['id']), ["inside", "crossing", "point"])
+        self.assertTrue(clipped.geometry.iloc[0].equals(box(0.2, 0.2, 0.4, 0.4)))
+        self.assertTrue(clipped.geometry.iloc[1].equals(box(0.5, 0.5, 1, 1)))
+        self.assertEqual(stats, {'features': 4, 'kept': 3, 'cut': 1})
+
+    def test_shipped_configs(self):
+        """
+        Test that the buffer and clip configurations compile and run on the sample data.
+        """
+        for name in ('buffer_points', 'clip'):
+            with open(os.path.join(CONFIG_DIR, f"{name}.json")) as f:
+                results = compile_pipeline(json.load(f)).run()
+            if name == 'buffer_points':
+                self.assertEqual(len(results['bufferedPoints']), len(results['points']))
+            else:
+                self.assertEqual(list(results['clippedBuildings']['id']), [201])
+
+if __name__ == '__main__':
+    unittest.main()
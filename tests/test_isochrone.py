@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
-from geoprocessing_pipeline.isochrone import generate_isochrone
-from shapely.geometry import Polygon
+from geoprocessing_pipeline.isochrone import generate_isochrone, generate_isochrones, generate_isochrone_bands, generate_time_isochrone, find_nearest_node, snap_points, get_node_index, network_accessibility
+from shapely.geometry import Point, Polygon
 import networkx as nx
 
 class TestIsochrone(unittest.TestCase):
@@ -54,6 +54,108 @@ class TestIsochrone(unittest.TestCase):
         # If the graph is empty, we expect the isochrone to be None or an empty Polygon
         self.assertIsNone(isochrone_polygon)
 
+    def test_find_nearest_node(self):
+        """
+        Test snapping a single point to its nearest graph node.
+        """
+        self.assertEqual(find_nearest_node(self.graph, Point(85.326, 27.716)), 2)
+        self.assertIsNone(find_nearest_node(nx.Graph(), Point(85.326, 27.716)))
+
+    def test_snap_points_batch(self):
+        """
+        Test snapping a batch of coordinates in one query and reusing the node index.
+        """
+        node_ids, distances = snap_points(self.graph, [85.318, 85.334, 85.3301], [27.712, 27.724, 27.7201])
+
+        self.assertEqual(list(node_ids), [1, 4, 3])
+        self.assertAlmostEqual(distances[0], 0.0)
+        self.assertTrue((distances >= 0).all())
+
+        # The index is built once per graph and reused
+        self.assertIs(get_node_index(self.graph), get_node_index(self.graph))
+
+    def test_generate_isochrones_batch(self):
+        """
+        Test generating isochrones for several origins, in-process and on a worker pool.
+        """
+        origins = [
+            {"id": "a", "lon": 85.318, "lat": 27.712},
+            {"id": "b", "coordinates": [85.335, 27.725]},
+        ]
+
+        for workers in (1, 2):
+            isochrones = generate_isochrones(self.graph, origins, 500, workers=workers, chunk_size=1)
+
+            self.assertEqual(list(isochrones['origin_id']), ["a", "b"])
+            # Node 1 reaches node 2 and node 4 reaches node 3, so each isochrone is a line between them
+            self.assertTrue(isochrones.geometry.iloc[0].covers(Point(85.325, 27.717)))
+            self.assertTrue(isochrones.geometry.iloc[1].covers(Point(85.330, 27.720)))
+            self.assertFalse(isochrones.geometry.iloc[0].covers(Point(85.330, 27.720)))
+
+    def test_generate_isochrone_bands(self):
+        """
+        Test that bands from one search are nested and match single-distance isochrones.
+        """
+        origin = Point(85.318, 27.712)
+        bands = generate_isochrone_bands(self.graph, origin, [1000, 0, 500])
+
+        self.assertEqual(list(bands['distance']), [0, 500, 1000])
+        for distance, band in zip(bands['distance'], bands.geometry):
+            self.assertTrue(band.equals(generate_isochrone(self.graph, origin, distance)))
+        self.assertTrue(bands.geometry.iloc[2].covers(bands.geometry.iloc[1]))
+
+    def test_generate_time_isochrone(self):
+        """
+        Test a travel-time isochrone using the default speed (30 km/h, so 500 m takes 60 s).
+        """
+        origin = Point(85.318, 27.712)
+        isochrone = generate_time_isochrone(self.graph, origin, 2, unit='minutes')
+
+        self.assertTrue(isochrone.equals(generate_isochrone(self.graph, origin, 1000)))
+        with self.assertRaises(ValueError):
+            generate_time_isochrone(self.graph, origin, 2, unit='days')
+
+    def test_generate_isochrone_edge_buffer(self):
+        """
+        Test the edge-buffer polygon: it follows the reached edges, cuts the last edge part-way
+        and respects the vertex budget.
+        """
+        stats = {}
+        origin = Point(85.318, 27.712)
+        isochrone = generate_isochrone(self.graph, origin, 750, method='edge_buffer', buffer=20, max_vertices=40, stats=stats)
+
+        self.assertTrue(isochrone.contains(Point(85.325, 27.717)))        # Node 2, 500 m away
+        self.assertTrue(isochrone.contains(Point(85.3275, 27.7185)))      # Half way along edge 2-3
+        self.assertFalse(isochrone.contains(Point(85.330, 27.720)))       # Node 3, 1000 m away
+        self.assertLessEqual(stats['vertices'], 40)
+        self.assertEqual(stats['edges'], 3)
+        self.assertGreaterEqual(stats['seconds'], 0)
+
+        # Much tighter than the convex hull would be around a diagonal road
+        self.assertLess(isochrone.area, isochrone.envelope.area / 2)
+
+    def test_network_accessibility(self):
+        """
+        Test that each point gets the network distance to its nearest facility, within the limit.
+        """
+        points = [
+            {"id": 1, "coordinates": [85.3181, 27.7121]},
+            {"id": 2, "coordinates": [85.330, 27.720]},
+            {"id": 3, "coordinates": [85.335, 27.725]},
+            {"id": 4},
+        ]
+        facilities = [{"id": "school", "lon": 85.318, "lat": 27.712}, {"id": "clinic", "coordinates": [85.335, 27.725]}]
+
+        annotated = network_accessibility(self.graph, points, facilities)
+        self.assertEqual([p['nearest_facility'] for p in annotated], ["school", "clinic", "clinic", None])
+        self.assertEqual([p['network_distance'] for p in annotated], [0.0, 500.0, 0.0, None])
+        self.assertEqual(annotated[0]['id'], 1)
+
+        limited = network_accessibility(self.graph, points, facilities, max_distance=2, weight='travel_time')
+        self.assertEqual([p['nearest_facility'] for p in limited], ["school", None, "clinic", None])
+        with self.assertRaises(ValueError):
+            network_accessibility(self.graph, points, facilities, weight='hops')
+
 if __name__ == '__main__':
     unittest.main()
 
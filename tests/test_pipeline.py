@@ -1,7 +1,9 @@
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 from shapely.geometry import Polygon
-from geoprocessing_pipeline.pipeline import run_geoprocessing_pipeline
+from geoprocessing_pipeline.pipeline import run_geoprocessing_pipeline, build_step_graph, compile_pipeline
+from geoprocessing_pipeline.steps import compile_step
 
 class TestPipeline(unittest.TestCase):
 
@@ -105,6 +107,125 @@ class TestPipeline(unittest.TestCase):
         self.assertEqual(results["filteredPointsByHeight"], filtered_points)
         self.assertEqual(results["pointsWithinIsochrone"], points_within_isochrone)
 
+    def test_build_step_graph_validation(self):
+        """
+        Test that missing, duplicate and cyclic references are rejected before anything runs.
+        """
+        load = compile_step({"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"})
+
+        def filter_step(data, output):
+            return compile_step({"functionName": "filterPoints", "input": {"data": data, "parameters": {
+                "filterType": "byExpression", "expression": {"attribute": "height", "operator": ">", "value": 20}}},
+                "output": output})
+
+        self.assertEqual(build_step_graph([filter_step("points", "filtered"), load]), [[1], []])
+
+        with self.assertRaises(ValueError) as context:
+            build_step_graph([filter_step("points", "filtered")])
+        self.assertIn("undefined outputs: points", str(context.exception))
+        self.assertEqual(build_step_graph([filter_step("points", "filtered")], external_inputs=["points"]), [[]])
+
+        with self.assertRaises(ValueError):
+            build_step_graph([load, load])
+
+        with self.assertRaises(ValueError) as context:
+            build_step_graph([load, filter_step("b", "a"), filter_step("a", "b")])
+        self.assertIn("cycle", str(context.exception))
+
+    def test_compile_rejects_unknown_steps(self):
+        """
+        Test that unknown steps and incomplete configurations fail at compile time.
+        """
+        with self.assertRaises(ValueError) as context:
+            compile_pipeline({"functions": [{"functionName": "createSomething", "input": {}, "output": "x"}]})
+        self.assertIn("Unknown pipeline step: createSomething", str(context.exception))
+
+        with self.assertRaises(ValueError) as context:
+            compile_pipeline({"functions": [{"functionName": "filterPoints", "input": {"data": "points", "parameters": {}}, "output": "x"}]},
+                             inputs=["points"])
+        self.assertIn("filterType", str(context.exception))
+
+    def test_compiled_plan_reruns_over_new_inputs(self):
+        """
+        Test that one compiled plan can be run repeatedly over different external inputs.
+        """
+        plan = compile_pipeline({"functions": [{
+            "functionName": "filterPoints",
+            "input": {"data": "points", "parameters": {"filterType": "byExpression",
+                      "expression": {"attribute": "height", "operator": ">", "value": 20}}},
+            "output": "tall",
+        }]}, inputs=["points"])
+
+        for heights in ([10, 25], [30, 40, 5]):
+            points = [{"id": i, "coordinates": [85.32, 27.71], "height": h} for i, h in enumerate(heights)]
+            results = plan.run({"points": points})
+            self.assertEqual([p["height"] for p in results["tall"]], [h for h in heights if h > 20])
+
+        with self.assertRaises(ValueError):
+            plan.run()
+
+    def test_release_drops_dead_outputs(self):
+        """
+        Test that intermediate outputs are dropped after their last reader unless listed as results.
+        """
+        expression = {"attribute": "height", "operator": ">", "value": 20}
+        json_input = {"functions": [
+            {"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"},
+            {"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+                "filterType": "byExpression", "expression": expression}}, "output": "tall"},
+            {"functionName": "filterPoints", "input": {"data": "tall", "parameters": {
+                "filterType": "byExpression", "expression": {"attribute": "height", "operator": "<", "value": 40}}},
+             "output": "medium"},
+        ]}
+
+        plan = compile_pipeline(json_input)
+        self.assertEqual(plan.results, ("medium",))
+        self.assertEqual(set(plan.run()), {"points", "tall", "medium"})
+
+        for workers in (1, 2):
+            stats = {}
+            results = plan.run(workers=workers, release=True, stats=stats)
+            self.assertEqual(list(results), ["medium"])
+            self.assertEqual(stats["released"], ["points", "tall"])
+            self.assertGreater(stats["peak_rss_bytes"], 0)
+            self.assertEqual(set(stats["step_peak_rss_bytes"]), {"points", "tall", "medium"})
+
+        kept = compile_pipeline(dict(json_input, results=["tall", "medium"])).run(release=True)
+        self.assertEqual(set(kept), {"tall", "medium"})
+
+        with self.assertRaises(ValueError):
+            compile_pipeline(dict(json_input, results=["nothing"]))
+
+    @patch('geoprocessing_pipeline.steps.load_data_by_type')
+    def test_independent_steps_run_concurrently(self, mock_load_data_by_type):
+        """
+        Test that independent branches overlap when more than one worker is available.
+        """
+        def slow_load(data_type):
+            time.sleep(0.3)
+            return [{"id": data_type, "height": 25}]
+        mock_load_data_by_type.side_effect = slow_load
+
+        json_input = {"functions": [
+            {"functionName": "loadData", "input": {"parameters": {"dataType": name}}, "output": name}
+            for name in ("points", "buildings", "roads")
+        ] + [{
+            "functionName": "filterPoints",
+            "input": {"data": "roads", "parameters": {"filterType": "byComplexQuery",
+                      "filterCriteria": {"attribute": "height", "operator": ">", "value": 20}}},
+            "output": "tallRoads",
+        }]}
+
+        finished = []
+        start = time.perf_counter()
+        results = run_geoprocessing_pipeline(json_input, workers=3, progress=lambda step: finished.append(step.output))
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(results["tallRoads"], [{"id": "roads", "height": 25}])
+        self.assertEqual(finished[-1], "tallRoads")
+        self.assertEqual(len(finished), 4)
+
 if __name__ == '__main__':
     unittest.main()
 
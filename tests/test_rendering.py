@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from shapely.geometry import Point
+from geoprocessing_pipeline.synthetic import point_cloud
+from geoprocessing_pipeline.data_loader import ChunkedData
+from geoprocessing_pipeline.rendering import (render_results_map, aggregate_points, layer_data, PointGrids,
+                                              MARKER_LIMIT, CLUSTER_LIMIT, AGGREGATE_ZOOMS, zoom_cell_size)
+
+class TestRendering(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.temp_dir, 'map.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_aggregate_points(self):
+        """
+        Test that points are counted per grid cell, positioned at their mean.
+        """
+        xs = np.array([0.1, 0.2, 0.3, 1.5, -0.5])
+        ys = np.array([0.1, 0.4, 0.2, 0.5, 0.5])
+        cx, cy, counts = aggregate_points(xs, ys, 1.0)
+        cells = sorted(zip(np.round(cx, 6), np.round(cy, 6), counts))
+        self.assertEqual(cells, [(-0.5, 0.5, 1), (0.2, 0.233333, 3), (1.5, 0.5, 1)])
+
+    def test_isochrone_polygon_is_drawn(self):
+        """
+        Test that polygon results are drawn, and graphs and other values are skipped.
+        """
+        isochrone = Point(85.318, 27.712).buffer(0.01)
+        points = [{"id": 1, "coordinates": [85.318, 27.712], "height": 15}]
+        layers = render_results_map({'isochroneOutput': isochrone, 'points': points, 'count': 3}, self.map_path)
+        self.assertEqual(layers, {'isochroneOutput': 'features', 'points': 'features'})
+        with open(self.map_path) as f:
+            html = f.read()
+        self.assertIn('"Polygon"', html)
+        self.assertIsNone(layer_data(None))
+
+    def test_rendering_scales_with_point_count(self):
+        """
+        Test that large point layers switch to clustering and then aggregation, so the page
+        stops growing with the number of points.
+        """
+        sizes = {}
+        for n, expected in ((MARKER_LIMIT, 'features'), (CLUSTER_LIMIT, 'cluster'),
+                            (CLUSTER_LIMIT * 2, 'aggregate'), (CLUSTER_LIMIT * 10, 'aggregate')):
+            layers = render_results_map({'points': point_cloud(n, seed=1)}, self.map_path)
+            self.assertEqual(layers['points'], expected)
+            sizes[n] = os.path.getsize(self.map_path)
+        self.assertLess(sizes[CLUSTER_LIMIT * 10], sizes[CLUSTER_LIMIT * 2] * 2)
+        self.assertLess(sizes[CLUSTER_LIMIT * 10], sizes[CLUSTER_LIMIT])
+
+    def test_streams_are_drawn_batch_by_batch(self):
+        """
+        Test that a point stream gets the rendering its total size calls for, with grids built
+        batch by batch matching grids of all the points at once.
+        """
+        for n, expected in ((MARKER_LIMIT, 'features'), (CLUSTER_LIMIT, 'cluster'), (CLUSTER_LIMIT * 2, 'aggregate')):
+            points = point_cloud(n, seed=1)
+            stream = ChunkedData(lambda points=points: (points[i:i + 3000] for i in range(0, len(points), 3000)))
+            self.assertEqual(render_results_map({'points': stream}, self.map_path), {'points': expected})
+
+        xs, ys = np.array([p['coordinates'][0] for p in points]), np.array([p['coordinates'][1] for p in points])
+        grids = PointGrids()
+        for i in range(0, len(xs), 3000):
+            grids.add(xs[i:i + 3000], ys[i:i + 3000])
+        zoom, cx, cy, counts = grids.levels()[0]
+        self.assertEqual(zoom, AGGREGATE_ZOOMS[0])
+        whole = aggregate_points(xs, ys, zoom_cell_size(zoom))
+        self.assertEqual(sorted(zip(np.round(cx, 9), counts)), sorted(zip(np.round(whole[0], 9), whole[2])))
+
+if __name__ == '__main__':
+    unittest.main()
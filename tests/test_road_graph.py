@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+import networkx as nx
+from geoprocessing_pipeline.road_graph import RoadGraph, as_road_graph, edge_speeds_kph, HIGHWAY_SPEEDS_KPH
+
+class TestRoadGraph(unittest.TestCase):
+
+    def setUp(self):
+        # A small directed network with a shortcut and a one-way street
+        self.graph = nx.MultiDiGraph()
+        for node, (x, y) in {10: (0.0, 0.0), 20: (1.0, 0.0), 30: (2.0, 0.0), 40: (1.0, 1.0)}.items():
+            self.graph.add_node(node, x=x, y=y)
+        self.graph.add_edge(10, 20, length=100)
+        self.graph.add_edge(20, 30, length=100)
+        self.graph.add_edge(10, 30, length=300)
+        self.graph.add_edge(10, 30, length=150)  # Parallel edge, the shorter one wins
+        self.graph.add_edge(30, 40, length=50)
+        self.graph.add_edge(40, 10, length=10)
+
+    def test_csr_layout(self):
+        """
+        Test that the CSR arrays describe the same edges as the source graph.
+        """
+        road_graph = RoadGraph.from_networkx(self.graph)
+
+        self.assertEqual(road_graph.number_of_nodes(), 4)
+        self.assertEqual(road_graph.number_of_edges(), 6)
+        self.assertEqual(list(road_graph.offsets), [0, 3, 4, 5, 6])
+        self.assertFalse(road_graph.weights.flags.writeable)
+
+    def test_bounded_dijkstra_matches_networkx(self):
+        """
+        Test that the bounded search reaches the same nodes, at the same distances, as networkx.
+        """
+        road_graph = as_road_graph(self.graph)
+        self.assertIs(road_graph, as_road_graph(self.graph))
+
+        for cutoff in (0, 100, 180, 250, 1000):
+            indices, distances = road_graph.bounded_dijkstra(0, cutoff)
+            reached = dict(zip(road_graph.node_ids[indices].tolist(), distances.tolist()))
+            expected = nx.single_source_dijkstra_path_length(self.graph, 10, cutoff=cutoff, weight='length')
+            self.assertEqual(reached, expected)
+
+    def test_multi_source_dijkstra(self):
+        """
+        Test that every node gets the distance to, and the index of, its nearest source.
+        """
+        road_graph = as_road_graph(self.graph)
+        distances, nearest = road_graph.multi_source_dijkstra([1, -1, 3])
+
+        # Node 20 (position 1) is source 0 and node 40 (position 3) is source 2
+        np.testing.assert_array_equal(distances, [10.0, 0.0, 100.0, 0.0])
+        np.testing.assert_array_equal(nearest, [2, 0, 0, 2])
+
+        distances, nearest = road_graph.multi_source_dijkstra([1], cutoff=50)
+        self.assertTrue(np.isinf(distances[[0, 2, 3]]).all())
+        np.testing.assert_array_equal(nearest, [-1, 0, -1, -1])
+
+    def test_undirected_graph(self):
+        """
+        Test that undirected edges can be traversed both ways.
+        """
+        graph = nx.Graph()
+        graph.add_node('a', x=0.0, y=0.0)
+        graph.add_node('b', x=1.0, y=0.0)
+        graph.add_edge('a', 'b', length=5)
+
+        indices, distances = RoadGraph.from_networkx(graph).bounded_dijkstra(1, 10)
+        self.assertEqual(sorted(indices.tolist()), [0, 1])
+        np.testing.assert_allclose(sorted(distances), [0, 5])
+
+    def test_edge_speeds(self):
+        """
+        Test speed resolution from maxspeed tags with per-highway fallbacks.
+        """
+        speeds = edge_speeds_kph(
+            ['50', '30 mph', 'none', '', '40;60'],
+            ['primary', 'residential', 'residential', 'motorway', 'unknown'],
+        )
+        np.testing.assert_allclose(speeds, [50, 30 * 1.609344, HIGHWAY_SPEEDS_KPH['residential'], HIGHWAY_SPEEDS_KPH['motorway'], 50])
+
+    def test_travel_time_search(self):
+        """
+        Test that travel times are computed once and drive time-bounded searches.
+        """
+        self.graph.edges[10, 20, 0]['maxspeed'] = '36'   # 100 m at 10 m/s -> 10 s
+        self.graph.edges[20, 30, 0]['highway'] = 'residential'  # 100 m at 30 km/h -> 12 s
+        road_graph = RoadGraph.from_networkx(self.graph)
+
+        self.assertIs(road_graph.travel_times, road_graph.travel_times)
+        indices, seconds = road_graph.bounded_dijkstra(0, 22, weight='travel_time')
+        reached = dict(zip(road_graph.node_ids[indices].tolist(), seconds.tolist()))
+        self.assertEqual(set(reached), {10, 20, 30})
+        self.assertAlmostEqual(reached[20], 10.0)
+        self.assertAlmostEqual(reached[30], 18.0)  # The 150 m parallel edge beats 10 s + 12 s
+
+if __name__ == '__main__':
+    unittest.main()
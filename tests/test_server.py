@@ -0,0 +1,143 @@
+import os
+import json
+import shutil
+import tempfile
+import asyncio
+import threading
+import unittest
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from geoprocessing_pipeline.synthetic import grid_road_graph, CENTRE_LON, CENTRE_LAT
+from geoprocessing_pipeline.server import PipelineServer
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        with open(os.path.join(cls.data_dir, 'points.csv'), 'w') as f:
+            f.write(f"id,lon,lat\n1,{CENTRE_LON},{CENTRE_LAT}\n")
+        cls.server = PipelineServer(graphs={'grid': grid_road_graph(400, seed=1)}, workers=2, data_dirs=[cls.data_dir])
+        cls.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(cls.loop)
+            cls.listener = cls.loop.run_until_complete(cls.server.start('127.0.0.1', 0))
+            started.set()
+            cls.loop.run_forever()
+
+        cls.thread = threading.Thread(target=serve, daemon=True)
+        cls.thread.start()
+        started.wait(10)
+        cls.port = cls.listener.sockets[0].getsockname()[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.listener.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(10)
+        cls.server.close()
+        shutil.rmtree(cls.data_dir)
+
+    def request(self, method, path, body=None, connection=None, content_type='application/json'):
+        connection = connection or http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        connection.request(method, path, body=None if body is None else json.dumps(body),
+                           headers={'Content-Type': content_type})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_isochrone_and_filter(self):
+        """
+        Test that isochrone and filter requests are answered from the preloaded graph.
+        """
+        isochrone = {"graph": "grid", "lon": CENTRE_LON, "lat": CENTRE_LAT, "distance": 500}
+        status, geometry = self.request('POST', '/isochrone', isochrone)
+        self.assertEqual(status, 200)
+        self.assertEqual(geometry['type'], 'Polygon')
+
+        # One keep-alive connection serves several requests
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        points = [{"id": 1, "coordinates": [CENTRE_LON, CENTRE_LAT], "height": 10},
+                  {"id": 2, "coordinates": [CENTRE_LON, CENTRE_LAT], "height": 60},
+                  {"id": 3, "coordinates": [CENTRE_LON + 1, CENTRE_LAT], "height": 70}]
+        status, inside = self.request('POST', '/filter', {"points": points, "isochrone": isochrone}, connection)
+        self.assertEqual((status, [p['id'] for p in inside]), (200, [1, 2]))
+        expression = {"attribute": "height", "operator": ">", "value": 50}
+        status, tall = self.request('POST', '/filter', {"points": points, "isochrone": isochrone, "expression": expression}, connection)
+        self.assertEqual((status, [p['id'] for p in tall]), (200, [2]))
+
+    def test_pipeline(self):
+        """
+        Test that a pipeline configuration runs against the warm graph named by its load step.
+        """
+        config = {"functions": [
+            {"functionName": "loadOsmData", "input": {"data": {"address": "Nowhere", "filepath": "grid"}}, "output": "osmNetwork"},
+            {"functionName": "generateIsochrone", "input": {"data": "osmNetwork", "parameters": {
+                "distance": 500, "coordinates": {"lat": CENTRE_LAT, "lon": CENTRE_LON}}}, "output": "isochroneOutput"},
+        ], "results": ["isochroneOutput"]}
+        for _ in range(2):
+            status, results = self.request('POST', '/pipeline', config)
+            self.assertEqual(status, 200)
+            self.assertEqual(list(results), ["isochroneOutput"])
+            self.assertEqual(results["isochroneOutput"]['type'], 'Polygon')
+        self.assertEqual(self.server.stats()['compiled_plans'], 1)
+
+    def test_untrusted_requests_are_rejected(self):
+        """
+        Test that requests cannot download graphs, read files outside the data directories or be
+        posted as plain text, while preloaded graphs (in any CRS) and allowed files still work.
+        """
+        def pipeline(*functions):
+            return {"functions": list(functions)}
+
+        download = {"functionName": "loadOsmData", "output": "osmNetwork",
+                    "input": {"data": {"address": "Kathmandu, Nepal", "filepath": os.path.join(self.data_dir, 'evil', 'x.graphml')}}}
+        self.assertEqual(self.request('POST', '/pipeline', pipeline(download))[0], 403)
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'evil')))
+
+        outside = {"functionName": "loadData", "output": "points", "input": {"parameters": {"path": "/etc/passwd", "format": "csv"}}}
+        self.assertEqual(self.request('POST', '/pipeline', pipeline(outside))[0], 403)
+        escape = dict(outside, input={"parameters": {"path": os.path.join(self.data_dir, '..', 'passwd'), "format": "csv"}})
+        self.assertEqual(self.request('POST', '/pipeline', pipeline(escape))[0], 403)
+        self.assertEqual(self.request('POST', '/isochrone', {"graph": "grid", "lon": CENTRE_LON, "lat": CENTRE_LAT, "distance": 300},
+                                      content_type='text/plain')[0], 415)
+
+        allowed = {"functionName": "loadData", "output": "points", "input": {"parameters": {"path": os.path.join(self.data_dir, 'points.csv')}}}
+        status, results = self.request('POST', '/pipeline', pipeline(allowed))
+        self.assertEqual((status, [p['id'] for p in results['points']]), (200, [1]))
+        projected = {"functionName": "loadOsmData", "output": "osmNetwork",
+                     "input": {"data": {"address": "Nowhere", "filepath": "grid"}, "parameters": {"crs": "EPSG:3857"}}}
+        status, results = self.request('POST', '/pipeline', pipeline(projected))
+        self.assertEqual((status, results['osmNetwork']['nodes']), (200, 400))
+
+    def test_errors_and_stats(self):
+        """
+        Test that bad requests get 4xx answers and latency percentiles are reported per route.
+        """
+        self.assertEqual(self.request('GET', '/nowhere')[0], 404)
+        self.assertEqual(self.request('GET', '/pipeline')[0], 405)
+        self.assertEqual(self.request('POST', '/isochrone', {"graph": "missing", "lon": 0, "lat": 0, "distance": 1})[0], 404)
+        self.assertEqual(self.request('POST', '/isochrone', {"graph": "grid"})[0], 400)
+        self.assertEqual(self.request('POST', '/pipeline', {"functions": [{"functionName": "noSuchStep", "output": "x"}]})[0], 400)
+
+        # Four keep-alive connections sending five requests each, concurrently
+        def send_five(_):
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            body = {"lon": CENTRE_LON, "lat": CENTRE_LAT, "distance": 300}
+            return [self.request('POST', '/isochrone', body, connection)[0] for _ in range(5)]
+
+        with ThreadPoolExecutor(4) as executor:
+            statuses = [status for batch in executor.map(send_five, range(4)) for status in batch]
+        self.assertEqual(statuses, [200] * 20)
+
+        status, stats = self.request('GET', '/stats')
+        self.assertEqual(status, 200)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['graphs']['grid']['nodes'], 400)
+        latency = stats['latency']['/isochrone']
+        self.assertGreaterEqual(latency['count'], 20)
+        self.assertLessEqual(latency['p50_ms'], latency['p99_ms'])
+
+if __name__ == '__main__':
+    unittest.main()
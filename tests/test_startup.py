@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+from geoprocessing_pipeline.lazy import HEAVY_MODULES, IMPORT_BUDGET_SECONDS
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# A plain attribute filter, which needs none of the heavy modules
+FILTER_CONFIG = {"functions": [
+    {"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"},
+    {"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+        "filterType": "byExpression", "expression": {"attribute": "height", "operator": ">", "value": 20}}},
+     "output": "tallPoints"},
+]}
+
+
+def run_fresh(code):
+    """
+    Run `code` in a new interpreter and return the JSON it prints last, with the heavy modules it imported.
+    """
+    probe = f"import sys, json, time, io, contextlib\n{code}\nprint(json.dumps(dict(result, heavy_modules=[m for m in {HEAVY_MODULES!r} if m in sys.modules])))"
+    completed = subprocess.run([sys.executable, '-c', probe], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_time_budget(self):
+        """
+        Test that importing the pipeline stays within budget and a plain attribute filter
+        runs without importing osmnx, networkx, geopandas, pandas or folium.
+        """
+        code = (
+            "start = time.perf_counter()\n"
+            "from geoprocessing_pipeline.pipeline import run_geoprocessing_pipeline\n"
+            "result = {'import_seconds': time.perf_counter() - start}\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            f"    run_geoprocessing_pipeline({FILTER_CONFIG!r})"
+        )
+        # Best of a few fresh interpreters, so one slow start on a busy machine does not fail the test
+        runs = [run_fresh(code) for _ in range(3)]
+        self.assertLess(min(run['import_seconds'] for run in runs), IMPORT_BUDGET_SECONDS)
+        self.assertEqual(runs[0]['heavy_modules'], [])
+
+    def test_server_import_is_light(self):
+        """
+        Test that importing the server module does not import the heavy dependencies.
+        """
+        self.assertEqual(run_fresh("import geoprocessing_pipeline.server\nresult = {}")['heavy_modules'], [])
+
+    def test_package_exports_load_on_access(self):
+        """
+        Test that package-level names resolve to the functions of their modules.
+        """
+        import geoprocessing_pipeline
+        from geoprocessing_pipeline.isochrone import generate_isochrone
+        self.assertIs(geoprocessing_pipeline.generate_isochrone, generate_isochrone)
+        self.assertIn('run_geoprocessing_pipeline', dir(geoprocessing_pipeline))
+        with self.assertRaises(AttributeError):
+            geoprocessing_pipeline.no_such_function
+
+if __name__ == '__main__':
+    unittest.main()
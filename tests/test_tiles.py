@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import osmnx as ox
+from shapely.geometry import Point
+from geoprocessing_pipeline.synthetic import grid_road_graph, point_cloud, to_networkx, CENTRE_LON, CENTRE_LAT
+from geoprocessing_pipeline.data_loader import load_tiled_graph, tile_store_dir
+from geoprocessing_pipeline.isochrone import generate_isochrone, generate_time_isochrone, generate_isochrones, network_accessibility
+from geoprocessing_pipeline.tiles import TiledGraphStore, build_tile_store, write_tile_store
+
+class TestTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.road_graph = grid_road_graph(2500, seed=3)
+        self.origin = Point(CENTRE_LON, CENTRE_LAT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tile_index(self):
+        """
+        Test that the tiles hold every node and edge once and record their boundary edges.
+        """
+        index = build_tile_store(self.road_graph, self.directory, tile_size=0.005)
+        tiles = index['tiles'].values()
+        self.assertGreater(len(tiles), 4)
+        self.assertEqual(sum(tile['nodes'] for tile in tiles), self.road_graph.number_of_nodes())
+        self.assertEqual(sum(tile['edges'] for tile in tiles), self.road_graph.number_of_edges())
+        self.assertTrue(any(tile['boundary_edges'] > 0 for tile in tiles))
+        self.assertTrue(all(set(tile['neighbours']) <= set(index['tiles']) for tile in tiles))
+
+        store = TiledGraphStore(self.directory)
+        whole = store.load_tiles(sorted(index['tiles']))
+        self.assertEqual(whole.number_of_edges(), self.road_graph.number_of_edges())
+
+    def test_isochrones_match_whole_graph(self):
+        """
+        Test that isochrones on the tile store match the whole graph while loading fewer tiles.
+        """
+        store = write_tile_store(self.road_graph, self.directory, tile_size=0.005)
+        self.assertLess(len(store.tiles_near(self.origin.x, self.origin.y, 500)), len(store.index['tiles']))
+
+        self.assertTrue(generate_isochrone(store, self.origin, 500).equals(generate_isochrone(self.road_graph, self.origin, 500)))
+        self.assertTrue(generate_time_isochrone(store, self.origin, 1).equals(generate_time_isochrone(self.road_graph, self.origin, 1)))
+        origins = [{'lon': CENTRE_LON, 'lat': CENTRE_LAT}, {'lon': CENTRE_LON + 0.01, 'lat': CENTRE_LAT - 0.01}]
+        tiled = generate_isochrones(store, origins, 400)
+        whole = generate_isochrones(self.road_graph, origins, 400)
+        self.assertTrue(all(a.equals(b) for a, b in zip(tiled.geometry, whole.geometry)))
+
+    def test_accessibility_matches_whole_graph(self):
+        """
+        Test that nearest-facility distances on the tile store match the whole graph.
+        """
+        store = write_tile_store(self.road_graph, self.directory, tile_size=0.005)
+        points = point_cloud(2000, self.road_graph, seed=3)
+        facilities = [{'lon': CENTRE_LON, 'lat': CENTRE_LAT}, {'lon': CENTRE_LON + 0.01, 'lat': CENTRE_LAT}]
+
+        tiled = network_accessibility(store, points, facilities, max_distance=600)
+        whole = network_accessibility(self.road_graph, points, facilities, max_distance=600)
+        self.assertEqual(tiled, whole)
+        self.assertEqual({p['nearest_facility'] for p in whole}, {0, 1, None})
+        with self.assertRaises(ValueError):
+            network_accessibility(store, points, facilities)
+
+    def test_load_tiled_graph(self):
+        """
+        Test that the tile store is built from the GraphML file once and reused afterwards.
+        """
+        filepath = os.path.join(self.directory, 'graph.graphml')
+        ox.save_graphml(to_networkx(grid_road_graph(400, seed=3)), filepath)
+        store = load_tiled_graph('Nowhere', filepath, tile_size=0.005)
+        self.assertTrue(os.path.isdir(tile_store_dir(filepath)))
+        self.assertEqual(store.index['nodes'], 400)
+
+        with patch('geoprocessing_pipeline.data_loader.load_road_graph') as load_road_graph:
+            reopened = load_tiled_graph('Nowhere', filepath, tile_size=0.005)
+        load_road_graph.assert_not_called()
+        self.assertEqual(reopened.index['tiles'], store.index['tiles'])
+
+if __name__ == '__main__':
+    unittest.main()
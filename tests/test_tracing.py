@@ -0,0 +1,83 @@
+import json
+import unittest
+import networkx as nx
+from geoprocessing_pipeline.pipeline import compile_pipeline
+from geoprocessing_pipeline.tracing import Tracer, trace_span, current_tracer
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = nx.MultiDiGraph()
+        for i in range(5):
+            self.graph.add_node(i, x=85.31 + i * 0.001, y=27.71 + (i % 2) * 0.001)
+        for i in range(4):
+            self.graph.add_edge(i, i + 1, length=120.0)
+            self.graph.add_edge(i + 1, i, length=120.0)
+        self.json_input = {"functions": [
+            {"functionName": "generateIsochrone", "input": {"data": "osmNetwork", "parameters": {
+                "distance": 300, "coordinates": {"lat": 27.71, "lon": 85.31}}}, "output": "isochroneOutput"},
+            {"functionName": "loadData", "input": {"parameters": {"dataType": "points"}}, "output": "points"},
+            {"functionName": "filterPoints", "input": {"data": "points", "parameters": {
+                "filterType": "byExpression", "expression": {"attribute": "height", "operator": ">", "value": 20}}},
+             "output": "tallPoints"},
+        ]}
+
+    def test_inactive_tracing_is_a_no_op(self):
+        """
+        Test that trace_span records nothing when no tracer is active.
+        """
+        self.assertIsNone(current_tracer())
+        with trace_span('anything', rows_in=3) as span:
+            span.set(rows_out=1)
+        tracer = Tracer()
+        with tracer.activate():
+            self.assertIs(current_tracer(), tracer)
+        self.assertIsNone(current_tracer())
+        self.assertEqual(tracer.spans, [])
+
+    def test_pipeline_steps_and_phases(self):
+        """
+        Test that a traced run records a span per step, with the phases inside it and row counts.
+        """
+        plan = compile_pipeline(self.json_input, inputs=["osmNetwork"])
+        for workers in (1, 2):
+            tracer = Tracer()
+            plan.run({"osmNetwork": self.graph}, workers=workers, tracer=tracer)
+            spans = tracer.to_json()['spans']
+
+            steps = {span['name']: span for span in spans if span['category'] == 'step'}
+            self.assertEqual(set(steps), {"isochroneOutput", "points", "tallPoints"})
+            self.assertEqual((steps["tallPoints"]['rows_in'], steps["tallPoints"]['rows_out']), (4, 3))
+            self.assertEqual(steps["isochroneOutput"]['args']['function'], "generateIsochrone")
+            self.assertGreaterEqual(steps["points"]['wall_seconds'], 0)
+            self.assertGreaterEqual(steps["points"]['cpu_seconds'], 0)
+
+            phases = {span['name'] for span in spans if span['category'] == 'phase'}
+            self.assertTrue({'isochrone.snap', 'isochrone.search', 'isochrone.polygon',
+                             'filter.build_index', 'filter.expression'} <= phases)
+            search = next(span for span in spans if span['name'] == 'isochrone.search')
+            self.assertEqual(search['rows_out'], 3)
+
+            # Phases sit inside their step, on the same thread
+            step = steps["isochroneOutput"]
+            self.assertEqual(search['tid'], step['tid'])
+            self.assertGreaterEqual(search['start_us'], step['start_us'])
+
+    def test_chrome_trace_export(self):
+        """
+        Test that the Chrome trace holds one complete event per span.
+        """
+        tracer = Tracer()
+        compile_pipeline(self.json_input, inputs=["osmNetwork"]).run({"osmNetwork": self.graph}, tracer=tracer)
+        trace = json.loads(json.dumps(tracer.to_chrome_trace()))
+
+        events = trace['traceEvents']
+        self.assertEqual(len(events), len(tracer.spans))
+        self.assertTrue(all(event['ph'] == 'X' and event['dur'] >= 1 for event in events))
+        tall = next(event for event in events if event['name'] == 'tallPoints')
+        self.assertEqual(tall['cat'], 'step')
+        self.assertEqual(tall['args']['rows_out'], 3)
+        self.assertIn("tallPoints:", tracer.summary())
+
+if __name__ == '__main__':
+    unittest.main()
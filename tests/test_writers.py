@@ -0,0 +1,113 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import shapely
+import geopandas as gpd
+from shapely.geometry import Point
+from geoprocessing_pipeline.synthetic import grid_road_graph
+from geoprocessing_pipeline.data_loader import ChunkedData
+from geoprocessing_pipeline.road_graph import RoadGraph
+from geoprocessing_pipeline.writers import write_results, write_vector, default_vector_format
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.points = [{"id": i, "coordinates": [85.3 + i * 0.001, 27.7], "height": i * 10} for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_write_results_and_manifest(self):
+        """
+        Test that each kind of output is written in its format and recorded in the manifest.
+        """
+        graph = grid_road_graph(100, seed=2)
+        isochrone = Point(85.3, 27.7).buffer(0.01)
+        frame = gpd.GeoDataFrame({'distance': [1.0, 2.0]}, geometry=[isochrone, isochrone.buffer(0.01)], crs="EPSG:4326")
+        results = {'osmNetwork': graph, 'isochroneOutput': isochrone, 'bands': frame,
+                   'points': self.points, 'empty': [], 'summary': {'count': 5}}
+        manifest = write_results(results, self.output_dir, workers=3)
+
+        with open(os.path.join(self.output_dir, 'manifest.json')) as f:
+            self.assertEqual(json.load(f)['outputs'], manifest['outputs'])
+        outputs = manifest['outputs']
+        vector_format = default_vector_format()
+        self.assertEqual({name: entry['format'] for name, entry in outputs.items()}, {
+            'osmNetwork': 'road_graph', 'isochroneOutput': 'wkb', 'bands': vector_format,
+            'points': vector_format, 'empty': 'json', 'summary': 'json'})
+        self.assertEqual((outputs['points']['rows'], outputs['bands']['rows'], outputs['osmNetwork']['rows']),
+                         (5, 2, graph.number_of_edges()))
+        self.assertTrue(all(entry['bytes'] > 0 for entry in outputs.values()))
+
+        loaded = RoadGraph.load(os.path.join(self.output_dir, outputs['osmNetwork']['path']))
+        np.testing.assert_array_equal(loaded.weights, graph.weights)
+        with open(os.path.join(self.output_dir, 'isochroneOutput.wkb'), 'rb') as f:
+            self.assertTrue(shapely.from_wkb(f.read()).equals(isochrone))
+        points_path = os.path.join(self.output_dir, outputs['points']['path'])
+        points = gpd.read_parquet(points_path) if vector_format == 'parquet' else gpd.read_file(points_path)
+        self.assertEqual(list(points['height']), [0, 10, 20, 30, 40])
+        self.assertAlmostEqual(points.geometry.x[4], 85.304)
+
+    def test_streamed_write(self):
+        """
+        Test that a ChunkedData stream is written batch by batch, in chunks, with the columns
+        of the first batch.
+        """
+        batches = [self.points[:3], [], [dict(p, extra=1) for p in self.points[3:]]]
+        stream = ChunkedData(lambda: iter(batches))
+        path = os.path.join(self.output_dir, 'points.fgb')
+        self.assertEqual(write_vector(stream, path, 'flatgeobuf', chunk_size=2), 5)
+        written = gpd.read_file(path)
+        self.assertEqual(list(written['id']), [0, 1, 2, 3, 4])
+        self.assertNotIn('extra', written.columns)
+
+        self.assertEqual(write_vector([], os.path.join(self.output_dir, 'none.fgb'), 'flatgeobuf'), 0)
+        with self.assertRaises(ValueError):
+            write_vector(self.points, path, 'shapefile')
+
+    def test_failed_flatgeobuf_write_is_removed(self):
+        """
+        Test that a stream failing after its first batch leaves no truncated FlatGeobuf behind.
+        """
+        def batches():
+            yield self.points[:3]
+            raise OSError("source went away")
+
+        path = os.path.join(self.output_dir, 'points.fgb')
+        with self.assertRaisesRegex(OSError, "source went away"):
+            write_vector(ChunkedData(batches), path, 'flatgeobuf')
+        self.assertFalse(os.path.exists(path))
+
+    @unittest.skipIf(default_vector_format() != 'parquet', "pyarrow is not installed")
+    def test_geoparquet_chunk_types(self):
+        """
+        Test that later chunks are cast to the first chunk's types, and that a chunk that cannot
+        be cast names its column and leaves no file behind.
+        """
+        batches = [
+            [{"id": 0, "height": 10, "name": None, "coordinates": [85.3, 27.7]}],
+            [{"id": 1, "height": None, "name": "b", "coordinates": [85.31, 27.7]},
+             {"id": 2, "height": 30, "name": "c", "coordinates": [85.32, 27.7]}],
+        ]
+        path = os.path.join(self.output_dir, 'points.parquet')
+        self.assertEqual(write_vector(ChunkedData(lambda: iter(batches)), path, 'parquet'), 3)
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path)
+        self.assertEqual((str(schema.field('height').type), str(schema.field('name').type)), ('int64', 'string'))
+        written = gpd.read_parquet(path)
+        self.assertEqual(written['height'].tolist()[::2], [10, 30])
+        self.assertEqual(written['name'].tolist()[1:], ['b', 'c'])
+        self.assertEqual(written.crs, "EPSG:4326")
+        self.assertAlmostEqual(written.geometry.x[2], 85.32)
+
+        batches[1][1]['height'] = 30.5
+        with self.assertRaisesRegex(ValueError, "'height'"):
+            write_vector(ChunkedData(lambda: iter(batches)), path, 'parquet')
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()